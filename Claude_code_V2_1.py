@@ -6,10 +6,13 @@ Czech DOCX Anonymizer – v6.1
 Výstupy: <basename>_anon.docx / _map.json / _map.txt
 """
 
-import sys, re, json, unicodedata
+import sys, re, json, bisect, operator, itertools, unicodedata
 from typing import Optional, Set
 from pathlib import Path
 from collections import defaultdict, OrderedDict
+from collections.abc import Mapping
+from functools import lru_cache
+from html import escape as html_escape, unescape as html_unescape
 from docx import Document
 
 # =============== Utility ===============
@@ -20,6 +23,7 @@ def clean_invisibles(text: str) -> str:
     text = text.replace('\u00a0', ' ')
     return re.sub('['+re.escape(INVISIBLE)+']', '', text)
 
+@lru_cache(maxsize=1 << 16)
 def normalize_for_matching(text: str) -> str:
     if not text: return ""
     n = unicodedata.normalize('NFD', text)
@@ -66,6 +70,81 @@ def set_text(p, s: str):
     run_elem.append(text_elem)
     p._element.append(run_elem)
 
+def save_docx_incremental(doc, input_path: str, output_path: str, changed_parts=None):
+    """
+    Zapíše DOCX bez přebalení celého balíčku: nezměněné členy ZIPu se zkopírují
+    ze vstupu bajt po bajtu (bez dekomprese a rekomprese, typicky obrázky a přílohy)
+    a znovu se serializují jen změněné části (výchozí: word/document.xml).
+    Pro ZIP64 a nestandardní archivy vyhodí ValueError - volající pak použije doc.save().
+    """
+    import zipfile, zlib, struct
+    parts = changed_parts if changed_parts is not None else [doc.part]
+    blobs = {str(part.partname).lstrip('/'): part.blob for part in parts}
+
+    def dos_datetime(dt):
+        y, mo, d, h, mi, sec = dt
+        return (h << 11) | (mi << 5) | (sec // 2), ((y - 1980) << 9) | (mo << 5) | d
+
+    central = []
+    with zipfile.ZipFile(input_path) as zin, open(input_path, 'rb') as src, open(output_path, 'wb') as out:
+        infos = zin.infolist()
+        if len({i.filename for i in infos}) != len(infos):
+            raise ValueError('duplicitní členy ZIPu')
+        for info in infos:
+            if max(info.header_offset, info.compress_size, info.file_size) >= 0xFFFFFFFF:
+                raise ValueError('ZIP64 není podporován')
+            name = info.filename.encode('utf-8' if info.flag_bits & 0x800 else 'cp437')
+            offset = out.tell()
+            if info.filename in blobs:
+                # Změněná část: nová komprese (deflate), bez datového deskriptoru
+                data = blobs.pop(info.filename)
+                comp = zlib.compressobj(6, zlib.DEFLATED, -15)
+                cdata = comp.compress(data) + comp.flush()
+                flags = info.flag_bits & 0x800
+                crc, csize, usize, method, extra = zlib.crc32(data), len(cdata), len(data), zipfile.ZIP_DEFLATED, b''
+                version = 20
+                t, d = dos_datetime(info.date_time)
+                out.write(struct.pack('<4s2B4HL2L2H', b'PK\x03\x04', version, 0, flags, method, t, d,
+                                      crc, csize, usize, len(name), 0))
+                out.write(name)
+                out.write(cdata)
+            else:
+                # Nezměněná část: surová kopie lokální hlavičky, dat a případného deskriptoru
+                src.seek(info.header_offset)
+                header = src.read(30)
+                if header[:4] != b'PK\x03\x04':
+                    raise ValueError(f'neplatná lokální hlavička: {info.filename}')
+                n, m = struct.unpack('<2H', header[26:30])
+                length = 30 + n + m + info.compress_size
+                if info.flag_bits & 0x08:
+                    src.seek(info.header_offset + length)
+                    length += 16 if src.read(4) == b'PK\x07\x08' else 12
+                src.seek(info.header_offset)
+                remaining = length
+                while remaining:
+                    chunk = src.read(min(remaining, 1 << 20))
+                    if not chunk:
+                        raise ValueError(f'zkrácený člen ZIPu: {info.filename}')
+                    out.write(chunk)
+                    remaining -= len(chunk)
+                flags, method, extra, version = info.flag_bits, info.compress_type, info.extra, info.extract_version
+                crc, csize, usize = info.CRC, info.compress_size, info.file_size
+                t, d = dos_datetime(info.date_time)
+            central.append(struct.pack('<4s4B4HL2L5H2L', b'PK\x01\x02', info.create_version,
+                                       info.create_system, version, 0, flags, method, t, d, crc, csize, usize, len(name), len(extra),
+                                       len(info.comment), 0, info.internal_attr, info.external_attr, offset)
+                           + name + extra + info.comment)
+        if blobs:
+            raise ValueError(f'změněné části chybí ve vstupním ZIPu: {sorted(blobs)}')
+        cd_offset = out.tell()
+        for entry in central:
+            out.write(entry)
+        cd_size = out.tell() - cd_offset
+        if cd_offset + cd_size >= 0xFFFFFFFF or len(central) >= 0xFFFF:
+            raise ValueError('ZIP64 není podporován')
+        out.write(struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, len(central), len(central),
+                              cd_size, cd_offset, 0))
+
 def preserve_case(surface: str, tag: str) -> str:
     if surface.isupper(): return tag.upper()
     if surface.istitle(): return tag
@@ -78,17 +157,17 @@ def load_names_library(json_path: str = "cz_names.v1.json") -> Set[str]:
         json_file = script_dir / json_path
 
         if not json_file.exists():
-            print(f"⚠️  VAROVÁNÍ: {json_path} nenalezen v {script_dir}")
-            print(f"⚠️  Kontroluji aktuální složku: {Path.cwd()}")
+            print(f"⚠️  VAROVÁNÍ: {json_path} nenalezen v {script_dir}", file=sys.stderr)
+            print(f"⚠️  Kontroluji aktuální složku: {Path.cwd()}", file=sys.stderr)
             # Zkus také aktuální složku
             json_file_cwd = Path.cwd() / json_path
             if json_file_cwd.exists():
                 json_file = json_file_cwd
-                print(f"✓ Nalezen v aktuální složce")
+                print(f"✓ Nalezen v aktuální složce", file=sys.stderr)
             else:
-                print(f"❌ Soubor {json_path} nebyl nalezen!")
-                print(f"   Zkopíruj ho do stejné složky jako skript nebo do aktuální složky.")
-                print(f"   Používám prázdnou knihovnu - detekce jmen bude omezená!")
+                print(f"❌ Soubor {json_path} nebyl nalezen!", file=sys.stderr)
+                print(f"   Zkopíruj ho do stejné složky jako skript nebo do aktuální složky.", file=sys.stderr)
+                print(f"   Používám prázdnou knihovnu - detekce jmen bude omezená!", file=sys.stderr)
                 return set()
 
         with open(json_file, 'r', encoding='utf-8') as f:
@@ -109,11 +188,11 @@ def load_names_library(json_path: str = "cz_names.v1.json") -> Set[str]:
             names.update(data['firstnames_no_diac'].get('M', []))
             names.update(data['firstnames_no_diac'].get('F', []))
 
-        print(f"✓ Načteno {len(names)} jmen z knihovny")
+        print(f"✓ Načteno {len(names)} jmen z knihovny", file=sys.stderr)
         return names
 
     except Exception as e:
-        print(f"⚠️  Chyba při načítání: {e}")
+        print(f"⚠️  Chyba při načítání: {e}", file=sys.stderr)
         return set()
 
 CZECH_FIRST_NAMES = load_names_library()
@@ -185,6 +264,9 @@ for word in SURNAME_BLACKLIST:
         _blacklist_no_diacritics.add(normalized)
 SURNAME_BLACKLIST.update(_blacklist_no_diacritics)
 
+# KRITICKÁ OPRAVA: "SYNERGIE" není BIC, je to název projektu
+BIC_BLACKLIST = {'synergie', 'project', 'projekt', 'alliance', 'aliance'}
+
 ROLE_STOP = {
     'pronajímatel','nájemce','dlužník','věřitel','objednatel','zhotovitel',
     'zaměstnanec','zaměstnavatel','ručitel','spoludlužník','jednatel','svědek',
@@ -522,14 +604,18 @@ def infer_surname_nominative(observed: str) -> str:
     return obs
 
 # =============== Varianty pro nahrazování ===============
-def variants_for_first(first: str) -> set:
+def _ascii_fold(v: str) -> str:
+    return unicodedata.normalize('NFKD', v).encode('ascii', 'ignore').decode('ascii')
+
+@lru_cache(maxsize=None)
+def variants_for_first(first: str) -> frozenset:
     """
     Generuje všechny pádové varianty křestního jména včetně:
     - Nominativ, Genitiv, Dativ, Akuzativ, Vokativ, Lokál, Instrumentál
     - Přivlastňovací přídavná jména (Petrův, Janin, atd.)
     """
     f = first.strip()
-    if not f: return {''}
+    if not f: return frozenset({''})
     V = {f, f.lower(), f.capitalize()}
     low = f.lower()
 
@@ -609,182 +695,285 @@ def variants_for_first(first: str) -> set:
         if not low.endswith(('i', 'í')):
             V |= {f+'ovi', f+'e'}  # "o Petrovi", "u Petra"
 
-    # Přidání verzí bez diakritiky
-    V |= {unicodedata.normalize('NFKD', v).encode('ascii','ignore').decode('ascii') for v in list(V)}
-
-    return V
-
-def variants_for_surname(surname: str) -> set:
+    # Verze bez diakritiky se negenerují - tvary se porovnávají ve stínovém textu (ShadowText)
+    return frozenset(V)
+
+# Deklarativní tabulka paradigmat příjmení.
+# Každý řádek: (zakončení nominativu, min. délka, [(kolik znaků odříznout, koncovka), ...])
+# Vyhodnocuje se shora dolů, použije se první řádek, jehož zakončení sedí.
+_OV_ENDINGS = ['ův', 'ova', 'ovo', 'ovu', 'ovou', 'ově']
+SURNAME_PARADIGMS = [
+    # Ženská příjmení typu -ová: Nováková, Novákové, Novákovou; mn. č. Novákových, Novákovým, Novákové
+    (('ová',), 0, [(1, 'é'), (1, 'ou'), (1, 'á'), (3, 'ových'), (3, 'ovým'), (3, 'ové')]),
+    # Přídavná jména -ský/-cký
+    (('ský', 'cký'), 0, [(2, e) for e in ('ý', 'ého', 'ému', 'ým', 'ém', 'á', 'é', 'ou', 'ých', 'ými')]),
+    # Obecná přídavná jména na -ý (Novotný, Novotného, Novotná, ...)
+    (('ý',), 0, [(1, e) for e in ('ý', 'ého', 'ému', 'ým', 'ém', 'á', 'é', 'ou', 'ých', 'ými')]),
+    # Ženská příjmení na -á (ne -ová): Malá, Malé, Malou
+    (('á',), 0, [(1, 'é'), (1, 'ou'), (1, 'á')]),
+    # -ek (Dvořáček, Hájek): Dvořáčka, Dvořáčkovi, ..., přivlastňovací, mn. č.
+    (('ek',), 3, [(2, 'k' + e) for e in ('a', 'ovi', 'em', 'u', 'e', 'y', 'ou', *_OV_ENDINGS, 'ů', 'ům')]),
+    # -ec (Němec, Konec): Němce, Němci, Němcem, ..., mn. č., přivlastňovací
+    (('ec',), 3, [(2, 'c' + e) for e in ('e', 'i', 'em', 'u', 'y', 'ů', 'ům', 'ích', 'ech', 'emi', *_OV_ENDINGS)]),
+    # Příjmení na -a (Svoboda): Svobody, Svobodovi, Svobodou, ..., přivlastňovací, mn. č.
+    (('a',), 2, [(1, e) for e in ('y', 'ovi', 'ou', 'u', 'e', 'o', *_OV_ENDINGS, 'ů', 'ům')]),
+    # Obecná mužská příjmení (konsonantní kmeny): Novák, Nováka, Novákovi, ...
+    (('',), 0, [(0, e) for e in ('a', 'ovi', 'e', 'em', 'u', *_OV_ENDINGS,
+                                  *('ov' + x for x in ('a', 'o', 'y', 'ě', 'ým', 'ých', 'ou', 'u', 'e', 'i')),
+                                  'ů', 'ům', 'y', 'ích', 'ech')]),
+]
+
+@lru_cache(maxsize=None)
+def variants_for_surname(surname: str) -> frozenset:
     """
-    Generuje všechny pádové varianty příjmení včetně:
+    Generuje všechny pádové varianty příjmení podle tabulky SURNAME_PARADIGMS:
     - Všechny pády jednotného i množného čísla
     - Přivlastňovací přídavná jména (Novákův, Novákova)
     - Speciální případy pro -ová, -ský, -ek, -ec, atd.
+    Bez ASCII kopií: "Novakova" najde stínový text (viz ShadowText).
+    Výsledek je memoizovaný pro celý proces (jedno vyhodnocení na příjmení).
     """
     s = surname.strip()
-    if not s: return {''}
+    if not s: return frozenset({''})
     out = {s, s.lower(), s.capitalize()}
     low = s.lower()
+    for suffixes, min_len, forms in SURNAME_PARADIGMS:
+        if low.endswith(suffixes) and len(s) >= min_len:
+            out |= {(s[:-cut] if cut else s) + ending for cut, ending in forms}
+            break
+    return frozenset(out)
 
-    # ========== Příjmení typu -ová (ženská) ==========
-    if low.endswith('ová'):
-        base = s[:-1]  # Novákov
-        out |= {
-            s,              # Nováková (nom)
-            base+'é',       # Novákové (gen/dat/lok)
-            base+'ou',      # Novákovou (instr)
-            base+'á',       # alternativa (nom)
-        }
-        # Množné číslo
-        base_stem = s[:-3]  # Novák
-        out |= {
-            base_stem+'ových',  # u Novákových (gen pl)
-            base_stem+'ovým',   # Novákovým (dat/instr pl)
-            base_stem+'ové',    # Novákové (nom pl)
-        }
-        return out
+@lru_cache(maxsize=None)
+def lowered(variants: frozenset) -> frozenset:
+    return frozenset(v.lower() for v in variants)
 
-    # ========== Příjmení typu -ský/-cký (přídavná jména) ==========
-    if low.endswith(('ský','cký')):
-        stem = s[:-2]  # Novot
-        out |= {
-            stem+'ý',       # Novotný (nom m)
-            stem+'ého',     # Novotného (gen/akuz)
-            stem+'ému',     # Novotnému (dat)
-            stem+'ým',      # Novotným (instr)
-            stem+'ém',      # Novotném (lok)
-            stem+'á',       # Novotná (nom f)
-            stem+'é',       # Novotné (gen/dat/lok f)
-            stem+'ou',      # Novotnou (instr f)
-            stem+'ých',     # Novotných (gen pl)
-            stem+'ými',     # Novotnými (instr pl)
-            stem+'ým',      # Novotným (dat pl)
-        }
-        return out
+@lru_cache(maxsize=None)
+def longest_first(variants: frozenset) -> tuple:
+    """Varianty seřazené od nejdelší (Longest-Match-Wins), shody délek abecedně - deterministicky."""
+    return tuple(sorted(variants, key=lambda v: (-len(v), v)))
 
-    # ========== Obecná přídavná jména končící na -ý ==========
-    if low.endswith('ý'):
-        stem = s[:-1]
-        out |= {
-            stem+'ý', stem+'ého', stem+'ému', stem+'ým', stem+'ém',
-            stem+'á', stem+'é', stem+'ou',
-            stem+'ých', stem+'ými'
-        }
-        return out
+def _alternation(variants) -> str:
+    return '|'.join(re.escape(v) for v in longest_first(variants) if v)
 
-    # ========== Ženská příjmení na -á (ne -ová) ==========
-    if low.endswith('á') and not low.endswith('ová'):
-        stem = s[:-1]
-        out |= {s, stem+'é', stem+'ou', stem+'á'}
-        return out
+# =============== Stínový text (bez diakritiky a velikosti písmen) ===============
+class _FoldTable(dict):
+    """Tabulka pro str.translate: znak → malé písmeno bez diakritiky (doplňuje se líně)."""
+    def __missing__(self, code):
+        folded = ''.join(c for c in unicodedata.normalize('NFKD', chr(code).lower())
+                         if not unicodedata.combining(c))
+        self[code] = folded
+        return folded
 
-    # ========== Příjmení typu -ek (Dvořáček, Hájek) ==========
-    if low.endswith('ek') and len(s) >= 3:
-        stem_k = s[:-2] + 'k'
-        out |= {
-            s,              # Dvořáček (nom)
-            stem_k+'a',     # Dvořáčka (gen)
-            stem_k+'ovi',   # Dvořáčkovi (dat)
-            stem_k+'em',    # Dvořáčkem (instr)
-            stem_k+'u',     # Dvořáčku (vok/akuz)
-            stem_k+'e',     # Dvořáčku (lok)
-            stem_k+'y',     # alt
-            stem_k+'ou',    # alt
-        }
-        # Přivlastňovací
-        out |= {
-            stem_k+'ův', stem_k+'ova', stem_k+'ovo',
-            stem_k+'ovu', stem_k+'ovou', stem_k+'ově'
-        }
-        # Množné číslo
-        out |= {
-            stem_k+'ů',     # u Dvořáčků (gen pl)
-            stem_k+'ům',    # Dvořáčkům (dat pl)
-            stem_k+'y',     # Dvořáčky (akuz pl)
-        }
-        return out
+SHADOW_FOLD = _FoldTable()
 
-    # ========== Příjmení typu -ec (Němec, Konec) ==========
-    if low.endswith('ec') and len(s) >= 3:
-        stem_c = s[:-2] + 'c'
-        out |= {
-            s,              # Němec (nom)
-            stem_c+'e',     # Němce (gen/akuz)
-            stem_c+'i',     # Němci (dat/lok)
-            stem_c+'em',    # Němcem (instr)
-            stem_c+'u',     # alt
-            stem_c+'y',     # alt
-        }
-        # Množné číslo
-        out |= {
-            stem_c+'ů',     # Němců (gen pl)
-            stem_c+'ům',    # Němcům (dat pl)
-            stem_c+'ích',   # Němcích (lok pl)
-            stem_c+'ech',   # Němcech (alt lok pl)
-            stem_c+'emi',   # Němcemi (instr pl)
-        }
-        # Přivlastňovací
-        out |= {
-            stem_c+'ův', stem_c+'ova', stem_c+'ovo',
-            stem_c+'ovu', stem_c+'ovou', stem_c+'ově'
-        }
-        return out
+def shadow_fold(text: str) -> str:
+    """Stínový tvar: malá písmena bez diakritiky ("Nováková" → "novakova")."""
+    return text.lower() if text.isascii() else text.translate(SHADOW_FOLD)
 
-    # ========== Příjmení na -a (mužská i ženská) ==========
-    if low.endswith('a') and len(s) >= 2 and not low.endswith('ová'):
-        stem = s[:-1]
-        out |= {
-            s,              # Svoboda (nom)
-            stem+'y',       # Svobody (gen)
-            stem+'ovi',     # Svobodovi (dat m)
-            stem+'ou',      # Svobodou (instr)
-            stem+'u',       # Svobodu (akuz)
-            stem+'e',       # Svobodě (lok)
-            stem+'o',       # vok
-        }
-        # Přivlastňovací
-        out |= {
-            stem+'ův', stem+'ova', stem+'ovo',
-            stem+'ovu', stem+'ovou', stem+'ově'
-        }
-        # Množné číslo
-        out |= {
-            stem+'ů',       # u Svobodů (gen pl)
-            stem+'ům',      # Svobodům (dat pl)
-            stem+'y',       # Svobody (akuz pl)
-        }
-        return out
+class _ShadowMatch:
+    """Shoda ve stínovém textu promítnutá zpět do originálu (rozhraní jako re.Match pro callbacky)."""
+    __slots__ = ('string', '_start', '_end')
 
-    # ========== Obecná mužská příjmení (konsonantní kmeny) ==========
-    # Novák, Dvořák, Malý, atd.
-    out |= {
-        s+'a',          # Nováka (gen)
-        s+'ovi',        # Novákovi (dat)
-        s+'e',          # Nováku (lok/vok)
-        s+'em',         # Novákem (instr)
-        s+'u',          # Nováku (alt)
-    }
-    # Přivlastňovací přídavná jména
-    out |= {
-        s+'ův', s+'ova', s+'ovo',
-        s+'ovu', s+'ovou', s+'ově'
-    }
-    out |= {
-        s+'ov'+suf for suf in ['a','o','y','ě','ým','ých','ou','u','e','i']
-    }
-    # Množné číslo
-    out |= {
-        s+'ů',          # u Nováků (gen pl)
-        s+'ům',         # Novákům (dat pl)
-        s+'y',          # Nováky (akuz pl)
-        s+'ích',        # Novácích (lok pl)
-        s+'ech',        # alt lok
-    }
-
-    # Přidání verzí bez diakritiky
-    out |= {unicodedata.normalize('NFKD', v).encode('ascii','ignore').decode('ascii') for v in list(out)}
-
-    return out
+    def __init__(self, string: str, start: int, end: int):
+        self.string, self._start, self._end = string, start, end
+
+    def group(self, n=0):
+        return self.string[self._start:self._end]
+
+    def start(self):
+        return self._start
+
+    def end(self):
+        return self._end
+
+    def span(self):
+        return self._start, self._end
+
+class ShadowText:
+    """
+    Text odstavce a jeho stínový tvar (shadow_fold) spočítaný jednou. Tvary jmen se hledají
+    ve stínu jedním vzorem na tvar místo dvojice "s diakritikou / bez" a bez IGNORECASE;
+    shody se promítnou zpět na skutečné úseky originálu. Pro běžný text (každý znak
+    → jeden znak) je mapování pozic identita, jinak ho drží offsets.
+    Stín sám o sobě splývá víc, než je v češtině správné ("Sokolová" × přivlastňovací
+    "Sokolova"), proto sub() s `variants` přijme jen úsek, který je přesně tvarem
+    z variant, nebo je napsaný celý bez diakritiky (viz matches_variant).
+    """
+    __slots__ = ('text', 'folded', 'offsets')
+
+    def __init__(self, text: str):
+        self.text = text
+        self.folded = shadow_fold(text)
+        self.offsets = None
+        if not text.isascii() and (len(self.folded) != len(text)
+                                   or any(len(SHADOW_FOLD[ord(c)]) != 1 for c in set(text))):
+            from array import array
+            offsets = array('q')
+            for i, ch in enumerate(text):
+                offsets.extend([i] * len(SHADOW_FOLD[ord(ch)]))
+            offsets.append(len(text))
+            self.offsets = offsets
+
+    def span(self, s: int, e: int):
+        if self.offsets is None:
+            return s, e
+        return self.offsets[s], self.offsets[e]
+
+    def sub(self, rx: re.Pattern, repl, variants=()) -> str:
+        """
+        Jako rx.sub(repl, text), ale rx se hledá ve stínu; repl dostává shodu v originálu.
+        variants: množina tvarů pro každou skupinu rx (bez skupin pro celou shodu).
+        """
+        text, out, last = self.text, [], 0
+        groups = range(1, len(variants) + 1) if rx.groups else (0,)
+        for m in rx.finditer(self.folded):
+            if variants and not all(matches_variant(text[slice(*self.span(*m.span(g)))], v)
+                                    for g, v in zip(groups, variants)):
+                continue
+            s, e = self.span(*m.span())
+            out.append(text[last:s])
+            out.append(repl(_ShadowMatch(text, s, e)))
+            last = e
+        if not out:
+            return text
+        out.append(text[last:])
+        new = ''.join(out)
+        return text if new == text else new
+
+@lru_cache(maxsize=None)
+def shadow_variants(variants: frozenset) -> tuple:
+    """Stínové tvary variant od nejdelšího (tvary lišící se jen diakritikou/velikostí splynou)."""
+    return longest_first(frozenset(shadow_fold(v) for v in variants if v))
+
+def matches_variant(token: str, variants: frozenset, ambiguous=None) -> bool:
+    """
+    Token je tvarem z variants: přesně (bez ohledu na velikost), nebo je celý bez diakritiky.
+    Tvar bez diakritiky, který je v množině ambiguous (patří víc osobám nebo je i
+    přivlastňovacím tvarem - "prochazkova" = Procházková i Procházkova), se nepřiřadí.
+    """
+    low = token.lower()
+    if low in lowered(variants):
+        return True
+    folded = shadow_fold(token)
+    return (folded == low and folded in shadow_variants(variants)
+            and (ambiguous is None or folded not in ambiguous))
+
+@lru_cache(maxsize=None)
+def shadow_word_regex(form: str) -> re.Pattern:
+    """Stínový tvar jako samostatné slovo (hledá se v ShadowText.folded)."""
+    return re.compile(r'(?<!\w)' + re.escape(form) + r'(?!\w)')
+
+@lru_cache(maxsize=None)
+def word_regex_ci(word: str) -> re.Pattern:
+    """Slovo bez ohledu na velikost písmen (přivlastňovací tvary, slova křestního jména)."""
+    return re.compile(r'(?<!\w)' + re.escape(word) + r'(?!\w)', re.IGNORECASE)
+
+@lru_cache(maxsize=None)
+def person_pair_regex(first: str, last: str) -> re.Pattern:
+    """
+    Jeden regex pro celé jméno: libovolná varianta křestního jména + mezera
+    + libovolná varianta příjmení (bez materializace všech dvojic).
+    Hledá se ve stínovém textu (ShadowText), tvary jsou stínové; skupiny 1 a 2
+    = křestní jméno a příjmení pro kontrolu přesného tvaru.
+    """
+    return re.compile(
+        r'(?<!\w)(' + _alternation(shadow_variants(variants_for_first(first))) + r')\s+'
+        r'(' + _alternation(shadow_variants(variants_for_surname(last))) + r')(?!\w)'
+    )
+
+@lru_cache(maxsize=None)
+def possessive_forms(first: str, last: str) -> frozenset:
+    """Přivlastňovací přídavná jména (Novákův, Janin, Petřin)."""
+    return first_possessives(first) | surname_possessives(last)
+
+@lru_cache(maxsize=None)
+def first_possessives(first: str) -> frozenset:
+    """Přivlastňovací tvary křestního jména (Janův, Janin, Petřin)."""
+    if first.lower().endswith('a'):
+        stem = first[:-1]
+        poss = {stem+s for s in ['in','ina','iny','iné','inu','inou','iným','iných']}
+        if stem.endswith('tr'):
+            poss |= {stem[:-1]+'ř'+s for s in ['in','ina','iny','iné','inu','inou','iným','iných']}
+        return frozenset(poss)
+    return frozenset({first+'ův'} | {first+'ov'+s for s in ['a','o','y','ě','ým','ých']})
+
+@lru_cache(maxsize=None)
+def surname_possessives(last: str) -> frozenset:
+    """Přivlastňovací tvary příjmení (Novákův); přechýlené příjmení na -ová žádné nemá."""
+    if last.lower().endswith('ová'):
+        return frozenset()
+    return frozenset({last+'ův'} | {last+'ov'+s for s in ['a','o','y','ě','ým','ých']})
+
+# =============== Pre-screening odstavců ===============
+# Příznaky odstavce (klíčové slovo nebo znak); detektor pak běží jen tam, kde vůbec
+# může matchnout (každý příznak je nutnou podmínkou shody daného regexu).
+# Počítá se nad množinou znaků a jedním lower() textu - ne regexem po znacích, který
+# u řádků logu plných číslic vracel shodu pro každý znak
+PRESCREEN_KEYWORDS = (
+    ('kw_bytem', ('bytem',)), ('kw_ico', ('ičo',)), ('kw_dic', ('dič',)),
+    ('kw_birthplace', ('naroz', 'rodišt')), ('kw_emp_id', ('osobn', 'zaměstnaneck')),
+    ('kw_month', ('ledna', 'února', 'března', 'dubna', 'května', 'června', 'července', 'srpna',
+                  'září', 'října', 'listopadu', 'prosince')),
+)
+PRESCREEN_CHARS = (
+    ('ascii_upper', frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZ')), ('upper', frozenset('ÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ')),
+    ('at', frozenset('@')), ('slash', frozenset('/')), ('comma', frozenset(',')),
+    ('quote', frozenset('"')), ('paren', frozenset('(')), ('dot', frozenset('.')),
+)
+# Krátký regex jako příznak, jen když má odstavec nutné znaky (číslo domu před čárkou
+# potřebují všechny tři adresní regexy - jsou nejdražší a řádky logů mají číslice i čárky)
+PRESCREEN_PATTERNS = (
+    ('house_number', ('digit', 'comma'), re.compile(r'\s\d{1,4}(?:/\d{1,4})?,')),
+)
+PRESCREEN_ALL = frozenset([name for name, _ in PRESCREEN_KEYWORDS + PRESCREEN_CHARS]
+                          + [name for name, _, _ in PRESCREEN_PATTERNS] + ['digit'])
+WORD_RE = re.compile(r'\w+')
+
+def prescreen_features(text: str) -> frozenset:
+    chars = set(text)
+    features = {name for name, members in PRESCREEN_CHARS if not members.isdisjoint(chars)}
+    if any(ch.isdecimal() for ch in chars):  # \d = Unicode Nd
+        features.add('digit')
+    if 'ascii_upper' in features:
+        features.add('upper')
+    low = text.lower()
+    features.update(name for name, words in PRESCREEN_KEYWORDS if any(w in low for w in words))
+    features.update(name for name, needs, rx in PRESCREEN_PATTERNS
+                    if features.issuperset(needs) and rx.search(text))
+    return frozenset(features)
+
+def word_prefixes(text: str) -> frozenset:
+    """Trojznakové (stínové - bez diakritiky, lowercase) prefixy všech slov odstavce."""
+    return frozenset(w[:3] for w in WORD_RE.findall(shadow_fold(text)))
+
+@lru_cache(maxsize=None)
+def form_words(variants: frozenset) -> Optional[frozenset]:
+    """První slova stínových tvarů; None, když některý tvar nezačíná písmenem."""
+    words = set()
+    for form in shadow_variants(variants):
+        m = WORD_RE.match(form)
+        if not m:
+            return None
+        words.add(m.group(0))
+    return frozenset(words)
+
+def person_words(first: str, last: str) -> Optional[tuple]:
+    """
+    Stínová slova, z nichž musí začínat každá shoda FÁZÍ 1-3.7 pro tuto osobu (všechny
+    regexy jsou ohraničené (?<!\w) i (?!\w), takže první slovo tvaru je v odstavci celé).
+    None = nelze rozhodnout (tvar nezačíná písmenem), osoba se nepřeskakuje.
+    Vrací n-tici množin zvlášť pro jméno a příjmení (form_words, sdílené všemi osobami
+    stejného jména) - sjednocení pro každou osobu by s miliony osob zabíralo gigabajty.
+    """
+    parts = (form_words(variants_for_first(first)), form_words(variants_for_surname(last)),
+             form_words(first_possessives(first)), form_words(surname_possessives(last)),
+             form_words(frozenset(first.split())))
+    return None if None in parts else parts
+
+def person_prefixes(first: str, last: str) -> Optional[frozenset]:
+    """Trojznakové prefixy person_words (klíče indexu osob, jako word_prefixes odstavce)."""
+    parts = person_words(first, last)
+    return None if parts is None else frozenset(w[:3] for words in parts for w in words)
 
 # =============== Regexy ===============
 # Vylepšený ADDRESS_RE - zachytává čistou adresu (Ulice číslo, PSČ Město)
@@ -875,6 +1064,11 @@ DATE_WORDS_RE = re.compile(
     r'\b(\d{1,2})\.\s+(ledna|února|března|dubna|května|června|července|srpna|září|října|listopadu|prosince)\s+(\d{4})\b',
     re.IGNORECASE | re.UNICODE
 )
+MONTH_MAP = {
+    'ledna': '01', 'února': '02', 'března': '03', 'dubna': '04',
+    'května': '05', 'června': '06', 'července': '07', 'srpna': '08',
+    'září': '09', 'října': '10', 'listopadu': '11', 'prosince': '12'
+}
 
 # LICENSE_PLATE_RE - detekuje české poznávací značky (SPZ/RZ)
 # Formáty: "7AB 4567" (číslice + 2 písmena + mezera + 4 číslice)
@@ -896,9 +1090,13 @@ BIRTHPLACE_RE = re.compile(
     re.IGNORECASE | re.UNICODE
 )
 
+# Libovolný vydaný tag ([[PERSON_3]], [[BIRTH_ID_1]], přejmenovaný [[UŽIVATEL_1]], ...)
+TAG_RE     = re.compile(r'\[\[[A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ_]+_\d+\]\]')
 STATUTE_RE = re.compile(r'\b(Sb\.?|zákon(a|u)?|zákon\s*č\.)\b', re.IGNORECASE)
 PAIR_RE    = re.compile(r'(?<!\w)([A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ][a-záčďéěíňóřšťúůýž]{1,})\s+([A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ][a-záčďéěíňóřšťúůýž]{1,})(?!\w)')
 TITLES_RE  = re.compile(r'\b(Mgr|Ing|Dr|Ph\.?D|RNDr|MUDr|JUDr|PhDr|PaedDr|ThDr|RCDr|MVDr|DiS|Bc|BcA|MBA|LL\.?M|prof|doc|pan|paní|pán|slečna)\.?\s+', re.IGNORECASE)
+# Tituly za jménem na konci buňky ("Jan Novák, Ph.D.", "Eva Malá, DiS., MBA")
+TITLE_SUFFIX_RE = re.compile(r'(?:\s*,?\s*\b(?:Ph\.?\s?D|Th\.?D|Art\.?D|CSc|DrSc|DiS|MBA|MSc|LL\.?M)\.?)+\s*$', re.IGNORECASE)
 
 # IČO a DIČ
 ICO_RE     = re.compile(r'\bIČO\s*:?\s*(\d{8})\b', re.IGNORECASE)
@@ -967,30 +1165,1591 @@ def looks_like_firstname(token: str) -> bool:
         norm.endswith('a') and len(norm) > 3,
     ])
 
+# =============== Kontrolní součty identifikátorů ===============
+# Levné deterministické kontroly (O(1)) před kontextovými regexy: platný kontrolní
+# součet rozhodne sám, kontext (CTX_BANK, CTX_BIRTH, CTX_OP) se čte jen u zbytku.
+# Neplatný součet kandidáta nevyřazuje - vzorové i skutečné dokumenty obsahují
+# překlepy a smyšlená čísla, která jsou pořád osobním údajem. RČ a IČO se tagují
+# podle tvaru a návěští; possible_birth_id jen odliší účet ve tvaru RČ, valid_ico typ sloupce.
+ACCOUNT_PREFIX_WEIGHTS = (10, 5, 8, 4, 2, 1)
+ACCOUNT_BASE_WEIGHTS = (6, 3, 7, 9, 10, 5, 8, 4, 2, 1)
+ICO_WEIGHTS = (8, 7, 6, 5, 4, 3, 2)
+IBAN_DIGITS = str.maketrans({ch: str(ord(ch) - 55) for ch in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'})  # A=10 … Z=35
+# Délky IBAN běžných zemí (ostatní země jen mod 97)
+IBAN_LENGTHS = {'CZ': 24, 'SK': 24, 'DE': 22, 'AT': 20, 'PL': 28, 'HU': 28, 'GB': 22, 'FR': 27, 'IT': 27, 'NL': 18}
+
+def possible_birth_id(value: str) -> bool:
+    """
+    RČ s možným datem (měsíc +50 ženy, +20/+70 od 2004; devítimístné jen do roku 1953).
+    Dělitelnost 11 se nevyžaduje - RČ s překlepem je pořád RČ.
+    """
+    digits = ''.join(ch for ch in value if ch.isdigit())
+    if len(digits) not in (9, 10):
+        return False
+    month, day = int(digits[2:4]), int(digits[4:6])
+    if not (1 <= month % 50 <= 12 or 21 <= month % 50 <= 32) or not 1 <= day <= 31:
+        return False
+    return len(digits) == 10 or int(digits[:2]) < 54
+
+def valid_iban(value: str) -> bool:
+    """IBAN: mod 97 po přesunu země a kontrolních číslic na konec (ISO 13616)."""
+    value = value.replace(' ', '').upper()
+    if len(value) < 15 or not value.isalnum() or IBAN_LENGTHS.get(value[:2], len(value)) != len(value):
+        return False
+    return int((value[4:] + value[:4]).translate(IBAN_DIGITS)) % 97 == 1
+
+def _weighted_mod11(digits: str, weights) -> bool:
+    # Chybějící úvodní nuly nic nepřičtou - váhy se berou zprava
+    if len(digits) > len(weights):
+        return False
+    return sum(map(operator.mul, weights[len(weights) - len(digits):], map(int, digits))) % 11 == 0
+
+def valid_cz_account(value: str) -> bool:
+    """Číslo účtu [předčíslí-]základ/kód banky: vážený součet mod 11 zvlášť pro předčíslí a základ."""
+    number, _, bank = value.partition('/')
+    prefix, _, base = number.rpartition('-')
+    if len(bank) != 4 or not bank.isdigit() or not base.isdigit() or int(base) == 0:
+        return False
+    if prefix and not (prefix.isdigit() and _weighted_mod11(prefix, ACCOUNT_PREFIX_WEIGHTS)):
+        return False
+    # Krátký základ projde náhodou příliš často (1:11) - za důkaz se bere až od 6 číslic
+    return len(base.lstrip('0')) >= 6 and _weighted_mod11(base, ACCOUNT_BASE_WEIGHTS)
+
+def valid_ico(value: str) -> bool:
+    """IČO: 8 číslic, váhy 8..2, kontrolní číslice (11 - součet mod 11) mod 10."""
+    if len(value) != 8 or not value.isdigit():
+        return False
+    return (11 - sum(map(operator.mul, ICO_WEIGHTS, map(int, value[:7]))) % 11) % 10 == int(value[7])
+
+# =============== Detekce osob (kandidáti pro index) ===============
+# Nejširší kontextové okno FÁZE 1 (znaky před a za dvojicí jmen)
+PERSON_CONTEXT = 160
+
+SIMPLE_ROLE_RE = re.compile(
+    r'\b(Jednatel|Jednatelka|Zaměstnanec|Zaměstnankyně|Dlužn[íi]k|V[eě]řitel|Prodávající|Kupující)\s*:\s*'
+    r'([A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ\u00C0-\u024F\u1E00-\u1EFF][a-záčďéěíňóřšťúůýž\u00C0-\u024F\u1E00-\u1EFF]{1,20})'  # První jméno
+    r'(?:\s+([A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ\u00C0-\u024F\u1E00-\u1EFF][a-záčďéěíňóřšťúůýž\u00C0-\u024F\u1E00-\u1EFF]{1,20}))?'  # Volitelné prostřední jméno
+    r'\s+([A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ\u00C0-\u024F\u1E00-\u1EFF][a-záčďéěíňóřšťúůýž\u00C0-\u024F\u1E00-\u1EFF]{1,20})'  # Příjmení (poslední slovo)
+    r'(?=\s+(?:Bytem|Bydlišt|Sídlo|E-mail|Tel|Kontakt|$))',  # Zastaví se před klíčovými slovy
+    re.IGNORECASE | re.UNICODE
+)
+
+# Úseky pro detekci osob po částech: velikost jádra a překryv na každé straně (znaky)
+EXTRACT_CHUNK = 1 << 18
+EXTRACT_OVERLAP = 2000
+
+# Podřetězce, z nichž aspoň jeden obsahuje každá shoda TITLES_RE (po lower()) - řádek
+# logu bez nich se regexem titulů vůbec neprochází
+TITLE_HINTS = ('mgr', 'ing', 'dr', 'ph', 'dis', 'bc', 'mba', 'll', 'prof', 'doc', 'pan', 'pán', 'sleč')
+
+def title_spans(text: str, lo: int = 0, hi: Optional[int] = None) -> list:
+    """Úseky [(start, end)], které FÁZE 1 vyřadí jako tituly (TITLES_RE); jen shody začínající v [lo, hi)."""
+    low = text.lower()
+    if not any(hint in low for hint in TITLE_HINTS):
+        return []
+    return [m.span() for m in TITLES_RE.finditer(text) if lo <= m.start() and (hi is None or m.start() < hi)]
+
+def strip_titles(text: str, titles: Optional[list] = None):
+    """
+    Text bez titulů (úseky title_spans) a funkce, která pozici v něm převede zpět
+    na pozici v původním textu (znak za vypuštěným titulem patří za titul).
+    """
+    if titles is None:
+        titles = title_spans(text)
+    parts, marks, removed, prev = [], [0], [0], 0
+    for ts, te in titles:
+        parts.append(text[prev:ts])
+        prev = te
+        marks.append(te - removed[-1] - (te - ts))
+        removed.append(removed[-1] + te - ts)
+    parts.append(text[prev:])
+    return ''.join(parts), lambda pos: pos + removed[bisect.bisect_right(marks, pos) - 1]
+
+def person_candidates(text: str, lo: int = 0, hi: Optional[int] = None, titles: Optional[list] = None,
+                      nt_offset: int = 0, context: Optional[str] = None, context_offset: int = 0):
+    """
+    Kandidáti na osoby jako (fáze, pozice, jméno, příjmení) ve stejném pořadí, v jakém
+    je zakládal průchod přes celý dokument (fáze po fázích, v rámci fáze podle pozice).
+    Nezávisí na stavu anonymizéru, takže úseky dokumentu lze zpracovat nezávisle.
+
+    Pro úsek (okno = jádro + překryv): vrací se jen shody začínající v jádru [lo, hi),
+    pozice jsou v souřadnicích okna. titles = úseky titulů v okně (jinak TITLES_RE v okně).
+    FÁZE 1 bere kontext z textu dokumentu na pozicích textu BEZ titulů (tak to vždy
+    dělala), proto dostává výřez `context` začínající na context_offset a posun
+    nt_offset = pozice začátku okna v textu dokumentu bez titulů.
+    """
+    if context is None:
+        context = text
+    # FÁZE 0a: Konservativní detekce jmen po specifických rolích (Jednatel:, Zaměstnanec:, atd.)
+    # Podporuje 2-3 slovná jména (David Müller, Nguyễn Thị Lan)
+    for m in SIMPLE_ROLE_RE.finditer(text):
+        if m.start() < lo or (hi is not None and m.start() >= hi):
+            continue
+        first_part = m.group(2)
+        middle_part = m.group(3)  # může být None
+        surname = m.group(4)
+
+        # Pokud je prostřední jméno, zkombinuj ho s první částí
+        if middle_part:
+            f_nom = f"{first_part} {middle_part}"
+        else:
+            f_nom = first_part
+
+        # Kontrola blacklistu - ale dovolíme "nový/nová" jako příjmení pokud jsou po roli
+        # (Adam Nový, Petra Nová jsou běžná jména i když "nový" je adjektivum)
+        surname_norm = normalize_for_matching(surname)
+        fname_norm = normalize_for_matching(f_nom)
+
+        # Skip common blacklisted words, but allow "novy/nova" as it's also a surname
+        if surname_norm in SURNAME_BLACKLIST and surname_norm not in ('novy', 'nova', 'nove'):
+            continue
+        if fname_norm in SURNAME_BLACKLIST and fname_norm not in ('novy', 'nova', 'nove'):
+            continue
+
+        l_nom = infer_surname_nominative(surname)
+        yield (0, m.start(), f_nom, l_nom)
+
+    # FÁZE 0b: Detekce jmen s přezdívkami (Martin "Marty" Král)
+    for m in NICKNAME_RE.finditer(text):
+        if m.start() < lo or (hi is not None and m.start() >= hi):
+            continue
+        first_name = m.group(1)
+        surname = m.group(3)
+
+        # Kontrola blacklistu
+        if normalize_for_matching(surname) in SURNAME_BLACKLIST:
+            continue
+        if normalize_for_matching(first_name) in SURNAME_BLACKLIST:
+            continue
+
+        f_nom = infer_first_name_nominative(first_name, surname) or first_name
+        l_nom = infer_surname_nominative(surname)
+        yield (1, m.start(), f_nom, l_nom)
+
+    # FÁZE 1: Standardní dvojice (Křestní Příjmení) v textu bez titulů
+    text_no_titles, to_window = strip_titles(text, titles)
+    for m in PAIR_RE.finditer(text_no_titles):
+        s, e = m.span()
+        pos = to_window(s)  # pozice v okně (s tituly)
+        if pos < lo or (hi is not None and pos >= hi):
+            continue
+        f_tok, l_tok = m.group(1), m.group(2)
+
+        if f_tok.lower() in ROLE_STOP or l_tok.lower() in ROLE_STOP:
+            continue
+        if normalize_for_matching(l_tok) in SURNAME_BLACKLIST:
+            continue
+        if normalize_for_matching(f_tok) in SURNAME_BLACKLIST:
+            continue
+
+        # Kontext z textu dokumentu na pozicích bez titulů (viz docstring)
+        cs, ce = s + nt_offset - context_offset, e + nt_offset - context_offset
+        pre = context[max(0, cs-80):max(0, cs)]
+        post = context[max(0, ce):max(0, ce+80)]
+
+        # KRITICKÁ OPRAVA: Organizace a firmy
+        # Pokud je za jménem "a.s.", "s.r.o.", "spol.", atd., je to firma, ne osoba
+        if re.search(r'\s+(a\.s\.|s\.r\.o\.|spol\.|v\.o\.s\.|o\.p\.s\.|o\.s\.|z\.s\.)', post, re.IGNORECASE):
+            continue
+
+        # Pokud je před jménem "Oddělení:", "Instituce:", "Společnost:", je to organizace
+        if re.search(r'\b(Oddělení|Instituce|Společnost|Korporace|Organizace|Firma)\s*:\s*$', pre, re.IGNORECASE):
+            continue
+
+        if re.search(r'\b(výrobce|model|značka|inventář|výrobek|položk)', pre+post, re.IGNORECASE):
+            if (normalize_for_matching(f_tok) in SURNAME_BLACKLIST or
+                normalize_for_matching(l_tok) in SURNAME_BLACKLIST):
+                continue
+
+        f_nom = infer_first_name_nominative(f_tok, l_tok) or f_tok
+        l_nom = infer_surname_nominative(l_tok)
+
+        if normalize_for_matching(f_nom) in CZECH_FIRST_NAMES:
+            yield (2, pos, f_nom, l_nom)
+            continue
+
+        pre = context[max(0, cs-PERSON_CONTEXT):max(0, cs)]
+        post = context[max(0, ce):max(0, ce+PERSON_CONTEXT)]
+        has_ctx = CTX_PERSON.search(pre+post) or CTX_ROLE.search(pre+post) or CTX_LABEL.search(pre+post)
+        if (has_ctx
+            and f_tok[:1].isupper() and l_tok[:1].isupper()
+            and looks_like_firstname(f_tok)
+            and f_tok.lower() not in ROLE_STOP and l_tok.lower() not in ROLE_STOP):
+            yield (2, pos, f_nom, l_nom)
+
+
+# =============== Skórování kandidátů na jméno ===============
+# README 3.3: detekce pod prahem jistoty se ponechá v textu a zapíše do reportu k revizi.
+# Váhy jsou zvolené tak, že přijetí (>= PERSON_ACCEPT) odpovídá dosavadnímu pravidlu
+# "jméno z knihovny, nebo tvar křestního jména + kontext"; poloha v tabulce jen posune
+# kandidáta do pásma revize.
+PERSON_WEIGHTS = {'names_library': 1.0, 'firstname_shape': 0.5, 'table': 0.25, 'context': 0.5}
+PERSON_ACCEPT = 1.0
+PERSON_REVIEW = 0.75
+
+# Pořadí kaskády = od nejlevnějšího příznaku; kontextové regexy (3 hledání v ±160 znacích) až nakonec
+PERSON_CASCADE = ('names_library', 'firstname_shape', 'table', 'context')
+
+# =============== Mapa náhrad (zápis / načtení) ===============
+MAP_SECTIONS = [
+    ("OSOBY", "PERSON"),
+    ("RODNÁ ČÍSLA", "BIRTH_ID"),
+    ("IČO", "ICO"),
+    ("DIČ", "DIC"),
+    ("OSOBNÍ ČÍSLA ZAMĚSTNANCŮ", "EMP_ID"),
+    ("BANKOVNÍ ÚČTY", "BANK"),
+    ("IBAN", "IBAN"),
+    ("BIC/SWIFT", "BIC"),
+    ("TELEFONY", "PHONE"),
+    ("EMAILY", "EMAIL"),
+    ("OBČANSKÉ PRŮKAZY", "ID_CARD"),
+    ("POZNÁVACÍ ZNAČKY (SPZ/RZ)", "LICENSE_PLATE"),
+    ("VIN (VOZIDLA)", "VIN"),
+    ("DATA", "DATE"),
+    ("ADRESY", "ADDRESS"),
+    ("MÍSTA NAROZENÍ", "PLACE"),
+]
+
+MAP_FORMAT = 'anon-map'
+
+_json_str = json.JSONEncoder(ensure_ascii=False).encode
+
+def _json_block(obj) -> str:
+    """json.dumps(indent=2) odsazený o jednu úroveň (hodnota uvnitř objektu nejvyšší úrovně)."""
+    if type(obj) is list and obj and all(type(v) is str for v in obj):
+        # Seznam hodnot tagu: json.dumps s indent jde čistě Pythonem, řetězce kóduje C
+        return '[\n    ' + ',\n    '.join(map(_json_str, obj)) + '\n  ]'
+    return json.dumps(obj, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+
+def _compact_json(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+def map_meta_path(path) -> Path:
+    """Doplňková data k _map.json (první offsety, sloučené identity) leží vedle: <mapa>.meta.json."""
+    path = Path(path)
+    return path.with_name(path.stem + '.meta.json')
+
+def write_json_map(path, entities, meta=None):
+    """
+    Streamovaný zápis _map.json: tagy se berou po kategoriích z indexu úložiště
+    a každý záznam jde rovnou do souboru (bez skládání celé mapy v paměti).
+    Výstup je bajtově shodný s json.dump(sorted(tag_map), indent=2) - mapa obsahuje
+    jen tagy, meta jde do samostatného souboru map_meta_path(path).
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        sep = '{\n  '
+        for cat in entities.categories():
+            for tag, vals in entities.category(cat):
+                f.write(f'{sep}{json.dumps(tag, ensure_ascii=False)}: {_json_block(list(vals))}')
+                sep = ',\n  '
+        f.write('{}' if sep == '{\n  ' else '\n}')
+    meta_path = map_meta_path(path)
+    if meta:
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+    elif meta_path.exists():
+        meta_path.unlink()  # meta z předchozího běhu do stejné mapy by už neplatila
+
+def write_txt_map(path, entities, aliases=None):
+    """Streamovaný zápis lidsky čitelné _map.txt po sekcích (jedna kategorie = jeden průchod jejích tagů)."""
+    aliases = aliases or {}
+    known = {pref for _, pref in MAP_SECTIONS}
+    # Vlastní kategorie (blacklist v plánu běhu) až za standardními sekcemi, pod svým názvem
+    sections = MAP_SECTIONS + [(cat, cat) for cat in entities.categories() if cat not in known]
+    with open(path, 'w', encoding='utf-8') as f:
+        for title, pref in sections:
+            tags = entities.category(pref)
+            if not tags:
+                continue
+            f.write(f"{title}\n{'-'*len(title)}\n")
+            for tag, vals in tags:
+                if pref == "PERSON":
+                    # Pro PERSON: první hodnota je kanonická, zbytek jsou varianty (odsazené),
+                    # mezi nimi sloučené identity (jiný odvozený nominativ téže osoby)
+                    vals = list(vals)
+                    f.write(f"{tag}: {vals[0]}\n")
+                    for alias in aliases.get(tag, []):
+                        f.write(f"  = {alias}\n")
+                    for v in vals[1:]:
+                        f.write(f"  - {v}\n")
+                else:
+                    for v in vals:
+                        f.write(f"{tag}: {v}\n")
+            f.write("\n")
+
+def write_ndjson_map(path, entities, meta=None):
+    """
+    Kompaktní mapa pro rychlé načtení (např. de-anonymizace): první řádek je hlavička
+    {"format", "version", "meta"}, pak jeden řádek ["tag", [hodnoty]] na tag.
+    Cesta končící na .gz se zapíše komprimovaně (gzip).
+    """
+    import gzip
+    opener = gzip.open if str(path).endswith('.gz') else open
+    with opener(path, 'wt', encoding='utf-8') as f:
+        f.write(_compact_json({'format': MAP_FORMAT, 'version': 1, 'meta': meta or {}}) + '\n')
+        for cat in entities.categories():
+            for tag, vals in entities.category(cat):
+                f.write(_compact_json([tag, list(vals)]) + '\n')
+
+def load_map(path):
+    """
+    Načte mapu náhrad (.json, .ndjson nebo .ndjson.gz).
+    Vrací (OrderedDict tag → [hodnoty], meta).
+    """
+    import gzip
+    path = str(path)
+    if path.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f, object_pairs_hook=OrderedDict)
+        meta = data.pop('_meta', {})  # starší mapy měly meta jako klíč mezi tagy
+        meta_path = map_meta_path(path)
+        if meta_path.exists():
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+        return data, meta
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline() or '{}')
+        if header.get('format') != MAP_FORMAT:
+            raise ValueError(f'{path}: není mapa náhrad ({MAP_FORMAT})')
+        data = OrderedDict(json.loads(line) for line in f if line.strip())
+    return data, header.get('meta', {})
+
+# =============== De-anonymizace ===============
+class Deanonymizer:
+    """
+    Obnova originálů podle mapy náhrad: jeden matcher TAG_RE a slovník tag → hodnoty,
+    takže každý odstavec se přepíše jedním průchodem. Výskyt tagu dostane tvar, který
+    měl v originálu (meta 'occurrences': index hodnoty pro každý výskyt v pořadí
+    dokumentu, viz Anonymizer._record_surfaces), bez záznamu kanonickou (první) hodnotu.
+    Tagy, které mapa nezná (např. ručně dopsané při revizi), zůstanou v textu a počítají se ve stats.
+    """
+    def __init__(self, tag_map, occurrences=None):
+        self.restore = {tag: vals for tag, vals in tag_map.items() if vals}
+        self.occurrences = occurrences or {}
+        self._seen = defaultdict(int)
+        self.stats = {'tags': 0, 'unknown': 0, 'paragraphs_changed': 0}
+
+    @classmethod
+    def from_map(cls, map_path):
+        tag_map, meta = load_map(map_path)
+        return cls(tag_map, meta.get('occurrences'))
+
+    def _sub(self, m):
+        tag = m.group(0)
+        values = self.restore.get(tag)
+        if values is None:
+            self.stats['unknown'] += 1
+            return tag
+        self.stats['tags'] += 1
+        occurrences = self.occurrences.get(tag)
+        if occurrences is None:
+            return values[0]
+        n = self._seen[tag]
+        self._seen[tag] = n + 1
+        # více výskytů, než mapa zná (ručně upravený dokument) → kanonická hodnota
+        return values[occurrences[n]] if n < len(occurrences) and occurrences[n] < len(values) else values[0]
+
+    def text(self, s: str) -> str:
+        if '[[' not in s:
+            return s
+        return TAG_RE.sub(self._sub, s)
+
+    def docx(self, input_path: str, output_path: str, incremental_save: bool = True):
+        doc = Document(input_path)
+        for p in iter_paragraphs(doc):
+            txt = get_text(p)
+            new = self.text(txt)
+            if new != txt:
+                set_text(p, new)
+                self.stats['paragraphs_changed'] += 1
+        if incremental_save:
+            try:
+                save_docx_incremental(doc, input_path, output_path)
+                return self.stats
+            except (ValueError, OSError) as e:
+                print(f"⚠️  Inkrementální zápis DOCX selhal ({e}) - ukládám celý balíček")
+        doc.save(output_path)
+        return self.stats
+
+    def text_file(self, input_path: str, output_path: str):
+        """TXT se zpracuje po řádcích (tag nikdy nepřesahuje konec řádku)."""
+        with open(input_path, encoding='utf-8') as src, open(output_path, 'w', encoding='utf-8') as out:
+            for line in src:
+                new = self.text(line)
+                if new != line:
+                    self.stats['paragraphs_changed'] += 1
+                out.write(new)
+        return self.stats
+
+def _roundtrip_pattern(anonymized: str, tag_map, capture: bool = False) -> re.Pattern:
+    """
+    Regex z anonymizovaného odstavce: literály beze změny (mezery pružně - post-processing
+    je normalizuje), každý tag jako alternace jeho zaznamenaných hodnot. S capture je
+    každý výskyt tagu skupina s libovolným textem mezi okolními literály (pro zjištění
+    tvaru, který v originálu skutečně stál); jen tag hned za tagem (bez literálu mezi
+    nimi) dostane napřed své hodnoty, aby se hranice mezi nimi neurčovala náhodně.
+    """
+    def literal(chunk):
+        return r'\s*'.join(re.escape(w) for w in chunk.split())
+
+    def date_surface(value):
+        # DATE se ukládá normalizovaně (DD.MM.RRRR) - v originálu může být "1. 6. 2025" i "1. června 2025"
+        day, month, year = value.split('.')
+        months = '|'.join(name for name, num in MONTH_MAP.items() if num == month)
+        return (rf'0?{int(day)}\.\s*(?:0?{int(month)}\.\s*|(?i:{months})\s+){year}'
+                if months else re.escape(value))
+
+    parts, pos = [], 0
+    for m in TAG_RE.finditer(anonymized):
+        parts.append(literal(anonymized[pos:m.start()]))
+        pos = m.end()
+        if capture and not TAG_RE.match(anonymized[pos:].lstrip()):
+            parts.append('(.+?)')
+            continue
+        vals = tag_map.get(m.group(0)) or [m.group(0)]
+        if m.group(0).startswith('[[DATE_'):
+            alts = [date_surface(v) for v in vals if re.fullmatch(r'\d{2}\.\d{2}\.\d{4}', v)] + [literal(v) for v in vals]
+        else:
+            alts = sorted((literal(v) for v in vals), key=len, reverse=True)
+        parts.append('(' + '|'.join(alts) + '|.+?)' if capture else '(?:' + '|'.join(alts) + ')')
+    parts.append(literal(anonymized[pos:]))
+    return re.compile(r'\s*' + r'\s*'.join(p for p in parts if p) + r'\s*')
+
+def tag_surfaces(original: str, anonymized: str) -> Optional[list]:
+    """
+    Původní text každého výskytu tagu v anonymizovaném odstavci (viz tag_spans).
+    None = nelze rozhodnout - pak _roundtrip_pattern(capture=True).
+    """
+    spans = tag_spans(original, anonymized)
+    return None if spans is None else [original[s:e] for s, e in spans]
+
+def tag_spans(original: str, anonymized: str) -> Optional[list]:
+    """
+    Úseky [(start, end)] originálu, které nahradil každý výskyt tagu, bez kompilace regexu:
+    literály mezi tagy (bez bílých znaků - post-processing je normalizuje) se hledají
+    v originálu zleva, výskyt tagu je text mezi nimi (bez okrajových mezer). None = nelze
+    rozhodnout (tagy bez literálu mezi sebou) nebo odstavec na originál nesedí.
+    """
+    chunks = TAG_RE.split(anonymized)
+    literals = [''.join(chunk.split()) for chunk in chunks]
+    if not all(literals[1:-1]):
+        return None
+    # Originál bez bílých znaků a pozice každého jeho znaku v originálu
+    positions = [i for i, ch in enumerate(original) if not ch.isspace()]
+    compact = ''.join(original[i] for i in positions)
+    positions.append(len(original))
+
+    def gap(k):
+        # v originálu je před k-tým znakem (bez bílých) mezera
+        return positions[k] > 0 and original[positions[k] - 1].isspace()
+
+    def spaced_before_tag(chunk):
+        # mezeru před tagem post-processing přidává jen za ":.," - jinak byla v originálu
+        return chunk[-1:].isspace() and chunk.rstrip()[-1:] not in (':', '.', ',')
+
+    def span(s, e):
+        while s < e and original[s].isspace():
+            s += 1
+        while e > s and original[e - 1].isspace():
+            e -= 1
+        return s, e
+
+    if not compact.startswith(literals[0]):
+        return None
+    spans, pos = [], len(literals[0])
+    for chunk, lit, prev in zip(chunks[1:-1], literals[1:-1], chunks):
+        if spaced_before_tag(prev) and not gap(pos):
+            return None
+        # literál za tagem začínající mezerou nesmí v originálu začínat uprostřed slova
+        end = compact.find(lit, pos + 1)
+        while end >= 0 and chunk[:1].isspace() and not gap(end):
+            end = compact.find(lit, end + 1)
+        if end < 0:
+            return None
+        spans.append(span(positions[pos], positions[end]))
+        pos = end + len(lit)
+    last = literals[-1]
+    end = len(compact) - len(last)
+    if (end <= pos or not compact.endswith(last) or (spaced_before_tag(chunks[-2]) and not gap(pos))
+            or (chunks[-1][:1].isspace() and last and not gap(end))):
+        return None
+    spans.append(span(positions[pos], positions[end]))
+    return spans
+
+def split_tagged(chunks: list, anonymized: str) -> Optional[list]:
+    """
+    Výsledek anonymizace spojených úseků (text HTML rozdělený inline značkami) zpět po
+    úsecích: tag patří do úseku, kde začínal jeho původní text, a text, který zakryl,
+    z dalších úseků zmizí ("<b>Karel</b> Dvořák" → "<b>[[PERSON_1]]</b>"). Text mimo
+    tagy je z originálu. None = výskyty tagů v originálu nelze určit (tag_spans).
+    """
+    original = ''.join(chunks)
+    spans = tag_spans(original, anonymized)
+    if spans is None:
+        return None
+    tags = TAG_RE.findall(anonymized)
+    outs, cursor, k = [], 0, 0
+    for end in itertools.accumulate(map(len, chunks)):
+        out = []
+        while k < len(spans) and spans[k][0] < end:
+            s, e = spans[k]
+            out.append(original[cursor:s])
+            out.append(tags[k])
+            cursor, k = e, k + 1
+        if cursor < end:
+            out.append(original[cursor:end])
+            cursor = end
+        outs.append(''.join(out))
+    return outs
+
+def verify_roundtrip(original_docx: str, anonymized_docx: str, map_path: str, limit: int = 20) -> dict:
+    """
+    Ověří úplnost mapy proti originálu: každý odstavec originálu musí odpovídat
+    anonymizovanému odstavci, v němž se za každý tag dosadí některá z jeho hodnot,
+    a de-anonymizace (tvar každého výskytu podle meta) musí vrátit originál (mezery
+    se neporovnávají - post-processing je normalizuje).
+    Vrací počty odstavců a (nejvýše `limit`) neshodujících se odstavců.
+    """
+    tag_map, meta = load_map(map_path)
+    restorer = Deanonymizer(tag_map, meta.get('occurrences'))
+    original = [clean_invisibles(get_text(p)) for p in iter_paragraphs(Document(original_docx))]
+    anonymized = [get_text(p) for p in iter_paragraphs(Document(anonymized_docx))]
+    if len(original) != len(anonymized):
+        raise ValueError(f'různý počet odstavců: {len(original)} vs. {len(anonymized)}')
+    result = {'paragraphs': len(original), 'with_tags': 0, 'consistent': 0, 'restored': 0, 'mismatches': []}
+    for i, (orig, anon) in enumerate(zip(original, anonymized)):
+        if '[[' not in anon:
+            continue
+        result['with_tags'] += 1
+        consistent = bool(_roundtrip_pattern(anon, tag_map).fullmatch(orig))
+        restored = ''.join(restorer.text(anon).split()) == ''.join(orig.split())
+        result['consistent'] += consistent
+        result['restored'] += restored
+        if not (consistent and restored) and len(result['mismatches']) < limit:
+            result['mismatches'].append((i, orig, anon))
+    return result
+
+# =============== Kontrola úniků (END-SCAN) ===============
+LEAK_TOKEN_RE = re.compile(r'\w+')
+LEAK_MIN_CHARS = 4  # kratší hodnoty (dvojciferná čísla, zkratky) by hlásily jen šum
+LEAK_REPORT_LIMIT = 50
+# Jednotka výstupu, ve které se únik hlásí (klíč v self.leaks → popisek v CLI)
+LEAK_UNITS = {'paragraph': 'odstavec', 'cell': 'buňka', 'value': 'hodnota', 'line': 'řádek', 'message': 'zpráva'}
+
+@lru_cache(maxsize=65536)
+def leak_token(word: str) -> str:
+    """Slovo pro porovnání úniků: bez diakritiky a bez rozlišení velikosti písmen."""
+    return ''.join(c for c in unicodedata.normalize('NFD', word) if not unicodedata.combining(c)).casefold()
+
+class LeakScanner:
+    """
+    Závěrečná kontrola (END-SCAN), že ve výstupu nezůstala žádná původní hodnota z mapy.
+    Všechny hodnoty (tag → hodnoty) se rozloží na slova normalizovaná leak_token - tím
+    jsou pokryté i varianty bez diakritiky a v jiné velikosti písmen a nezáleží na
+    mezerách a interpunkci mezi slovy - a složí se do jednoho automatu Aho-Corasick nad
+    slovy. Odstavec se pak projde jednou bez ohledu na počet hodnot v mapě.
+    """
+    __slots__ = ('_goto', '_fail', '_out', 'patterns')
+
+    def __init__(self, entities):
+        goto, out = [{}], [[]]
+        self.patterns = 0
+        for tag, values in entities.items():
+            for value in values:
+                words = [leak_token(w) for w in LEAK_TOKEN_RE.findall(value)]
+                if sum(map(len, words)) < LEAK_MIN_CHARS:
+                    continue
+                state = 0
+                for word in words:
+                    nxt = goto[state].get(word)
+                    if nxt is None:
+                        nxt = goto[state][word] = len(goto)
+                        goto.append({})
+                        out.append([])
+                    state = nxt
+                if not any(t == tag for t, _ in out[state]):
+                    out[state].append((tag, len(words)))
+                    self.patterns += 1
+        # Selhávací přechody po vrstvách (BFS); výstupy se dědí po selhávací hraně
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for word, nxt in goto[state].items():
+                f = fail[state]
+                while f and word not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(word, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+                queue.append(nxt)
+        self._goto, self._fail, self._out = goto, fail, [tuple(o) for o in out]
+
+    def __len__(self):
+        return self.patterns
+
+    def scan(self, text: str):
+        """Výskyty hodnot v textu jako (začátek, konec, tag); prázdný list = bez úniku."""
+        goto, fail, out = self._goto, self._fail, self._out
+        hits, starts, state = [], [], 0
+        for m in LEAK_TOKEN_RE.finditer(text):
+            word = leak_token(m.group())
+            starts.append(m.start())
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for tag, length in out[state]:
+                hits.append((starts[-length], m.end(), tag))
+        return hits
+
+class LeakSpool:
+    """
+    Výstup streamovaných režimů (XLSX, SQLite, filtr, mbox) pro END-SCAN: mapa je úplná
+    až po posledním řádku, proto se výstupní texty s pozicí odkládají do dočasného souboru
+    (JSON řádek [pozice, text]) a projdou se až na konci - v RAM nezůstává kopie výstupu.
+    """
+
+    def __init__(self):
+        import tempfile
+        self._file = tempfile.TemporaryFile('w+', encoding='utf-8')
+
+    def add(self, where, text: str):
+        # kratší text žádnou hodnotu mapy obsahovat nemůže (LEAK_MIN_CHARS)
+        if len(text) >= LEAK_MIN_CHARS:
+            self._file.write(_json_str([where, text]) + '\n')
+
+    def __iter__(self):
+        self._file.seek(0)
+        for line in self._file:
+            yield json.loads(line)
+
+    def close(self):
+        self._file.close()
+
 # =============== Anonymizer ===============
+class Entity:
+    """Záznam jednoho tagu: tag, normalizovaná hodnota, podle které se hledá, a uspořádaná množina hodnot."""
+    __slots__ = ('tag', 'norm', 'values')
+    # Do této velikosti stačí list (lineární kontrola je levná a list je menší než dict),
+    # pak se hodnoty převedou na dict bez hodnot = uspořádanou množinu s O(1) členstvím
+    SMALL = 16
+
+    def __init__(self, tag: str, norm: str):
+        self.tag = tag
+        self.norm = norm
+        self.values = []
+
+    def add(self, value: str, first: bool = False):
+        values = self.values
+        if value in values:
+            return
+        if value == self.norm:
+            value = self.norm  # sdílí jeden objekt s indexem hodnot
+        if first:
+            values = [value, *values]
+        elif type(values) is list:
+            values.append(value)
+        else:
+            values[value] = None
+            return
+        self.values = dict.fromkeys(values) if len(values) > self.SMALL else values
+
+class EntityStore(Mapping):
+    """
+    Kompaktní registr entit místo tag_map (tag → list) a value_to_tag ("cat:hodnota" → tag).
+    Hodnoty se ukládají v malých listech (neinternují se - skoro všechny jsou unikátní), které
+    se při růstu převedou na uspořádané množiny (žádné kvadratické `not in list`), vyhledávání
+    jde přes index kategorie → normalizovaná hodnota → Entity bez skládání klíčů "cat:hodnota".
+    Pro čtení se chová jako mapa tag → hodnoty v pořadí vložení.
+    """
+    __slots__ = ('_by_tag', '_by_value', '_by_cat')
+
+    def __init__(self):
+        self._by_tag = {}
+        self._by_value = defaultdict(dict)
+        self._by_cat = defaultdict(list)  # kategorie → entity (pro zápis mapy po sekcích)
+
+    # Jako mapa se tváří jen tagy s aspoň jednou zaznamenanou hodnotou (stejně jako dřívější tag_map)
+    def __getitem__(self, tag):
+        entity = self._by_tag[tag]
+        if not entity.values:
+            raise KeyError(tag)
+        return entity.values
+
+    def __iter__(self):
+        return (tag for tag, e in self._by_tag.items() if e.values)
+
+    def __len__(self):
+        return sum(1 for e in self._by_tag.values() if e.values)
+
+    def all_tags(self):
+        """Všechny založené tagy včetně těch bez zaznamenané hodnoty."""
+        return self._by_tag.keys()
+
+    def lookup(self, cat: str, norm: str):
+        entity = self._by_value[cat].get(norm)
+        return entity.tag if entity is not None else None
+
+    def create(self, cat: str, number: int, norm: str) -> str:
+        tag = f'[[{cat}_{number}]]'
+        entity = self._by_tag[tag] = Entity(tag, norm)
+        cat = sys.intern(cat)
+        self._by_value[cat][norm] = entity
+        self._by_cat[cat].append(entity)
+        return tag
+
+    def add(self, tag: str, value: str, first: bool = False):
+        """Přidá hodnotu k tagu (první = kanonická forma se vloží na začátek)."""
+        entity = self._by_tag.get(tag)
+        if entity is None:
+            # Tag bez registrace (např. provizorní) - jen úložiště hodnot
+            entity = self._by_tag[tag] = Entity(tag, '')
+            self._by_cat[tag[2:-2].rsplit('_', 1)[0]].append(entity)
+        entity.add(value, first)
+
+    def norm(self, tag: str) -> str:
+        entity = self._by_tag.get(tag)
+        return entity.norm if entity is not None else ''
+
+    def renumber(self, mapping: dict):
+        """Přečísluje tagy podle mapping {starý tag: nový tag} (index hodnot zůstává platný)."""
+        by_tag = {}
+        for tag, entity in self._by_tag.items():
+            entity.tag = mapping.get(tag, tag)
+            by_tag[entity.tag] = entity
+        self._by_tag = by_tag
+
+    def categories(self):
+        return sorted(self._by_cat)
+
+    def category(self, cat: str):
+        """[(tag, hodnoty)] jedné kategorie seřazené jako sorted(tag_map) - bez průchodu ostatními."""
+        return sorted((e.tag, e.values) for e in self._by_cat.get(cat, ()) if e.values)
+
+    def snapshot(self) -> dict:
+        """Obyčejná kopie tag → list hodnot (porovnání, serializace)."""
+        return {tag: list(e.values) for tag, e in self._by_tag.items() if e.values}
+
+class DiskEntityStore(Mapping):
+    """
+    Varianta EntityStore pro režim s omezenou pamětí (--max-memory): entity, index hodnot
+    i hodnoty jsou v dočasné SQLite databázi na disku (smaže se při zavření spojení),
+    v paměti zůstává jen stránková cache SQLite o velikosti cache_kib.
+    Rozhraní i pořadí (vložení, sorted(tag) v category) jsou stejné jako u EntityStore.
+    """
+
+    def __init__(self, cache_kib: int = 65536):
+        import sqlite3
+        # prázdná cesta = soukromá dočasná databáze na disku; spojení se smí použít i z jiného
+        # vlákna než toho, které ho otevřelo (aiter_anonymize_docx běží v thread executoru)
+        self._db = sqlite3.connect('', check_same_thread=False)
+        self._db.executescript(f"""
+            PRAGMA cache_size = -{int(cache_kib)};
+            PRAGMA temp_store = FILE;
+            CREATE TABLE entity (id INTEGER PRIMARY KEY, tag TEXT UNIQUE, cat TEXT, norm TEXT);
+            CREATE INDEX entity_cat ON entity (cat);
+            CREATE TABLE lookup (cat TEXT, norm TEXT, id INTEGER, PRIMARY KEY (cat, norm)) WITHOUT ROWID;
+            CREATE TABLE val (id INTEGER, value TEXT, seq INTEGER, PRIMARY KEY (id, value)) WITHOUT ROWID;
+            CREATE INDEX val_seq ON val (id, seq);
+        """)
+
+    def _id(self, tag):
+        row = self._db.execute('SELECT id FROM entity WHERE tag = ?', (tag,)).fetchone()
+        return row[0] if row else None
+
+    def _values(self, entity_id) -> list:
+        return [v for v, in self._db.execute('SELECT value FROM val WHERE id = ? ORDER BY seq', (entity_id,))]
+
+    def __getitem__(self, tag):
+        entity_id = self._id(tag)
+        values = self._values(entity_id) if entity_id is not None else None
+        if not values:
+            raise KeyError(tag)
+        return values
+
+    def __iter__(self):
+        rows = self._db.execute('SELECT tag FROM entity e WHERE EXISTS (SELECT 1 FROM val WHERE id = e.id) ORDER BY id')
+        return (tag for tag, in rows.fetchall())
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(DISTINCT id) FROM val').fetchone()[0]
+
+    def all_tags(self):
+        return [tag for tag, in self._db.execute('SELECT tag FROM entity ORDER BY id')]
+
+    def lookup(self, cat: str, norm: str):
+        row = self._db.execute('SELECT e.tag FROM lookup l JOIN entity e ON e.id = l.id '
+                               'WHERE l.cat = ? AND l.norm = ?', (cat, norm)).fetchone()
+        return row[0] if row else None
+
+    def create(self, cat: str, number: int, norm: str) -> str:
+        tag = f'[[{cat}_{number}]]'
+        entity_id = self._db.execute('INSERT INTO entity (tag, cat, norm) VALUES (?, ?, ?)',
+                                     (tag, cat, norm)).lastrowid
+        self._db.execute('INSERT OR REPLACE INTO lookup VALUES (?, ?, ?)', (cat, norm, entity_id))
+        return tag
+
+    def add(self, tag: str, value: str, first: bool = False):
+        db = self._db
+        entity_id = self._id(tag)
+        if entity_id is None:
+            entity_id = db.execute('INSERT INTO entity (tag, cat, norm) VALUES (?, ?, ?)',
+                                   (tag, tag[2:-2].rsplit('_', 1)[0], '')).lastrowid
+        agg = 'MIN(seq) - 1' if first else 'MAX(seq) + 1'
+        db.execute(f'INSERT OR IGNORE INTO val SELECT ?, ?, COALESCE({agg}, 0) FROM val WHERE id = ?',
+                   (entity_id, value, entity_id))
+
+    def norm(self, tag: str) -> str:
+        row = self._db.execute('SELECT norm FROM entity WHERE tag = ?', (tag,)).fetchone()
+        return row[0] if row else ''
+
+    def renumber(self, mapping: dict):
+        # Dvě fáze přes dočasné názvy, aby prohození čísel neporušilo UNIQUE(tag)
+        ids = [(self._id(old), new) for old, new in mapping.items() if old != new]
+        ids = [(entity_id, new) for entity_id, new in ids if entity_id is not None]
+        self._db.executemany('UPDATE entity SET tag = ? WHERE id = ?', ((f'~{i}', i) for i, _ in ids))
+        self._db.executemany('UPDATE entity SET tag = ? WHERE id = ?', ((new, i) for i, new in ids))
+
+    def categories(self):
+        return sorted(cat for cat, in self._db.execute('SELECT DISTINCT cat FROM entity'))
+
+    def category(self, cat: str):
+        rows = self._db.execute('SELECT id, tag FROM entity WHERE cat = ?', (cat,)).fetchall()
+        out = ((tag, self._values(entity_id)) for entity_id, tag in rows)
+        return sorted((tag, values) for tag, values in out if values)
+
+    def snapshot(self) -> dict:
+        return {tag: self[tag] for tag in self}
+
+    def close(self):
+        self._db.close()
+
+def _is_word_char(ch: str) -> bool:
+    """Totéž co \\w v re pro str (písmeno, číslice nebo podtržítko v Unicode)."""
+    return bool(ch) and (ch.isalnum() or ch == '_')
+
+def contains_word(text: str, value: str) -> bool:
+    """
+    Totéž co re.search(r'(?<!\w)' + re.escape(value) + r'(?!\w)', text), ale bez kompilace
+    vzoru pro každou novou hodnotu (ta zahltí cache re a na číselných přílohách převáží).
+    """
+    pos = text.find(value)
+    while pos >= 0:
+        end = pos + len(value)
+        if not ((pos and _is_word_char(text[pos - 1])) or (end < len(text) and _is_word_char(text[end]))):
+            return True
+        pos = text.find(value, pos + 1)
+    return False
+
+class SpillText:
+    """
+    Text dokumentu (odstavce spojené '\\n' jako source_text) v dočasném souboru
+    namapovaném do paměti - v RAM nezůstává žádná celá kopie, stránky drží OS.
+    Chová se jako posloupnost odstavců (len, indexování, iterace) a umí
+    hledat hodnotu jako celé slovo stejně jako re.search(r'(?<!\\w)hodnota(?!\\w)').
+    """
+
+    def __init__(self, pieces):
+        import mmap, tempfile
+        from array import array
+        self._file = tempfile.TemporaryFile()
+        self._starts = array('q')
+        pos, sep = 0, b''
+        for piece in pieces:
+            data = sep + piece.encode('utf-8')
+            self._file.write(data)
+            self._starts.append(pos + len(sep))
+            pos += len(data)
+            sep = b'\n'
+        self._starts.append(pos + 1)  # zarážka: konec posledního odstavce + oddělovač
+        self._file.flush()
+        self._size = pos
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if pos else b''
+
+    def __len__(self):
+        return len(self._starts) - 1
+
+    def __getitem__(self, i) -> str:
+        return self._mm[self._starts[i]:self._starts[i + 1] - 1].decode('utf-8')
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def _char_before(self, pos: int) -> str:
+        k = pos - 1
+        while k > 0 and 0x80 <= self._mm[k] < 0xC0:  # pokračovací bajty UTF-8
+            k -= 1
+        return self._mm[max(k, 0):pos].decode('utf-8', 'replace') if pos > 0 else ''
+
+    def _char_at(self, pos: int) -> str:
+        if pos >= self._size:
+            return ''
+        lead = self._mm[pos]
+        width = 1 if lead < 0xC0 else 2 if lead < 0xE0 else 3 if lead < 0xF0 else 4
+        return self._mm[pos:pos + width].decode('utf-8', 'replace')
+
+    def contains_word(self, value: str) -> bool:
+        # Bajtová obdoba contains_word() nad mmapem
+        needle = value.encode('utf-8')
+        pos = self._mm.find(needle)
+        while pos >= 0:
+            if not (_is_word_char(self._char_before(pos)) or _is_word_char(self._char_at(pos + len(needle)))):
+                return True
+            pos = self._mm.find(needle, pos + 1)
+        return False
+
+    def close(self):
+        if self._size:
+            self._mm.close()
+        self._file.close()
+
+def _peak_rss_mb() -> Optional[float]:
+    """Špičková RSS procesu v MB (None, kde modul resource není - Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+class Person:
+    """Kanonická osoba (nominativ) a její tag; `order` = pořadí založení."""
+    __slots__ = ('first', 'last', 'tag', 'order')
+
+    def __init__(self, first: str, last: str, tag: str, order: int):
+        self.first = sys.intern(first)
+        self.last = sys.intern(last)
+        self.tag = tag
+        self.order = order
+
+class UnionFind:
+    """Union-find (disjoint set) s kompresí cest; kořenem zůstává dříve přidaný prvek."""
+    def __init__(self):
+        self.parent = {}
+
+    def add(self, x):
+        self.parent.setdefault(x, x)
+
+    def find(self, x):
+        self.add(x)
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, existing, new):
+        root = self.find(existing)
+        self.parent[self.find(new)] = root
+        return root
+
+class AnonymizationCancelled(Exception):
+    """Běh byl kooperativně zrušen (cancel.is_set())."""
+
+def _is_cancelled(cancel) -> bool:
+    return cancel is not None and cancel.is_set()
+
+def _check_cancel(cancel):
+    if _is_cancelled(cancel):
+        raise AnonymizationCancelled()
+
+# =============== Plán běhu (konfigurace) ===============
+# Detektor v anonymize_entities → kategorie, které vytváří (první je hlavní).
+# Detektor běží, pokud je zapnutá aspoň jedna z nich; vedlejší kategorie
+# (např. ID_CARD z telefonního detektoru) hlídá přímo jeho repl.
+DETECTOR_CATEGORIES = {
+    'EMAIL': ('EMAIL',),
+    'PERSON_BYTEM': ('PERSON', 'ADDRESS'),
+    'ADDRESS_ZIP': ('ADDRESS',),
+    'ADDRESS': ('ADDRESS',),
+    'ADDRESS_REVERSE': ('ADDRESS',),
+    'LICENSE_PLATE': ('LICENSE_PLATE',),
+    'VIN': ('VIN',),
+    'DATE': ('DATE',),
+    'DATE_WORDS': ('DATE',),
+    'PLACE': ('PLACE',),
+    'PHONE': ('PHONE', 'ID_CARD'),
+    'BANK': ('BANK', 'ID_CARD'),
+    'ICO': ('ICO',),
+    'DIC': ('DIC',),
+    'IBAN': ('IBAN',),
+    'BIC': ('BIC',),
+    'BIRTH_ID': ('BIRTH_ID', 'ID_CARD'),
+    'ID_CARD': ('ID_CARD', 'BIRTH_ID'),
+    'EMP_ID': ('EMP_ID',),
+}
+CATEGORIES = tuple(pref for _, pref in MAP_SECTIONS)
+# Vlastní kategorie z blacklistu jdou do tagu ([[PROJEKT_1]]), štítky se přejmenovávají až na výstupu
+CATEGORY_NAME_RE = re.compile(r'[A-Z][A-Z_]*')
+LABEL_NAME_RE = re.compile(r'[A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ][A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ_]*')
+
+class RunPlan:
+    """
+    Konfigurace běhu (README: zapínání kategorií, whitelisty, blacklisty, přejmenování
+    štítků) zkompilovaná jednou před během:
+      - detectors: jen detektory zapnutých kategorií (ostatní se vůbec nespouštějí),
+        persons=False vypne celou detekci osob (extrakce i fáze v odstavcích),
+      - whitelist_re / person_whitelist: co nezakrývat - jeden regex se všemi výrazy
+        a množina normalizovaných jmen pro kandidáty na osobu,
+      - blacklist_re / blacklist: co zakrýt vždy - jeden regex, tvar → kategorie;
+        víceslovné osoby (PERSON) se místo toho založí jako známé osoby, takže
+        se najdou i ve všech pádech,
+      - labels: přejmenování kategorií ve výstupu ({"PERSON": "UŽIVATEL"}).
+    Výchozí RunPlan() odpovídá běhu bez konfigurace.
+
+    Konfigurační soubor (JSON):
+      {"categories": ["EMAIL", "PHONE"]   nebo {"DATE": false, ...},
+       "labels": {"PERSON": "UŽIVATEL"},
+       "whitelist": ["Magistrát hl. m. Prahy", "podatelna@praha.eu"],
+       "blacklist": {"PERSON": ["Pepa Zdepa"], "PROJEKT": ["Modrá hvězda"]}}
+    """
+
+    def __init__(self, categories=None, labels=None, whitelist=(), blacklist=None):
+        if categories is None:
+            enabled = set(CATEGORIES)
+        elif isinstance(categories, dict):
+            enabled = {cat for cat in CATEGORIES if categories.get(cat, True)}
+            unknown = set(categories) - set(CATEGORIES)
+        else:
+            enabled = set(categories)
+            unknown = enabled - set(CATEGORIES)
+        if categories is not None and unknown:
+            raise ValueError(f"Neznámé kategorie: {', '.join(sorted(unknown))} "
+                             f"(známé: {', '.join(CATEGORIES)})")
+
+        blacklist = blacklist or {}
+        for cat in blacklist:
+            if not CATEGORY_NAME_RE.fullmatch(cat):
+                raise ValueError(f"Kategorie blacklistu musí být VELKÝMI písmeny bez diakritiky: {cat!r}")
+        self.persons = 'PERSON' in enabled
+        self.seed_persons = []
+        self.blacklist = {}
+        for cat, terms in blacklist.items():
+            for term in terms:
+                words = term.split()
+                if not words:
+                    continue
+                if cat == 'PERSON' and self.persons and len(words) >= 2:
+                    self.seed_persons.append((' '.join(words[:-1]), words[-1]))
+                else:
+                    self.blacklist[' '.join(words).lower()] = cat
+        # Blacklist platí vždy - jeho kategorie jsou zapnuté i bez uvedení v "categories"
+        self.categories = frozenset(enabled | set(self.blacklist.values()))
+        self.detectors = frozenset(d for d, cats in DETECTOR_CATEGORIES.items()
+                                   if any(c in self.categories for c in cats))
+        self.blacklist_re = self._terms_regex(self.blacklist)
+
+        terms = [' '.join(t.split()) for t in whitelist if t.strip()]
+        self.whitelist_re = self._terms_regex(terms)
+        self.person_whitelist = frozenset(filter(None, map(normalize_for_matching, terms)))
+
+        self.labels = dict(labels or {})
+        for cat, label in self.labels.items():
+            if cat not in CATEGORIES and cat not in self.categories:
+                raise ValueError(f"Přejmenování neznámé kategorie {cat!r}")
+            if not LABEL_NAME_RE.fullmatch(label):
+                raise ValueError(f"Neplatný název štítku {label!r} pro {cat}")
+        targets = [self.labels.get(cat, cat) for cat in set(CATEGORIES) | self.categories | set(self.labels)]
+        clash = {t for t in targets if targets.count(t) > 1}
+        if clash:
+            raise ValueError(f"Přejmenování štítků koliduje: {', '.join(sorted(clash))}")
+
+    @staticmethod
+    def _terms_regex(terms):
+        """Jeden regex pro celý slovník (celá slova, bez ohledu na velikost písmen, libovolné mezery)."""
+        if not terms:
+            return None
+        alternation = '|'.join(re.escape(t).replace(r'\ ', r'\s+') for t in longest_first(frozenset(terms)))
+        return re.compile(r'(?<!\w)(?:' + alternation + r')(?!\w)', re.IGNORECASE)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+        unknown = set(config) - {'categories', 'labels', 'whitelist', 'blacklist'}
+        if unknown:
+            raise ValueError(f"{path}: neznámé klíče konfigurace: {', '.join(sorted(unknown))}")
+        return cls(config.get('categories'), config.get('labels'),
+                   config.get('whitelist', ()), config.get('blacklist'))
+
+    def allows_person(self, first: str, last: str) -> bool:
+        """False, pokud je jméno, příjmení nebo celé jméno na whitelistu."""
+        if not self.person_whitelist:
+            return True
+        f, l = normalize_for_matching(first), normalize_for_matching(last)
+        return f not in self.person_whitelist and l not in self.person_whitelist \
+            and f + l not in self.person_whitelist
+
+# =============== XLSX: typy sloupců ===============
+# Záhlaví sloupce (malá písmena bez diakritiky, shadow_fold) → kategorie; první shoda vyhrává,
+# proto "datum narození" a "místo narození" stojí před obecnějšími vzory
+XLSX_HEADER_TYPES = [
+    (re.compile(r'rodn\w*\s*cisl|^r\.?\s*c\.?$'), 'BIRTH_ID'),
+    (re.compile(r'e-?mail'), 'EMAIL'),
+    (re.compile(r'telefon|mobil|^tel\b'), 'PHONE'),
+    (re.compile(r'\biban\b'), 'IBAN'),
+    (re.compile(r'cislo\s+uctu|\bucet\b|bankovni\s+spojeni'), 'BANK'),
+    (re.compile(r'^ic(o)?$|\bico\b'), 'ICO'),
+    (re.compile(r'\bdic\b'), 'DIC'),
+    (re.compile(r'misto\s+narozeni'), 'PLACE'),
+    (re.compile(r'datum\s+narozeni|^narozen'), 'DATE'),
+    (re.compile(r'osobni\s+cislo'), 'EMP_ID'),
+    (re.compile(r'\bop\b|obcansk|prukaz|cislo\s+dokladu'), 'ID_CARD'),
+    (re.compile(r'\bspz\b|\brz\b|registracni\s+znack'), 'LICENSE_PLATE'),
+    (re.compile(r'\bvin\b'), 'VIN'),
+    (re.compile(r'adresa|bydlist|trvaly\s+pobyt|^ulice|^sidlo'), 'ADDRESS'),
+    (re.compile(r'jmeno|prijmeni|najemce|zamestnan|^osoba$'), 'PERSON'),
+]
+# Tvar celé hodnoty buňky pro sloupce bez rozpoznaného záhlaví (v pořadí priority)
+XLSX_VALUE_SHAPES = [
+    ('EMAIL', EMAIL_RE),
+    ('IBAN', IBAN_RE),
+    ('BIRTH_ID', BIRTHID_RE),
+    ('BANK', ACCT_RE),
+    ('DATE', DATE_RE),
+    ('PHONE', PHONE_RE),
+]
+XLSX_SHAPE_SHARE = 0.8  # podíl vzorků, které musí mít tvar kategorie
+XLSX_CELL_CACHE = 4096  # hodnot na sloupec v LRU cache typovaného sloupce (paměť neroste s počtem řádků)
+XLSX_NEEDS_DIGIT = {'BIRTH_ID', 'PHONE', 'IBAN', 'BANK', 'ICO', 'DIC', 'DATE', 'EMP_ID', 'ID_CARD',
+                    'LICENSE_PLATE', 'VIN'}
+
+def xlsx_cell_text(value) -> str:
+    """Hodnota buňky jako text (celá čísla bez .0, datum jako DD.MM.RRRR)."""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if hasattr(value, 'strftime'):
+        return value.strftime('%d.%m.%Y')
+    return ' '.join(str(value).split())
+
+def infer_column_type(header, samples) -> Optional[str]:
+    """
+    Kategorie sloupce: podle záhlaví, jinak podle tvaru vzorků (aspoň XLSX_SHAPE_SHARE
+    neprázdných hodnot musí celých odpovídat jednomu detektoru; IČO podle kontrolního součtu).
+    None = volný text (buňky projdou celým řetězcem detektorů).
+    """
+    folded = shadow_fold(xlsx_cell_text(header))
+    for rx, cat in XLSX_HEADER_TYPES:
+        if folded and rx.search(folded):
+            return cat
+    values = [xlsx_cell_text(v) for v in samples if v is not None and not isinstance(v, bool)]
+    values = [v for v in values if v]
+    if not values:
+        return None
+    need = XLSX_SHAPE_SHARE * len(values)
+    for cat, rx in XLSX_VALUE_SHAPES:
+        if sum(1 for v in values if rx.fullmatch(v)) >= need:
+            return cat
+    if sum(1 for v in values if valid_ico(v)) >= need:
+        return 'ICO'
+    return None
+
+# =============== SQLite (tabulky CRM) ===============
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+def sqlite_ident(name: str) -> str:
+    """Jméno tabulky/sloupce v SQL (v uvozovkách, uvozovky zdvojené)."""
+    return '"' + name.replace('"', '""') + '"'
+
+def parse_sqlite_columns(specs) -> dict:
+    """
+    Výběr sloupců z příkazové řádky: "tabulka:sloupec1,sloupec2" (i opakovaně)
+    → {tabulka: [sloupce]}; samotná "tabulka" znamená všechny textové sloupce.
+    """
+    columns = OrderedDict()
+    for spec in specs:
+        table, _, cols = spec.partition(':')
+        table = table.strip()
+        if not table:
+            raise ValueError(f"Chybí jméno tabulky: {spec!r}")
+        target = columns.setdefault(table, [])
+        for col in cols.split(','):
+            if col.strip() and col.strip() not in target:
+                target.append(col.strip())
+    return columns
+
+def write_sqlite_map(conn, table: str, entities):
+    """
+    Mapa náhrad do vedlejší tabulky (tag, pořadí, hodnota) - stejný obsah jako _map.json.
+    Tabulka se přepíše celá; transakci uzavírá volající.
+    """
+    name = sqlite_ident(table)
+    conn.execute(f"DROP TABLE IF EXISTS {name}")
+    conn.execute(f"CREATE TABLE {name} (tag TEXT NOT NULL, position INTEGER NOT NULL, "
+                 f"value TEXT NOT NULL, PRIMARY KEY (tag, position))")
+    conn.executemany(f"INSERT INTO {name} (tag, position, value) VALUES (?, ?, ?)",
+                     ((tag, k, v) for cat in entities.categories()
+                      for tag, vals in entities.category(cat) for k, v in enumerate(vals)))
+
+# =============== E-maily (.eml, mbox) ===============
+# Hlavičky s adresami: zobrazované jméno → osoba, adresa → EMAIL; Subject jako text
+MAIL_ADDRESS_HEADERS = ('From', 'Sender', 'Reply-To', 'To', 'Cc', 'Bcc')
+MAIL_TEXT_HEADERS = ('Subject',)
+HTML_TAG_RE = re.compile(r'(<[^>]*>)')
+# Inline značky: text kolem nich je jeden odstavec ("<b>Karel</b> Dvořák" je jedno jméno)
+HTML_INLINE_RE = re.compile(r'</?(?:a|abbr|b|bdi|bdo|big|cite|code|data|dfn|em|font|i|kbd|mark|q|s|samp|small|'
+                            r'span|strike|strong|sub|sup|time|tt|u|var|wbr)\b[^>]*>', re.IGNORECASE)
+MAIL_PARAGRAPH_RE = re.compile(r'(\r?\n[ \t]*\r?\n)')
+
+def iter_mbox(path):
+    """
+    Zprávy souboru mbox po jedné (bez načtení celého souboru): (řádek "From ..." včetně
+    konce řádku, bajty zprávy). Oddělovač je jako v modulu mailbox každý řádek začínající
+    "From "; prázdný řádek před ním patří k oddělovači.
+    """
+    envelope, lines = None, []
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.startswith(b'From '):
+                if envelope is not None:
+                    if lines and not lines[-1].strip():
+                        lines.pop()
+                    yield envelope, b''.join(lines)
+                envelope, lines = line, []
+            elif envelope is not None:
+                lines.append(line)
+    if envelope is not None:
+        if lines and not lines[-1].strip():
+            lines.pop()
+        yield envelope, b''.join(lines)
+
+def _replace_header_values(msg, name: str, values: list):
+    """
+    Jako msg.replace_header() pro všechny výskyty hlavičky po řadě: hodnoty se přepíšou
+    na místě, pořadí hlaviček zprávy zůstává (del + přidání by je přesunulo na konec).
+    """
+    values = iter(values)
+    headers = msg._headers  # replace_header() mění jen první výskyt
+    for k, (key, _) in enumerate(headers):
+        if key.lower() == name.lower():
+            headers[k] = msg.policy.header_store_parse(key, next(values))
+
+# =============== Cache odstavců (dávka dokumentů) ===============
+# Verze formátu záznamů; změna detektorů, která mění výsledky, ji musí zvýšit
+PARAGRAPH_CACHE_VERSION = 1
+
+@lru_cache(maxsize=None)
+def detector_fingerprint() -> str:
+    """
+    Otisk detektorů do klíče cache odstavců: zdrojový kód modulu (vzory, blacklisty
+    i logika fází), bez zdrojáku (zmrazený build) aspoň vzory regexů a množiny
+    na úrovni modulu. Záznamy z jiné verze skriptu se tak nepoužijí, ani když se
+    zapomene zvýšit PARAGRAPH_CACHE_VERSION.
+    """
+    import hashlib
+    try:
+        data = Path(__file__).read_bytes()
+    except (NameError, OSError):
+        data = repr(sorted((name, value.pattern if isinstance(value, re.Pattern) else sorted(map(str, value)))
+                           for name, value in globals().items()
+                           if isinstance(value, (re.Pattern, set, frozenset)))).encode('utf-8')
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+def names_fingerprint(names) -> str:
+    """Otisk knihovny křestních jmen (--names-json ji může vyměnit za jinou stejně velkou)."""
+    import hashlib
+    return hashlib.blake2b('\n'.join(sorted(names)).encode('utf-8'), digest_size=8).hexdigest()
+
+class ParagraphCache:
+    """
+    Cache výsledků odstavců sdílená mezi dokumenty dávky (šablonové smlouvy mají většinu
+    odstavců shodných). Klíč je otisk textu odstavce a všeho, na čem závisí detekce
+    kromě registru tagů (plán běhu, tabulka, kontrolní součty, otisk detektorů a knihovny
+    jmen). Záznam je text po
+    anonymize_entities a žurnál událostí registru ('tag'/'use'/'rec'/'review'), takže
+    se v jiném dokumentu jen přehraje (_replay_journal) - čísla tagů vzniknou stejně
+    jako při plném běhu. Ukládají se jen odstavce, ve kterých fáze osob nic nezměnily
+    a nevznikla osoba; známé osoby aktuálního dokumentu se při zásahu kontrolují znovu.
+    S path se záznamy sdílejí přes soubor SQLite (WAL, více procesů najednou),
+    bez path jen v paměti procesu.
+    """
+
+    def __init__(self, path: Optional[str] = None, memory_entries: int = 100000, flush_every: int = 500):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.flush_every = flush_every
+        self._memory = {}
+        self._pending = []
+        self._conn = None
+
+    def __getstate__(self):
+        # Do workerů se posílá jen cesta - spojení i neuložené záznamy zůstávají v procesu
+        self.flush()
+        return {'path': self.path, 'memory_entries': self.memory_entries, 'flush_every': self.flush_every}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _connect(self):
+        if self._conn is None:
+            import sqlite3
+            self._conn = sqlite3.connect(self.path, timeout=60)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS paragraphs (key BLOB PRIMARY KEY, entry TEXT NOT NULL)")
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def key(text: str, salt: str) -> bytes:
+        import hashlib
+        return hashlib.blake2b(f'{salt}\x00{text}'.encode('utf-8'), digest_size=16).digest()
+
+    def get(self, key: bytes):
+        """(text po entitách, žurnál) nebo None."""
+        entry = self._memory.get(key)
+        if entry is None and self.path:
+            row = self._connect().execute("SELECT entry FROM paragraphs WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                entry = self._remember(key, json.loads(row[0]))
+        return entry
+
+    def put(self, key: bytes, entity_text: str, journal: list):
+        entry = self._remember(key, [entity_text, journal])
+        if self.path:
+            self._pending.append((key, _compact_json(entry)))
+            if len(self._pending) >= self.flush_every:
+                self.flush()
+
+    def _remember(self, key: bytes, entry):
+        if len(self._memory) >= self.memory_entries:
+            self._memory.clear()
+        self._memory[key] = entry
+        return entry
+
+    def flush(self):
+        """Zapíše neuložené záznamy do souboru (INSERT OR IGNORE - souběžné procesy se nepřepisují)."""
+        if self._pending:
+            conn = self._connect()
+            with conn:
+                conn.executemany("INSERT OR IGNORE INTO paragraphs (key, entry) VALUES (?, ?)", self._pending)
+            self._pending = []
+
+    def close(self):
+        self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+# =============== Šablony opakovaných smluv ===============
+# Kolik znaků pevného textu před slotem jde s hodnotou do detektorů (kontext "RČ", "č. účtu" apod.)
+TEMPLATE_CONTEXT = 40
+# Délka kotvy (začátek, případně konec šablony) v indexu šablon
+TEMPLATE_ANCHOR = 12
+# Nejméně písmen v kotvě a v celém pevném textu - "[[DATE_1]] " by pasovalo na cokoli
+TEMPLATE_MIN_LETTERS = (3, 8)
+# Sloty se zpracují v pořadí, v jakém by tagy založil plný průchod: entity podle pořadí detektorů, osoby nakonec
+TEMPLATE_SLOT_ORDER = {}
+for _detector, _cats in DETECTOR_CATEGORIES.items():
+    for _cat in _cats:
+        TEMPLATE_SLOT_ORDER.setdefault(_cat, len(TEMPLATE_SLOT_ORDER))
+TEMPLATE_SLOT_ORDER['PERSON'] = len(TEMPLATE_SLOT_ORDER)
+
+class TemplateLibrary:
+    """
+    Naučené kostry odstavců opakovaných smluv: pevný text a mezi ním sloty s kategorií.
+    Kostra vzniká z dvojice (vstup, výstup) plného průchodu - úseky výstupu mezi tagy
+    se zarovnají na vstup (pevné úseky jako literály, sloty jako nejkratší výplň)
+    a aktivuje se, až ji potvrdí min_support různých vyplnění. Pevný text se přijme,
+    jen pokud v něm plný průchod nic nenašel a neobsahuje dvojici slov s velkým
+    písmenem (kandidát na osobu, jehož skóre by mohlo záviset na výplni slotů).
+    Uložení a načtení přes JSON (save/load) - knihovna se dá učit napříč dávkami.
+    Pozor: uložená knihovna obsahuje pevný text smluv klienta doslova (hledání šablony
+    potřebuje literály, otisky by nestačily). Osobní údaje, které plný průchod našel,
+    jsou sloty, ale nenalezené (jméno bez kontextu, interní čísla) a obchodní text
+    v souboru zůstávají - soubor je důvěrný jako vstupní dokumenty, ne jako výstup.
+    Šablona ušetří jen detektory odstavce; přípravné průchody dokumentu (extrakce osob)
+    zůstávají lineární, čas na dokument proto s šablonami konstantní není.
+    """
+
+    def __init__(self, min_support: int = 2, max_templates: int = 50000):
+        self.min_support = min_support
+        self.max_templates = max_templates
+        self._seen = {}
+        self._active = {}
+        self._index = defaultdict(list)
+        self._anchor_lengths = set()
+        self.learned = 0
+
+    def __len__(self):
+        return len(self._active)
+
+    @staticmethod
+    def _anchor(fixed):
+        def letters(text):
+            return sum(ch.isalpha() for ch in text)
+        if letters(''.join(fixed)) < TEMPLATE_MIN_LETTERS[1]:
+            return None
+        for side, text in (('p', fixed[0][:TEMPLATE_ANCHOR]), ('s', fixed[-1][-TEMPLATE_ANCHOR:])):
+            if letters(text) >= TEMPLATE_MIN_LETTERS[0]:
+                return side, text
+        return None
+
+    @staticmethod
+    def _pattern(fixed):
+        return re.compile('(.+?)'.join(re.escape(f) for f in fixed), re.S)
+
+    def observe(self, text: str, out: str):
+        """Započte odstavec zpracovaný plným průchodem; kostra s dost vyplněními se aktivuje."""
+        if '[[' in text or '[[' not in out:
+            return
+        pieces = TAG_RE.split(out)
+        if any(not f.strip() for f in pieces[1:-1]):
+            return  # sousední sloty nejdou jednoznačně oddělit
+        fixed = tuple(pieces)
+        cats = tuple(tag[2:-2].rsplit('_', 1)[0] for tag in TAG_RE.findall(out))
+        key = (fixed, cats)
+        if key in self._active:
+            return
+        entry = self._seen.get(key)
+        if entry is None:
+            if len(self._seen) >= self.max_templates or self._anchor(fixed) is None:
+                return
+            if any(PAIR_RE.search(TITLES_RE.sub('', f)) for f in fixed):
+                return
+            m = self._pattern(fixed).fullmatch(text)
+            if m is None:
+                return
+            entry = self._seen[key] = {m.groups()}
+        else:
+            m = self._pattern(fixed).fullmatch(text)
+            if m is None:
+                return
+            entry.add(m.groups())
+        if len(entry) >= self.min_support:
+            del self._seen[key]
+            self._activate(fixed, cats)
+            self.learned += 1
+
+    def _activate(self, fixed, cats):
+        key = (tuple(fixed), tuple(cats))
+        if key in self._active:
+            return
+        anchor = self._anchor(key[0])
+        self._active[key] = self._pattern(key[0])
+        self._index[anchor].append(key)
+        self._anchor_lengths.add(len(anchor[1]))
+
+    def match(self, text: str):
+        """(pevné úseky, kategorie slotů, hodnoty slotů) první pasující šablony, nebo None."""
+        if not self._active:
+            return None
+        for length in self._anchor_lengths:
+            for anchor in (('p', text[:length]), ('s', text[-length:])):
+                for key in self._index.get(anchor, ()):
+                    m = self._active[key].fullmatch(text)
+                    if m is not None:
+                        return key[0], key[1], m.groups()
+        return None
+
+    def save(self, path: str):
+        """Aktivní šablony do JSON - včetně pevného textu smluv (viz docstring třídy)."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'format': 'anon-templates', 'version': 1,
+                       'templates': [[list(fixed), list(cats)] for fixed, cats in self._active]},
+                      f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> 'TemplateLibrary':
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('format') != 'anon-templates':
+            raise ValueError(f"{path}: není knihovna šablon")
+        library = cls(**kwargs)
+        for fixed, cats in data['templates']:
+            library._activate(fixed, cats)
+        return library
+
+    def merge(self, other: 'TemplateLibrary'):
+        """Převezme aktivní šablony jiné knihovny (např. naučené ve workeru dávky)."""
+        for fixed, cats in other._active:
+            self._activate(fixed, cats)
+
 class Anonymizer:
     def __init__(self, verbose=False):
         self.verbose = verbose
         self.counter = defaultdict(int)
-        self.tag_map = defaultdict(list)
-        self.value_to_tag = {}
+        # tag → hodnoty a (kategorie, hodnota) → tag v jednom kompaktním úložišti
+        self.entities = EntityStore()
         self.person_index = {}
+        # Sloučené identity osob: union-find nad klíči (jméno, příjmení) + indexy pro hledání
+        self.person_sets = UnionFind()
+        self.person_aliases = defaultdict(list)
+        self._person_by_key = {}
+        # Tvar příjmení (malými písmeny) → kanonická příjmení malými, kanonické příjmení
+        # → {křestní jméno malými: klíče} a tvar křestního jména → křestní jména (nominativ);
+        # hledání ekvivalentu je pak vyhledání ve slovnících a neroste s počtem osob
+        # (tabulky nájemníků mají tisíce osob stejného příjmení). Tvary se indexují jednou
+        # pro každé jméno a příjmení, ne pro každou osobu.
+        self._surname_form_owners = defaultdict(set)
+        self._canonical_last_index = defaultdict(dict)
+        self._first_form_owners = defaultdict(set)
+        # Prefix slova (person_prefixes) → osoby; klíč None = osoby bez rozhodnutelného prefixu
+        self._person_prefix_index = defaultdict(list)
+        # Stínový tvar jména → pořadí první osoby, která ho má; tvary více osob a stínové tvary
+        # přivlastňovacích přídavných jmen se samostatně bez diakritiky nepřiřazují
+        self._shadow_form_owners = {}
+        self._ambiguous_folds = set()
+        # Oba indexy slouží jen hledání v textu: doplňují se až před ním (_index_text_persons),
+        # typované sloupce XLSX je pro tisíce osob nepotřebují
+        self._text_indexed = 0
+        self._shadow_names = defaultdict(int)  # množina variant jména → počet zaindexovaných osob (nejvýš 2)
         self.canonical_persons = []
         self.person_variants = {}
         self.source_text = ""
+        self.stats = {}
+        # Pre-screening odstavců (False = všechny detektory na všech odstavcích, pro porovnání)
+        self.prescreen = True
+        # Kaskádové skórování kandidátů na jméno (False = vždy všechny příznaky, pro porovnání)
+        self.cascade = True
+        # Kontrolní součty IBAN a účtu před kontextovými regexy (False = jen kontext, pro porovnání)
+        self.validate = True
+        # Cache odstavců sdílená mezi dokumenty dávky (ParagraphCache; None = bez cache)
+        self.paragraph_cache = None
+        self._cache_salt = (None, '')
+        # Naučené šablony opakovaných smluv (TemplateLibrary; None = vždy plný průchod)
+        self.templates = None
+        # Nejisté detekce ponechané v textu (report k revizi)
+        self.review = []
+        # Závěrečná kontrola úniků původních hodnot ve výstupu (LeakScanner) a nalezené úniky
+        self.leak_scan = True
+        self.leaks = []
+        # Index právě zpracovávaného odstavce a první odstavec uvnitř tabulek (iter_paragraphs)
+        self._paragraph = None
+        # Vyčištěný text naposledy zpracovaného odstavce (podřetězec source_text)
+        self._paragraph_text = None
+        self._table_start = None
+        # První offset (ve zdrojovém textu) každé entity - plní se v režimu číslování podle pozice
+        self.first_offsets = {}
+        # Tagy, jejichž první offset je jen začátek odstavce (hodnota se v originálu nenašla)
+        self.approx_offsets = []
+        # Tag → index hodnoty (původního tvaru) pro každý výskyt ve výstupu v pořadí dokumentu
+        self.occurrences = defaultdict(list)
+        # Žurnál změn registru tagů (používá se jen ve workerech paralelního režimu)
+        self._journal = None
+        # Záznam i nalezených existujících tagů ('use') - jen při ukládání do cache odstavců
+        self._tag_trace = None
+        # Zapnuté kategorie, whitelist/blacklist a štítky (RunPlan.from_file pro --config)
+        self.plan = RunPlan()
 
     def _get_or_create_tag(self, cat: str, value: str) -> str:
         norm_val = ' '.join(value.split())
-        lookup_key = f"{cat}:{norm_val}"
-        if lookup_key in self.value_to_tag:
-            return self.value_to_tag[lookup_key]
+        tag = self.entities.lookup(cat, norm_val)
+        if tag is not None:
+            if self._tag_trace is not None:
+                self._tag_trace.append(('use', tag, cat, value))
+            return tag
         self.counter[cat] += 1
-        tag = f'[[{cat}_{self.counter[cat]}]]'
-        self.value_to_tag[lookup_key] = tag
+        tag = self.entities.create(cat, self.counter[cat], norm_val)
+        if self._journal is not None:
+            self._journal.append(('tag', tag, cat, value))
         self._record_value(tag, value)
         return tag
 
     def _record_value(self, tag: str, value: str):
+        if self._journal is not None:
+            self._journal.append(('rec', tag, value))
         # Normalize: odstranění leading/trailing mezer a vícenásobných mezer
         value = re.sub(r'\s+', ' ', value).strip()
         if not value:
@@ -998,136 +2757,249 @@ class Anonymizer:
 
         # Pro DATE tagy ukládat vždy (normalizované hodnoty nemusí být v původním textu)
         if tag.startswith('[[DATE_'):
-            if value not in self.tag_map[tag]:
-                self.tag_map[tag].append(value)
-        # Pro ostatní tagy kontrolovat, zda hodnota existuje v původním textu
-        elif re.search(r'(?<!\w)'+re.escape(value)+r'(?!\w)', self.source_text):
-            if value not in self.tag_map[tag]:
-                self.tag_map[tag].append(value)
+            self.entities.add(tag, value)
+        # Pro ostatní tagy kontrolovat, zda hodnota existuje v původním textu.
+        # Hodnota skoro vždy pochází z aktuálního odstavce; ten je podřetězcem source_text
+        # (odstavce odděluje '\n'), takže shoda v něm platí i pro celý text
+        elif self._paragraph_text and contains_word(self._paragraph_text, value):
+            self.entities.add(tag, value)
+        elif isinstance(self.source_text, SpillText):
+            if self.source_text.contains_word(value):
+                self.entities.add(tag, value)
+        elif contains_word(self.source_text, value):
+            self.entities.add(tag, value)
+
+    def _find_equivalent_person(self, first_nom: str, last_nom: str):
+        """
+        Hledá již známou osobu, jejíž pádové varianty obsahují toto jméno (nebo naopak):
+        "Jana Nováka" ~ "Jan Novák", "Mikhail Volkova" ~ "Mikhail Volkov".
+        Porovnává se přesně (bez odstranění diakritiky), aby se nesloučila
+        "Petra Nováková" s "Petr Novák". Vrací klíč nejdříve založené takové osoby.
+        """
+        first_low, last_low = first_nom.lower(), last_nom.lower()
+        fvars = lowered(variants_for_first(first_nom))
+        candidates = set()
+        # Nové jméno je pádovou variantou známé osoby
+        owners = self._surname_form_owners.get(last_low)
+        if owners:
+            firsts = {first.lower() for first in self._first_form_owners.get(first_low, ())}
+            for canonical in owners:
+                by_first = self._canonical_last_index[canonical]
+                # (průchod menší strany - u častého příjmení má by_first tisíce jmen)
+                for first in firsts:
+                    candidates.update(by_first.get(first, ()))
+        # Kanonické jméno známé osoby je pádovou variantou nového jména
+        for sv in lowered(variants_for_surname(last_nom)):
+            by_first = self._canonical_last_index.get(sv)
+            if by_first:
+                for fv in fvars:
+                    candidates.update(by_first.get(fv, ()))
+        if not candidates:
+            return None
+        return min(candidates, key=lambda k: self._person_by_key[k].order)
 
     def _ensure_person_tag(self, first_nom: str, last_nom: str) -> str:
         key = (normalize_for_matching(first_nom), normalize_for_matching(last_nom))
         if key in self.person_index:
             return self.person_index[key]
+
+        # Identita osoby se řeší hned při založení (union-find nad normalizovanými klíči),
+        # takže vydané štítky jsou finální a dokument není potřeba dodatečně přepisovat
+        equivalent = self._find_equivalent_person(first_nom, last_nom)
+        if equivalent is not None:
+            root = self.person_sets.union(equivalent, key)
+            tag = self.person_index[root]
+            self.person_index[key] = tag
+            self.person_aliases[tag].append(f'{first_nom} {last_nom}')
+            if self._journal is not None:
+                self._journal.append(('person', tag, first_nom, last_nom))
+            return tag
+
         tag = self._get_or_create_tag('PERSON', f'{first_nom} {last_nom}')
         self.person_index[key] = tag
-        self.canonical_persons.append({'first': first_nom, 'last': last_nom, 'tag': tag})
-
-        # KRITICKÁ OPRAVA: Zajisti, že kanonická forma (nominativ) je VŽDY první v tag_map
+        self.person_sets.add(key)
+        person = Person(first_nom, last_nom, tag, len(self.canonical_persons) + 1)
+        self.canonical_persons.append(person)
+        self._person_by_key[key] = person
+        by_first = self._canonical_last_index[last_nom.lower()]
+        if not by_first:
+            for sv in lowered(variants_for_surname(last_nom)):
+                self._surname_form_owners[sv].add(last_nom.lower())
+        if person.first not in self._first_form_owners.get(first_nom.lower(), ()):
+            for fv in lowered(variants_for_first(first_nom)):
+                self._first_form_owners[fv].add(person.first)
+        by_first.setdefault(first_nom.lower(), []).append(key)
+        if self._journal is not None:
+            self._journal.append(('person', tag, first_nom, last_nom))
+
+        # KRITICKÁ OPRAVA: Zajisti, že kanonická forma (nominativ) je VŽDY první mezi hodnotami tagu
         # i když není přímo v původním textu (může být jen pádová forma)
-        canonical_full = f'{first_nom} {last_nom}'
-        if canonical_full not in self.tag_map[tag]:
-            # Vlož kanonickou formu na PRVNÍ místo
-            self.tag_map[tag].insert(0, canonical_full)
-
-        fvars = variants_for_first(first_nom)
-        svars = variants_for_surname(last_nom)
-        self.person_variants[tag] = {f'{f} {s}' for f in fvars for s in svars}
+        self.entities.add(tag, f'{first_nom} {last_nom}', first=True)
+
+        # Místo kartézského součinu (stovky řetězců na osobu) držíme jen dvě sdílené
+        # memoizované množiny; celé jméno matchuje person_pair_regex()
+        self.person_variants[tag] = (variants_for_first(first_nom), variants_for_surname(last_nom))
         return tag
 
     def _extract_persons_to_index(self, text: str):
-        # FÁZE 0a: Konservativní detekce jmen po specifických rolích (Jednatel:, Zaměstnanec:, atd.)
-        # Podporuje 2-3 slovná jména (David Müller, Nguyễn Thị Lan)
-        simple_role_re = re.compile(
-            r'\b(Jednatel|Jednatelka|Zaměstnanec|Zaměstnankyně|Dlužn[íi]k|V[eě]řitel|Prodávající|Kupující)\s*:\s*'
-            r'([A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ\u00C0-\u024F\u1E00-\u1EFF][a-záčďéěíňóřšťúůýž\u00C0-\u024F\u1E00-\u1EFF]{1,20})'  # První jméno
-            r'(?:\s+([A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ\u00C0-\u024F\u1E00-\u1EFF][a-záčďéěíňóřšťúůýž\u00C0-\u024F\u1E00-\u1EFF]{1,20}))?'  # Volitelné prostřední jméno
-            r'\s+([A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ\u00C0-\u024F\u1E00-\u1EFF][a-záčďéěíňóřšťúůýž\u00C0-\u024F\u1E00-\u1EFF]{1,20})'  # Příjmení (poslední slovo)
-            r'(?=\s+(?:Bytem|Bydlišt|Sídlo|E-mail|Tel|Kontakt|$))',  # Zastaví se před klíčovými slovy
-            re.IGNORECASE | re.UNICODE
-        )
-
-        for m in simple_role_re.finditer(text):
-            first_part = m.group(2)
-            middle_part = m.group(3)  # může být None
-            surname = m.group(4)
-
-            # Pokud je prostřední jméno, zkombinuj ho s první částí
-            if middle_part:
-                f_nom = f"{first_part} {middle_part}"
-            else:
-                f_nom = first_part
-
-            # Kontrola blacklistu - ale dovolíme "nový/nová" jako příjmení pokud jsou po roli
-            # (Adam Nový, Petra Nová jsou běžná jména i když "nový" je adjektivum)
-            surname_norm = normalize_for_matching(surname)
-            fname_norm = normalize_for_matching(f_nom)
-
-            # Skip common blacklisted words, but allow "novy/nova" as it's also a surname
-            if surname_norm in SURNAME_BLACKLIST and surname_norm not in ('novy', 'nova', 'nove'):
-                continue
-            if fname_norm in SURNAME_BLACKLIST and fname_norm not in ('novy', 'nova', 'nove'):
-                continue
-
-            f_nom_inferred = infer_first_name_nominative(first_part, surname) or f_nom
-            l_nom = infer_surname_nominative(surname)
-
-            self._ensure_person_tag(f_nom, l_nom)
-
-        # FÁZE 0b: Detekce jmen s přezdívkami (Martin "Marty" Král)
-        for m in NICKNAME_RE.finditer(text):
-            first_name = m.group(1)
-            nickname = m.group(2)
-            surname = m.group(3)
-
-            # Kontrola blacklistu
-            if normalize_for_matching(surname) in SURNAME_BLACKLIST:
-                continue
-            if normalize_for_matching(first_name) in SURNAME_BLACKLIST:
-                continue
-
-            f_nom = infer_first_name_nominative(first_name, surname) or first_name
-            l_nom = infer_surname_nominative(surname)
-
-            self._ensure_person_tag(f_nom, l_nom)
-
-        # FÁZE 1: Standardní dvojice (Křestní Příjmení)
-        text_no_titles = TITLES_RE.sub('', text)
-        for m in PAIR_RE.finditer(text_no_titles):
-            s, e = m.span()
-            f_tok, l_tok = m.group(1), m.group(2)
-
-            if f_tok.lower() in ROLE_STOP or l_tok.lower() in ROLE_STOP:
-                continue
-            if normalize_for_matching(l_tok) in SURNAME_BLACKLIST:
-                continue
-            if normalize_for_matching(f_tok) in SURNAME_BLACKLIST:
-                continue
-            
-            pre = text[max(0, s-80):s]
-            post = text[e:e+80]
-
-            # KRITICKÁ OPRAVA: Organizace a firmy
-            # Pokud je za jménem "a.s.", "s.r.o.", "spol.", atd., je to firma, ne osoba
-            if re.search(r'\s+(a\.s\.|s\.r\.o\.|spol\.|v\.o\.s\.|o\.p\.s\.|o\.s\.|z\.s\.)', post, re.IGNORECASE):
-                continue
-
-            # Pokud je před jménem "Oddělení:", "Instituce:", "Společnost:", je to organizace
-            if re.search(r'\b(Oddělení|Instituce|Společnost|Korporace|Organizace|Firma)\s*:\s*$', pre, re.IGNORECASE):
-                continue
-
-            if re.search(r'\b(výrobce|model|značka|inventář|výrobek|položk)', pre+post, re.IGNORECASE):
-                if (normalize_for_matching(f_tok) in SURNAME_BLACKLIST or
-                    normalize_for_matching(l_tok) in SURNAME_BLACKLIST):
-                    continue
-
-            f_nom = infer_first_name_nominative(f_tok, l_tok) or f_tok
-            l_nom = infer_surname_nominative(l_tok)
-
-            if normalize_for_matching(f_nom) in CZECH_FIRST_NAMES:
+        for _, _, f_nom, l_nom in person_candidates(text):
+            if self.plan.allows_person(f_nom, l_nom):
                 self._ensure_person_tag(f_nom, l_nom)
-                continue
 
-            pre = text[max(0, s-160):s]
-            post = text[e:e+160]
-            has_ctx = CTX_PERSON.search(pre+post) or CTX_ROLE.search(pre+post) or CTX_LABEL.search(pre+post)
-            if (has_ctx
-                and f_tok[:1].isupper() and l_tok[:1].isupper()
-                and looks_like_firstname(f_tok)
-                and f_tok.lower() not in ROLE_STOP and l_tok.lower() not in ROLE_STOP):
+    def _extract_persons_chunked(self, pieces, jobs: int = 1, chunk_size: int = EXTRACT_CHUNK,
+                                 overlap: int = EXTRACT_OVERLAP, cancel=None):
+        """
+        Detekce osob po úsecích odstavců místo průchodu celým source_text.
+        Úsek = jádro (~chunk_size znaků celých odstavců) + aspoň `overlap` znaků
+        z každé strany, aby regexy na hranici jádra viděly stejné okolí jako v celém
+        textu; úsek vrací jen kandidáty začínající v jádru. Dvě kola (volitelně v poolu
+        `jobs` procesů): nejdřív tituly (TITLES_RE), z nich posun textu bez titulů
+        pro každý úsek, pak kandidáti. Kandidáti se seřadí podle (fáze, pozice) a osoby
+        se zakládají ve stejném pořadí jako při jednom průchodu - canonical_persons
+        i tagy vyjdou stejně.
+        pieces: odstavce (list nebo SpillText), spojené '\n' tvoří source_text.
+        """
+        from array import array
+
+        def para(i):
+            # KRITICKÁ OPRAVA: e-maily nahradit placeholdery (jména v adresách nejsou osoby);
+            # e-mail nepřesahuje konec odstavce, takže nahrazení po odstavcích = nahrazení v celém textu
+            return EMAIL_RE.sub('__EMAIL_PLACEHOLDER__', pieces[i])
+
+        def join(a, b):
+            return '\n'.join(para(i) for i in range(a, b))
+
+        n = len(pieces)
+        starts = array('q')
+        pos = 0
+        for i in range(n):
+            starts.append(pos)
+            pos += len(para(i)) + 1
+        starts.append(pos)
+        total = pos - 1
+
+        plan, a = [], 0
+        while a < n:
+            b = a + 1
+            while b < n and starts[b] - starts[a] < chunk_size:
+                b += 1
+            wa, wb = a, b
+            while wa > 0 and starts[a] - starts[wa] < overlap:
+                wa -= 1
+            while wb < n and starts[wb] - starts[b] < overlap:
+                wb += 1
+            plan.append((wa, a, b, wb))
+            a = b
+        self.stats['extract_chunks'] = len(plan)
+
+        def bounds(wa, a, b, wb):
+            base = starts[wa]
+            return base, starts[a] - base, (starts[b] - base if b < n else None)
+
+        # Kolo 1: tituly (globální pozice), úsek vrací ty, které začínají v jeho jádru
+        titles = []
+        jobs_1 = ((join(wa, wb), *bounds(wa, a, b, wb)) for wa, a, b, wb in plan)
+        for spans in _ordered_map(_title_chunk_worker, jobs_1, jobs, cancel):
+            titles.extend(spans)
+        t_starts = [ts for ts, _ in titles]
+        removed = [0]
+        for ts, te in titles:
+            removed.append(removed[-1] + te - ts)
+
+        def removed_before(x):
+            k = bisect.bisect_left(t_starts, x)
+            d = removed[k]
+            if k and titles[k - 1][1] > x:
+                d -= titles[k - 1][1] - x
+            return d
+
+        def context_slice(c0, c1):
+            i0 = bisect.bisect_right(starts, c0) - 1
+            i1 = min(n, bisect.bisect_left(starts, c1))
+            return join(i0, max(i1, i0 + 1))[c0 - starts[i0]:c1 - starts[i0]]
+
+        # Kolo 2: kandidáti; kontext FÁZE 1 leží na pozicích textu bez titulů (nt_offset)
+        def jobs_2():
+            for wa, a, b, wb in plan:
+                window = join(wa, wb)
+                base, lo, hi = bounds(wa, a, b, wb)
+                end = base + len(window)
+                k = max(0, bisect.bisect_left(t_starts, base) - 1)
+                local = []
+                while k < len(titles) and titles[k][0] < end:
+                    ts, te = max(titles[k][0], base), min(titles[k][1], end)
+                    if ts < te:
+                        local.append((ts - base, te - base))
+                    k += 1
+                nt_offset = base - removed_before(base)
+                c0 = max(0, nt_offset - PERSON_CONTEXT)
+                c1 = min(total, end - removed_before(base) + PERSON_CONTEXT)
+                yield window, base, lo, hi, local, nt_offset, context_slice(c0, c1), c0
+
+        candidates = []
+        for found in _ordered_map(_person_chunk_worker, jobs_2(), jobs, cancel):
+            candidates.extend(found)
+        candidates.sort(key=lambda c: (c[0], c[1]))
+        for _, _, f_nom, l_nom in candidates:
+            if self.plan.allows_person(f_nom, l_nom):
                 self._ensure_person_tag(f_nom, l_nom)
 
-    def _apply_known_people(self, text: str) -> str:
+    def _index_text_persons(self):
+        """Doplní prefixy a stínové tvary osob založených od posledního volání."""
+        seen = self._shadow_names
+        for person in self.canonical_persons[self._text_indexed:]:
+            for prefix in person_prefixes(person.first, person.last) or (None,):
+                self._person_prefix_index[prefix].append(person)
+            # Tvary jména, které už mají dvě osoby, jsou nejednoznačné a další osoba nic nemění
+            for variants in (variants_for_first(person.first), variants_for_surname(person.last)):
+                if seen[variants] < 2:
+                    seen[variants] += 1
+                    for form in shadow_variants(variants):
+                        if self._shadow_form_owners.setdefault(form, person.order) != person.order:
+                            self._ambiguous_folds.add(form)
+            for variants in (first_possessives(person.first), surname_possessives(person.last)):
+                if not seen[variants]:
+                    seen[variants] = 1
+                    self._ambiguous_folds.update(shadow_variants(variants))
+        self._text_indexed = len(self.canonical_persons)
+
+    def _apply_known_people(self, text: str, features: frozenset = PRESCREEN_ALL,
+                            prefixes: Optional[frozenset] = None) -> str:
+        self._index_text_persons()
+        # Pre-screening: osoby, jejichž žádný tvar jména nezačíná slovem z odstavce, nemůžou matchnout.
+        # Kandidáti se berou z indexu prefixů (ne průchodem všech osob - tabulky mají tisíce osob)
+        if prefixes is None:
+            persons = list(self.canonical_persons)
+        else:
+            index = self._person_prefix_index
+            found = {p.order: p for key in itertools.chain(prefixes, (None,)) for p in index.get(key, ())}
+            persons = [found[order] for order in sorted(found)]
+        if persons:
+            # Prefix je jen hrubé síto (prefixy se počítají i pro sloučené úseky); osoba, jejíž
+            # žádné celé slovo tvaru v tomto textu není, se přeskočí
+            words = frozenset(WORD_RE.findall(shadow_fold(text)))
+            persons = [p for p in persons if (parts := person_words(p.first, p.last)) is None
+                       or not all(map(words.isdisjoint, parts))]
+        if self.canonical_persons:
+            counts = self.stats.setdefault('prescreen', {}).setdefault('known_person', {'run': 0, 'skipped': 0})
+            counts['run'] += len(persons)
+            counts['skipped'] += len(self.canonical_persons) - len(persons)
+
+        # Stínový text se počítá jen po změně textu (mezi fázemi a po nahrazení)
+        shadow = None
+        def shadow_sub(rx, repl, *variants):
+            nonlocal shadow
+            if shadow is None or shadow.text is not text:
+                shadow = ShadowText(text)
+            return shadow.sub(rx, repl, variants)
+
+        def shadow_has(form):
+            """Stínový tvar je v odstavci aspoň jako podřetězec (jinak regex nemá co hledat)."""
+            nonlocal shadow
+            if shadow is None or shadow.text is not text:
+                shadow = ShadowText(text)
+            return form in shadow.folded
+
         # FÁZE 0b: Nahrazení jmen s přezdívkami (Martin "Marty" Král)
         def nickname_repl(m):
             first_name = m.group(1)
@@ -1152,58 +3024,51 @@ class Anonymizer:
 
             return m.group(0)
 
-        text = NICKNAME_RE.sub(nickname_repl, text)
+        if self._screened('nickname', 'quote' in features):
+            text = NICKNAME_RE.sub(nickname_repl, text)
 
         # FÁZE 1: Nahrazení plných jmen (křestní + příjmení)
-        for p in self.canonical_persons:
-            tag = self._ensure_person_tag(p['first'], p['last'])
-            for pat in sorted(self.person_variants[tag], key=len, reverse=True):
-                rx = re.compile(r'(?<!\w)'+re.escape(pat)+r'(?!\w)', re.IGNORECASE)
-                def repl(m):
-                    surf = m.group(0)
-                    self._record_value(tag, surf)
-                    return preserve_case(surf, tag)
-                text = rx.sub(repl, text)
+        for p in persons:
+            tag = p.tag
+            rx = person_pair_regex(p.first, p.last)
+            def repl(m):
+                surf = m.group(0)
+                self._record_value(tag, surf)
+                return preserve_case(surf, tag)
+            text = shadow_sub(rx, repl, variants_for_first(p.first), variants_for_surname(p.last))
 
             # FÁZE 2: Nahrazení přivlastňovacích přídavných jmen (Novákův, Janin)
-            first_low, last_low = p['first'].lower(), p['last'].lower()
-            poss = set()
-            if first_low.endswith('a'):
-                stem = p['first'][:-1]
-                poss |= {stem+s for s in ['in','ina','iny','iné','inu','inou','iným','iných']}
-                if stem.endswith('tr'):
-                    poss |= {stem[:-1]+'ř'+s for s in ['in','ina','iny','iné','inu','inou','iným','iných']}
-            else:
-                poss |= {p['first']+'ův'} | {p['first']+'ov'+s for s in ['a','o','y','ě','ým','ých']}
-            if not last_low.endswith('ová'):
-                poss |= {p['last']+'ův'} | {p['last']+'ov'+s for s in ['a','o','y','ě','ým','ých']}
-            for token in sorted(list(poss), key=len, reverse=True):
-                rx = re.compile(r'(?<!\w)'+re.escape(token)+r'(?!\w)', re.IGNORECASE)
+            for token in longest_first(possessive_forms(p.first, p.last)):
+                if not shadow_has(shadow_fold(token)):
+                    continue
+                rx = word_regex_ci(token)
                 def repl2(m):
                     surf = m.group(0)
                     self._record_value(tag, surf)
                     return preserve_case(surf, tag)
                 text = rx.sub(repl2, text)
 
+        # Tvary bez diakritiky sdílené více osobami (nebo přivlastňovací) se přiřadí jen tehdy,
+        # když osobu určí sousední jméno ("jakub-prochazka"), jinak zůstanou beze změny
+        ambiguous = self._ambiguous_folds
+
         # FÁZE 3: Nahrazení samostatných příjmení (bez křestního jména)
         # Příklad: "Horváthová pronajímá Procházkovi byt. Procházka platí Horváthové nájemné."
-        for p in self.canonical_persons:
-            tag = self._ensure_person_tag(p['first'], p['last'])
+        for p in persons:
+            tag = p.tag
 
             # Generuj všechny pádové varianty příjmení
-            surname_variants = variants_for_surname(p['last'])
+            surname_variants = variants_for_surname(p.last)
 
             # Také přidej varianty křestního jména pro kontrolu
-            first_variants = variants_for_first(p['first'])
-            # Normalizuj křestní jména pro kontrolu (lowercase pro case-insensitive matching)
-            first_variants_lower = {fv.lower() for fv in first_variants if fv}
+            first_variants = variants_for_first(p.first)
 
-            for surname_var in sorted(surname_variants, key=len, reverse=True):
-                if not surname_var or len(surname_var) < 2:
+            for surname_var in shadow_variants(surname_variants):
+                if len(surname_var) < 2 or not shadow_has(surname_var):
                     continue
 
-                # Jednoduchý regex pro nalezení příjmení jako samostatného slova
-                rx = re.compile(r'(?<!\w)' + re.escape(surname_var) + r'(?!\w)', re.IGNORECASE)
+                # Stínový tvar příjmení jako samostatné slovo
+                rx = shadow_word_regex(surname_var)
 
                 # Použijeme callback funkci, která zkontroluje kontext
                 def repl3_with_context(m):
@@ -1232,27 +3097,31 @@ class Anonymizer:
                         # Odstraň titul ze seznamu slov před
                         words_before = words_before[:-1]
 
-                    # Pokud poslední slovo před příjmením je křestní jméno, NENAHRAZUJ
-                    if words_before and words_before[-1].lower() in first_variants_lower:
-                        return surf  # Nech to být (je to součást celého jména)
+                    # Sousedí příjmení s křestním jménem této osoby?
+                    next_to_first = ((words_before and matches_variant(words_before[-1], first_variants))
+                                     or (words_after and matches_variant(words_after[0], first_variants)))
 
-                    # Pokud první slovo po příjmení je křestní jméno, NENAHRAZUJ
-                    if words_after and words_after[0].lower() in first_variants_lower:
-                        return surf  # Nech to být
+                    # Nejednoznačný tvar bez diakritiky: patří této osobě jen vedle jejího jména
+                    # (celé jméno s mezerou už nahradila FÁZE 1, tady zbývá "petr.novak")
+                    if not matches_variant(surf, surname_variants, ambiguous):
+                        if not next_to_first:
+                            return surf
+                    elif next_to_first:
+                        return surf  # Nech to být (je to součást celého jména)
 
                     # Jinak je to samostatné příjmení → anonymizuj
                     self._record_value(tag, surf)
                     return preserve_case(surf, tag)
 
-                text = rx.sub(repl3_with_context, text)
+                text = shadow_sub(rx, repl3_with_context, surname_variants)
 
         # FÁZE 3b: Nahrazení slov z křestního jména (pro vietnamská/asijská jména kde je příjmení první)
         # Například: "Paní Nguyễn" kde "Nguyễn" je technicky v 'first', ale je to příjmení
-        for p in self.canonical_persons:
-            tag = self._ensure_person_tag(p['first'], p['last'])
+        for p in persons:
+            tag = p.tag
 
             # Rozděl křestní jméno na slova (např. "Nguyễn Thị" -> ["Nguyễn", "Thị"])
-            first_words = p['first'].split()
+            first_words = p.first.split()
 
             # Pro každé slovo z křestního jména (kromě velmi krátkých)
             for word in first_words:
@@ -1261,7 +3130,7 @@ class Anonymizer:
 
                 # Pokud slovo vypadá jako příjmení (velké písmeno na začátku, delší než 3 znaky)
                 if word[0].isupper() and len(word) >= 3:
-                    rx = re.compile(r'(?<!\w)' + re.escape(word) + r'(?!\w)', re.IGNORECASE)
+                    rx = word_regex_ci(word)
 
                     def repl3b(m):
                         surf = m.group(0)
@@ -1313,26 +3182,26 @@ class Anonymizer:
             # Pokud nenajdeme předchozí PERSON tag, nech to být
             return full_match
 
-        text = MAIDEN_NAME_RE.sub(maiden_name_repl, text)
+        if self._screened('maiden_name', 'paren' in features):
+            text = MAIDEN_NAME_RE.sub(maiden_name_repl, text)
 
         # FÁZE 3.7: Nahrazení samostatných křestních jmen (bez příjmení)
         # Příklad: "Petra uhradí Martinovi částku" → "[[PERSON_16]] uhradí [[PERSON_5]] částku"
-        for p in self.canonical_persons:
-            tag = self._ensure_person_tag(p['first'], p['last'])
+        for p in persons:
+            tag = p.tag
 
             # Generuj všechny pádové varianty křestního jména
-            first_variants = variants_for_first(p['first'])
+            first_variants = variants_for_first(p.first)
 
             # Také přidej varianty příjmení pro kontrolu
-            surname_variants = variants_for_surname(p['last'])
-            surname_variants_lower = {sv.lower() for sv in surname_variants if sv}
+            surname_variants = variants_for_surname(p.last)
 
-            for first_var in sorted(first_variants, key=len, reverse=True):
-                if not first_var or len(first_var) < 2:
+            for first_var in shadow_variants(first_variants):
+                if len(first_var) < 2 or not shadow_has(first_var):
                     continue
 
-                # Regex pro nalezení křestního jména jako samostatného slova
-                rx = re.compile(r'(?<!\w)' + re.escape(first_var) + r'(?!\w)', re.IGNORECASE)
+                # Stínový tvar křestního jména jako samostatné slovo
+                rx = shadow_word_regex(first_var)
 
                 def repl_first_with_context(m):
                     surf = m.group(0)
@@ -1349,9 +3218,15 @@ class Anonymizer:
 
                     # Pokud následuje nebo předchází příjmení této osoby, NENAHRAZUJ
                     # (je to součást plného jména, bude nahrazeno v FÁZI 1)
-                    if words_after and words_after[0].lower() in surname_variants_lower:
-                        return surf  # Plné jméno
-                    if words_before and words_before[-1].lower() in surname_variants_lower:
+                    next_to_surname = ((words_after and matches_variant(words_after[0], surname_variants))
+                                       or (words_before and matches_variant(words_before[-1], surname_variants)))
+                    if not matches_variant(surf, first_variants, ambiguous):
+                        # Nejednoznačný tvar bez diakritiky: jen vedle příjmení této osoby
+                        if not next_to_surname:
+                            return surf
+                        self._record_value(tag, surf)
+                        return preserve_case(surf, tag)
+                    if next_to_surname:
                         return surf  # Plné jméno
 
                     # DŮLEŽITÉ: Pokud existuje v širším kontextu (200 znaků zpět) PERSON tag
@@ -1365,8 +3240,8 @@ class Anonymizer:
                         nearest_tag = nearby_person_tags[-1].group(0)
 
                         # Zkontroluj, jestli tento tag obsahuje variantu našeho křestního jména
-                        if nearest_tag in self.tag_map:
-                            for val in self.tag_map[nearest_tag]:
+                        if nearest_tag in self.entities:
+                            for val in self.entities[nearest_tag]:
                                 # Extrahuj křestní jméno z hodnoty (první slovo)
                                 val_words = val.split()
                                 if val_words:
@@ -1381,16 +3256,16 @@ class Anonymizer:
                     self._record_value(tag, surf)
                     return preserve_case(surf, tag)
 
-                text = rx.sub(repl_first_with_context, text)
+                text = shadow_sub(rx, repl_first_with_context, first_variants)
 
         # FÁZE 4: Nahrazení samostatných přezdívek v textu (dále jen "Marty")
         # Propojíme je se známými osobami na základě přezdívky
-        for p in self.canonical_persons:
-            tag = self._ensure_person_tag(p['first'], p['last'])
+        for p in (self.canonical_persons if self._screened('nickname_ref', 'quote' in features) else ()):
+            tag = p.tag
 
             # Zkontroluj, zda osoba má přezdívku v hodnotách
             nicknames = set()
-            for val in self.tag_map.get(tag, []):
+            for val in self.entities.get(tag, []):
                 # Hledej přezdívky ve formátu 'Name "Nickname" Surname'
                 nick_match = NICKNAME_RE.search(val)
                 if nick_match:
@@ -1408,10 +3283,12 @@ class Anonymizer:
         return text
 
     def _replace_remaining_people(self, text: str) -> str:
-        text_no_titles = TITLES_RE.sub('', text)
+        # Dvojice se hledají v textu bez titulů, nahrazují se ale v původním textu:
+        # pozice shody se převedou zpět (jinak by "Ing. Petr Svoboda" přepsal jiný úsek)
+        text_no_titles, to_text = strip_titles(text)
         offset = 0
         for m in list(PAIR_RE.finditer(text_no_titles)):
-            s, e = m.start()+offset, m.end()+offset
+            s, e = to_text(m.start())+offset, to_text(m.end()-1)+1+offset
             seg = text[s:e]
             if seg.startswith('[[') and seg.endswith(']]'):
                 continue
@@ -1427,15 +3304,17 @@ class Anonymizer:
                 continue
 
             f_nom = infer_first_name_nominative(f_tok, l_tok) or f_tok
-            pre = text[max(0, s-160):s]
-            post = text[e:e+160]
-            has_ctx = CTX_PERSON.search(pre+post) or CTX_ROLE.search(pre+post) or CTX_LABEL.search(pre+post)
-
-            if (normalize_for_matching(f_nom) not in CZECH_FIRST_NAMES
-                and not (has_ctx and looks_like_firstname(f_tok))):
+            l_nom = infer_surname_nominative(l_tok)
+            if not self.plan.allows_person(f_nom, l_nom):
+                continue
+            score, features = self._score_person_candidate(f_tok, f_nom, text, s, e)
+            if score < PERSON_ACCEPT:
+                if score >= PERSON_REVIEW:
+                    self._add_review({'paragraph': self._paragraph, 'text': seg, 'score': score,
+                                      'features': features,
+                                      'context': text[max(0, s-40):e+40]})
                 continue
 
-            l_nom = infer_surname_nominative(l_tok)
             tag = self._ensure_person_tag(f_nom, l_nom)
             before = text
             text = text[:s] + preserve_case(seg, tag) + text[e:]
@@ -1443,6 +3322,47 @@ class Anonymizer:
             offset += len(text) - len(before)
         return text
 
+    def _score_person_candidate(self, f_tok: str, f_nom: str, text: str, s: int, e: int):
+        """
+        Skóre kandidáta (dvojice slov z PAIR_RE) a seznam příznaků, které přispěly.
+        Kaskáda (PERSON_CASCADE): po každém příznaku končí, jakmile je skóre nad prahem
+        přijetí, nebo už ani se zbylými příznaky nemůže dosáhnout pásma revize.
+        S self.cascade = False se vyhodnotí vždy všechny příznaky (stejné rozhodnutí).
+        """
+        def feature(name):
+            if name == 'names_library':
+                return normalize_for_matching(f_nom) in CZECH_FIRST_NAMES
+            if name == 'firstname_shape':
+                return looks_like_firstname(f_tok)
+            if name == 'table':
+                return self._in_table
+            pre, post = text[max(0, s-160):s], text[e:e+160]
+            return bool(CTX_PERSON.search(pre+post) or CTX_ROLE.search(pre+post) or CTX_LABEL.search(pre+post))
+
+        counts = self.stats.setdefault('cascade', {'candidates': 0, 'evaluated': {}, 'accepted': 0, 'review': 0})
+        counts['candidates'] += 1
+        score, hits = 0.0, []
+        remaining = sum(PERSON_WEIGHTS.values())
+        for name in PERSON_CASCADE:
+            if self.cascade and (score >= PERSON_ACCEPT or score + remaining < PERSON_REVIEW):
+                break
+            counts['evaluated'][name] = counts['evaluated'].get(name, 0) + 1
+            remaining -= PERSON_WEIGHTS[name]
+            if feature(name):
+                score += PERSON_WEIGHTS[name]
+                hits.append(name)
+        if score >= PERSON_ACCEPT:
+            counts['accepted'] += 1
+        elif score >= PERSON_REVIEW:
+            counts['review'] += 1
+        return score, hits
+
+    def _add_review(self, entry: dict):
+        """Nejistá detekce ponechaná v textu → report k revizi (v paralelním režimu přes žurnál)."""
+        self.review.append(entry)
+        if self._journal is not None:
+            self._journal.append(('review', entry))
+
     def _is_statute(self, text: str, s: int, e: int) -> bool:
         pre = text[max(0, s-20):s]
         post = text[e:e+10]
@@ -1454,13 +3374,46 @@ class Anonymizer:
             tag = self._get_or_create_tag(cat, v)
             self._record_value(tag, v)
             return tag
-        return rx.sub(repl, text)
+        return rx.sub(self._guard(repl), text)
+
+    def _guard(self, repl):
+        """Obalí repl detektoru: shoda obsahující výraz z whitelistu plánu zůstane beze změny."""
+        keep = self.plan.whitelist_re
+        if keep is None:
+            return repl
+        return lambda m: m.group(0) if keep.search(m.group(0)) else repl(m)
+
+    def _blacklist_repl(self, m):
+        v = m.group(0)
+        tag = self._get_or_create_tag(self.plan.blacklist[' '.join(v.lower().split())], v)
+        self._record_value(tag, v)
+        return tag
+
+    def anonymize_entities(self, text: str, features: Optional[frozenset] = None) -> str:
+        # Pre-screening: detektor běží jen v odstavci, kde jsou všechny jeho nutné příznaky
+        # (vložené tagy nové shody nevytvoří, takže stačí příznaky původního textu)
+        f = prescreen_features(text) if features is None else features
+        # Plán běhu: detektory vypnutých kategorií se přeskočí bez pre-screeningu
+        detectors, enabled = self.plan.detectors, self.plan.categories
+        counts = self.stats.setdefault('prescreen', {})
+        def gate(detector, *flags):
+            # = self._screened(), jen bez opakovaného hledání čítačů (volá se ~20x na řádek logu)
+            if detector not in detectors:
+                return False
+            possible = f.issuperset(flags)
+            c = counts.get(detector) or counts.setdefault(detector, {'run': 0, 'skipped': 0})
+            c['run' if possible else 'skipped'] += 1
+            return possible
 
-    def anonymize_entities(self, text: str) -> str:
         # KRITICKÁ OPRAVA: E-MAILY MUSÍ BÝT ÚPLNĚ PRVNÍ!
         # Jinak se jména v e-mailech (např. "martina.horáková@example.com") nahradí jako osoby
         # a zbyde "[[PERSON]].horáková@example.com"
-        text = self._replace_entity(text, EMAIL_RE, 'EMAIL')
+        if gate('EMAIL', 'at'):
+            text = self._replace_entity(text, EMAIL_RE, 'EMAIL')
+
+        # Uživatelský blacklist (co zakrýt vždy) - přednost před whitelistem i ostatními detektory
+        if self.plan.blacklist_re is not None:
+            text = self.plan.blacklist_re.sub(self._blacklist_repl, text)
 
         # SPECIÁLNÍ PŘÍPAD: "Jméno Příjmení, bytem Adresa" (např. v Svědcích)
         # Musí být PŘED zpracováním adres a osob!
@@ -1487,16 +3440,21 @@ class Anonymizer:
                 first_name = person_name
                 last_name = person_name
 
-            # Vytvoř tagy
-            person_tag = self._ensure_person_tag(first_name, last_name)
-            self._record_value(person_tag, person_name)
+            # Vytvoř tagy (osoba/adresa vypnutá plánem nebo na whitelistu zůstává v textu)
+            person_tag = person_name
+            if 'PERSON' in enabled and self.plan.allows_person(first_name, last_name):
+                person_tag = self._ensure_person_tag(first_name, last_name)
+                self._record_value(person_tag, person_name)
 
-            address_tag = self._get_or_create_tag('ADDRESS', address)
-            self._record_value(address_tag, address)
+            address_tag = address
+            if 'ADDRESS' in enabled:
+                address_tag = self._get_or_create_tag('ADDRESS', address)
+                self._record_value(address_tag, address)
 
             return f'{person_tag}, {bytem_prefix}{address_tag}'
 
-        text = PERSON_BYTEM_ADDRESS_RE.sub(person_bytem_repl, text)
+        if gate('PERSON_BYTEM', 'kw_bytem', 'digit', 'comma'):
+            text = PERSON_BYTEM_ADDRESS_RE.sub(self._guard(person_bytem_repl), text)
 
         # DŮLEŽITÉ: Adresy DRUHÉ! (po e-mailech, ale před osobami)
         # Jinak "Novákova 45" se detekuje jako jméno
@@ -1542,11 +3500,8 @@ class Anonymizer:
             tag = self._get_or_create_tag('ADDRESS', v)
             self._record_value(tag, v)
 
-            # Vrátit prefix + tag (zachování kontextu)
-            # Pokud prefix neobsahuje dvojtečku, přidej ji pro čitelnost
-            if prefix and not prefix.rstrip().endswith(':'):
-                prefix = prefix.rstrip() + ': '
-
+            # Vrátit prefix + tag (zachování kontextu); prefix zůstává, jak byl - text mimo
+            # tagy se nemění (kromě mezer), jinak by ho de-anonymizace neobnovila
             return prefix + tag
 
         # KRITICKÁ OPRAVA: Adresy s PSČ BEZ/S prefixem
@@ -1570,19 +3525,24 @@ class Anonymizer:
             self._record_value(tag, v_clean)
             # DŮLEŽITÉ: Vracíme prefix + tag, aby se kontext zachoval
             return prefix + tag
-        text = ADDRESS_WITH_ZIP_RE.sub(addr_with_zip_repl, text)
+        if gate('ADDRESS_ZIP', 'digit', 'comma', 'house_number'):
+            text = ADDRESS_WITH_ZIP_RE.sub(self._guard(addr_with_zip_repl), text)
 
         # Pak standardní formát "Ulice číslo, Město" S PREFIXEM
-        text = ADDRESS_RE.sub(addr_repl, text)
+        if gate('ADDRESS', 'digit', 'comma', 'house_number'):
+            text = ADDRESS_RE.sub(self._guard(addr_repl), text)
 
         # Pak obrácený formát "Město, Ulice číslo" (např. "Praha 1, Washingtonova 1621/11")
-        text = ADDRESS_REVERSE_RE.sub(addr_repl, text)
+        if gate('ADDRESS_REVERSE', 'digit', 'comma'):
+            text = ADDRESS_REVERSE_RE.sub(self._guard(addr_repl), text)
 
         # GDPR: SPZ/RZ (poznávací značky) jsou osobní identifikátory vozidla
-        text = self._replace_entity(text, LICENSE_PLATE_RE, 'LICENSE_PLATE')
+        if gate('LICENSE_PLATE', 'digit', 'ascii_upper'):
+            text = self._replace_entity(text, LICENSE_PLATE_RE, 'LICENSE_PLATE')
 
         # GDPR: VIN (Vehicle Identification Number) - 17-znakový kód vozidla
-        text = self._replace_entity(text, VIN_RE, 'VIN')
+        if 'VIN' in detectors and self._screened('VIN', 'digit' in f or 'ascii_upper' in f):
+            text = self._replace_entity(text, VIN_RE, 'VIN')
 
         # POZNÁMKA: E-maily jsou zpracovány na ZAČÁTKU funkce (před adresami a osobami)
 
@@ -1603,14 +3563,10 @@ class Anonymizer:
             self._record_value(tag, normalized)  # OPRAVA: Ukládat normalizovanou formu pro konzistenci
             return tag
 
-        text = DATE_RE.sub(date_repl, text)
+        if gate('DATE', 'digit', 'dot'):
+            text = DATE_RE.sub(self._guard(date_repl), text)
 
         # Datumy psané slovy ("13. srpna 2025") - konvertovat na DD.MM.RRRR
-        MONTH_MAP = {
-            'ledna': '01', 'února': '02', 'března': '03', 'dubna': '04',
-            'května': '05', 'června': '06', 'července': '07', 'srpna': '08',
-            'září': '09', 'října': '10', 'listopadu': '11', 'prosince': '12'
-        }
         def date_words_repl(m):
             original = m.group(0)  # Původní hodnota ("13. srpna 2025")
             day = m.group(1).zfill(2)  # 1 → 01
@@ -1624,7 +3580,8 @@ class Anonymizer:
             self._record_value(tag, normalized)  # OPRAVA: Ukládat normalizovanou formu pro eliminaci duplicit
             return tag
 
-        text = DATE_WORDS_RE.sub(date_words_repl, text)
+        if gate('DATE_WORDS', 'digit', 'dot', 'kw_month'):
+            text = DATE_WORDS_RE.sub(self._guard(date_words_repl), text)
 
         # GDPR: Místo narození (toponyma jsou PII)
         def birthplace_repl(m):
@@ -1642,22 +3599,26 @@ class Anonymizer:
             # Vrátit prefix + tag
             return prefix + tag
 
-        text = BIRTHPLACE_RE.sub(birthplace_repl, text)
+        if gate('PLACE', 'kw_birthplace'):
+            text = BIRTHPLACE_RE.sub(self._guard(birthplace_repl), text)
 
         def phone_repl(m):
             v = m.group(0)
             s, e = m.span()
             pre = text[max(0, s-15):s]
             if re.search(r'(OP|občansk\w+|č\.\s*OP)', pre, re.IGNORECASE):
+                if 'ID_CARD' not in enabled:
+                    return v
                 tag = self._get_or_create_tag('ID_CARD', v)
                 self._record_value(tag, v)
                 return tag
-            if re.match(r'^\s*/\d{4}', text[e:e+6]):
+            if re.match(r'^\s*/\d{4}', text[e:e+6]) or 'PHONE' not in enabled:
                 return v
             tag = self._get_or_create_tag('PHONE', v)
             self._record_value(tag, v)
             return tag
-        text = PHONE_RE.sub(phone_repl, text)
+        if gate('PHONE', 'digit'):
+            text = PHONE_RE.sub(self._guard(phone_repl), text)
 
         def acct_like(m):
             s, e = m.span()
@@ -1668,9 +3629,22 @@ class Anonymizer:
             # KRITICKÁ POLITIKA: Shape má přednost před labelem!
             # Pokud má tvar RČ (6 číslic / 3-4 číslice) → neanonymizuj zde
             # Nech to pro BIRTHID_RE který ho správně označí jako BIRTH_ID
-            if re.match(r'^\d{6}/\d{3,4}$', raw):
+            # Výjimka: nemožné datum RČ, platný součet účtu (základ 6 číslic/kód banky) a žádné
+            # návěští RČ → BANK níže
+            if re.match(r'^\d{6}/\d{3,4}$', raw) and not (
+                    self.validate and 'BANK' in enabled and not possible_birth_id(raw)
+                    and valid_cz_account(raw) and not CTX_BIRTH.search(text[max(0, s-30):e+30])):
                 return raw  # Vrátit bez změny, bude zpracováno jako BIRTH_ID
 
+            # Platný kontrolní součet účtu rozhodne bez čtení kontextu
+            if self.validate and 'BANK' in enabled:
+                if valid_cz_account(raw):
+                    self._validated('BANK', 'valid')
+                    tag = self._get_or_create_tag('BANK', raw)
+                    self._record_value(tag, raw)
+                    return tag
+                self._validated('BANK', 'ambiguous')
+
             pre = text[max(0, s-30):s]
             post = text[e:e+30]
 
@@ -1684,22 +3658,25 @@ class Anonymizer:
                 main_part = parts[0].replace('-', '')
                 bank_code = parts[1]
 
-                if len(main_part) >= 7 and len(bank_code) == 4:
+                if len(main_part) >= 7 and len(bank_code) == 4 and 'BANK' in enabled:
                     tag = self._get_or_create_tag('BANK', raw)
                     self._record_value(tag, raw)
                     return tag
 
             if CTX_BANK.search(pre+post):
+                if 'BANK' not in enabled:
+                    return raw
                 tag = self._get_or_create_tag('BANK', raw)
                 self._record_value(tag, raw)
                 return tag
-            if CTX_OP.search(pre+post):
+            if CTX_OP.search(pre+post) and 'ID_CARD' in enabled:
                 tag = self._get_or_create_tag('ID_CARD', raw)
                 self._record_value(tag, raw)
                 return tag
 
             return raw
-        text = ACCT_RE.sub(acct_like, text)
+        if gate('BANK', 'digit', 'slash'):
+            text = ACCT_RE.sub(self._guard(acct_like), text)
 
         # DŮLEŽITÉ: IČO a DIČ PŘED IDCARD_RE!
         # Jinak "CZ28547896" se detekuje jako ID_CARD místo DIČ
@@ -1708,11 +3685,13 @@ class Anonymizer:
         def ico_repl(m):
             full_match = m.group(0)
             ico_num = m.group(1)
+            # Návěští "IČO" je samo dost silný kontext - kontrolní součet tu nic nerozhoduje
             tag = self._get_or_create_tag('ICO', ico_num)
             self._record_value(tag, ico_num)
             # Replace just the number, keep the label
             return full_match.replace(ico_num, tag)
-        text = ICO_RE.sub(ico_repl, text)
+        if gate('ICO', 'kw_ico', 'digit'):
+            text = ICO_RE.sub(self._guard(ico_repl), text)
 
         # DIČ (Daňové identifikační číslo)
         def dic_repl(m):
@@ -1722,14 +3701,32 @@ class Anonymizer:
             self._record_value(tag, dic_num)
             # Replace just the number, keep the label
             return full_match.replace(dic_num, tag)
-        text = DIC_RE.sub(dic_repl, text)
+        if gate('DIC', 'kw_dic', 'digit'):
+            text = DIC_RE.sub(self._guard(dic_repl), text)
 
         # GDPR: IBAN (mezinárodní bankovní účet)
-        text = self._replace_entity(text, IBAN_RE, 'IBAN')
+        # Tvar IBAN_RE mají i kódy produktů a šarží: bez platného mod 97 rozhodne bankovní
+        # kontext nebo délka známé země (IBAN s překlepem); zbytek zůstane a jde k revizi
+        def iban_repl(m):
+            v = m.group(0)
+            if self.validate:
+                if valid_iban(v):
+                    self._validated('IBAN', 'valid')
+                else:
+                    s, e = m.span()
+                    if not (CTX_BANK.search(text[max(0, s-50):e+50]) or IBAN_LENGTHS.get(v[:2]) == len(v)):
+                        self._validated('IBAN', 'rejected')
+                        self._add_review({'paragraph': self._paragraph, 'text': v, 'category': 'IBAN',
+                                          'features': ['iban_shape'], 'context': text[max(0, s-40):e+40]})
+                        return v
+                    self._validated('IBAN', 'ambiguous')
+            tag = self._get_or_create_tag('IBAN', v)
+            self._record_value(tag, v)
+            return tag
+        if gate('IBAN', 'ascii_upper', 'digit'):
+            text = IBAN_RE.sub(self._guard(iban_repl), text)
 
         # GDPR: BIC/SWIFT (identifikátor banky) - s kontrolou kontextu
-        # KRITICKÁ OPRAVA: "SYNERGIE" není BIC, je to název projektu
-        BIC_BLACKLIST = {'synergie', 'project', 'projekt', 'alliance', 'aliance'}
         def bic_repl(m):
             v = m.group(1)  # BIC_RE má capturing group
             v_lower = v.lower()
@@ -1751,7 +3748,8 @@ class Anonymizer:
             # Pokud není bankovní kontext, neanonymizuj
             return m.group(0)
 
-        text = BIC_RE.sub(bic_repl, text)
+        if gate('BIC', 'ascii_upper'):
+            text = BIC_RE.sub(self._guard(bic_repl), text)
 
         def birth_or_id_repl(m):
             v = m.group(0)
@@ -1765,6 +3763,8 @@ class Anonymizer:
             # Normalizuj číslo (odstraň mezery kolem lomítka)
             v_normalized = re.sub(r'\s*/\s*', '/', v)
             if re.match(r'^\d{6}/\d{3,4}$', v_normalized):
+                if 'BIRTH_ID' not in enabled:
+                    return v
                 tag = self._get_or_create_tag('BIRTH_ID', v)
                 self._record_value(tag, v)
                 return tag
@@ -1774,20 +3774,24 @@ class Anonymizer:
 
             # 1. Kontrola kontextu "r.č." nebo "(r.č." - pokud je tam, je to BIRTH_ID
             if re.search(r'[\(\s]r\.?\s*č\.?\s*[:\)]?\s*$', pre, re.IGNORECASE):
-                tag = self._get_or_create_tag('BIRTH_ID', v)
+                cat = 'BIRTH_ID'
             # 2. Kontrola "Rodné číslo:" PŘED číslem
             elif CTX_BIRTH.search(pre):
-                tag = self._get_or_create_tag('BIRTH_ID', v)
+                cat = 'BIRTH_ID'
             # 3. Teprve pak kontroluj OP kontext
             elif CTX_OP.search(pre+post):
-                tag = self._get_or_create_tag('ID_CARD', v)
+                cat = 'ID_CARD'
             # 4. Default je BIRTH_ID (formát 6/3-4 je nejčastěji RČ)
             else:
-                tag = self._get_or_create_tag('BIRTH_ID', v)
+                cat = 'BIRTH_ID'
 
+            if cat not in enabled:
+                return v
+            tag = self._get_or_create_tag(cat, v)
             self._record_value(tag, v)
             return tag
-        text = BIRTHID_RE.sub(birth_or_id_repl, text)
+        if gate('BIRTH_ID', 'digit', 'slash'):
+            text = BIRTHID_RE.sub(self._guard(birth_or_id_repl), text)
 
         def id_repl(m):
             v = m.group(0)
@@ -1796,7 +3800,10 @@ class Anonymizer:
             # KRITICKÁ POLITIKA: Shape má přednost před labelem!
             # Pokud má tvar RČ (6 číslic / 3-4 číslice) → VŽDY [[BIRTH_ID_*]]
             # I když je kontext "Číslo OP:", fyzicky je to rodné číslo
-            if re.match(r'^\d{6}/\d{3,4}$', v):
+            cat = 'BIRTH_ID' if re.match(r'^\d{6}/\d{3,4}$', v) else 'ID_CARD'
+            if cat not in enabled:
+                return v
+            if cat == 'BIRTH_ID':
                 tag = self._get_or_create_tag('BIRTH_ID', v)
                 self._record_value(tag, v)
                 return tag
@@ -1805,7 +3812,8 @@ class Anonymizer:
             tag = self._get_or_create_tag('ID_CARD', v)
             self._record_value(tag, v)
             return tag
-        text = IDCARD_RE.sub(id_repl, text)
+        if gate('ID_CARD', 'digit'):
+            text = IDCARD_RE.sub(self._guard(id_repl), text)
 
         # Osobní číslo zaměstnance
         def emp_id_repl(m):
@@ -1815,143 +3823,1578 @@ class Anonymizer:
             self._record_value(tag, emp_num)
             # Replace just the number, keep the label
             return full_match.replace(emp_num, tag)
-        text = EMP_ID_RE.sub(emp_id_repl, text)
+        if gate('EMP_ID', 'kw_emp_id', 'digit'):
+            text = EMP_ID_RE.sub(self._guard(emp_id_repl), text)
 
         return text
 
-    def post_merge_person_tags(self, doc: Document):
-        key_to_tags = defaultdict(set)
-        for tag, vals in list(self.tag_map.items()):
+    def _validated(self, cat: str, outcome: str):
+        """Čítač kontrolních součtů ve stats['validators']: valid / ambiguous (rozhodl kontext) / rejected."""
+        counts = self.stats.setdefault('validators', {}).setdefault(cat, {'valid': 0, 'ambiguous': 0, 'rejected': 0})
+        counts[outcome] += 1
+
+    def _screened(self, detector: str, possible: bool) -> bool:
+        """Zaznamená výsledek pre-screeningu do stats['prescreen'] a vrátí, zda detektor spustit."""
+        counts = self.stats.setdefault('prescreen', {}).setdefault(detector, {'run': 0, 'skipped': 0})
+        counts['run' if possible else 'skipped'] += 1
+        return possible
+
+    def _merge_counts(self, counts: dict, into: Optional[dict] = None):
+        """Přičte (vnořené) čítače z workeru do self.stats (pre-screening, kaskáda)."""
+        into = self.stats if into is None else into
+        for key, value in counts.items():
+            if isinstance(value, dict):
+                self._merge_counts(value, into.setdefault(key, {}))
+            else:
+                into[key] = into.get(key, 0) + value
+
+    @property
+    def _in_table(self) -> bool:
+        return self._paragraph is not None and self._table_start is not None and self._paragraph >= self._table_start
+
+    def _anonymize_paragraph(self, raw: str, index: Optional[int] = None) -> str:
+        self._paragraph = index
+        txt = self._paragraph_text = clean_invisibles(raw)
+        cache = self.paragraph_cache
+        if cache is None or not txt.strip():
+            if self.templates is None or not txt.strip():
+                return self._paragraph_stages(txt)[0]
+            out = self._apply_template(txt)
+            if out is None:
+                out = self._paragraph_stages(txt)[0]
+                self.templates.observe(txt, out)
+            return out
+
+        key = cache.key(txt, self._paragraph_cache_salt())
+        entry = cache.get(key)
+        if entry is not None:
+            return self._replay_cached_paragraph(txt, *entry)
+        if self.templates is not None:
+            out = self._apply_template(txt)
+            if out is not None:
+                return out
+        counts = self.stats.setdefault('paragraph_cache', {'hits': 0, 'clean': 0, 'rechecked': 0,
+                                                           'misses': 0, 'stored': 0})
+        counts['misses'] += 1
+        # Žurnál jen tohoto odstavce (včetně nalezených tagů), do vnějšího žurnálu workeru se připojí
+        outer, trace = self._journal, []
+        self._journal = self._tag_trace = trace
+        try:
+            out, entity_text, persons_unchanged = self._paragraph_stages(txt)
+        finally:
+            self._journal, self._tag_trace = outer, None
+            if outer is not None:
+                outer.extend(ev for ev in trace if ev[0] != 'use')
+        if persons_unchanged and not any(ev[0] == 'person' for ev in trace):
+            cache.put(key, entity_text, trace)
+            counts['stored'] += 1
+        if self.templates is not None:
+            self.templates.observe(txt, out)
+        return out
+
+    def _apply_template(self, txt: str) -> Optional[str]:
+        """
+        Odstavec podle naučené šablony: detektory projdou jen hodnoty slotů (s kontextem
+        TEMPLATE_CONTEXT znaků pevného textu před nimi), osoby ve slotech se rozpoznají
+        přes známé osoby a fázi zbylých osob. Každý slot musí dát právě jeden tag kategorie
+        šablony, jinak vrací None a odstavec jde plným průchodem. Nakonec se celý výsledek
+        ještě projde známými osobami dokumentu (pevný text je bez osobních údajů jen obecně).
+        """
+        match = self.templates.match(txt)
+        counts = self.stats.setdefault('templates', {'matched': 0, 'fallback': 0, 'slots': 0})
+        if match is None:
+            return None
+        fixed, cats, values = match
+        persons = self.plan.persons
+        outs = [None] * len(values)
+        for k in sorted(range(len(values)), key=lambda k: (TEMPLATE_SLOT_ORDER.get(cats[k], -1), k)):
+            ctx = fixed[k][-TEMPLATE_CONTEXT:]
+            piece = ctx + values[k]
+            if cats[k] == 'PERSON':
+                if not persons:
+                    counts['fallback'] += 1
+                    return None
+                res = self._apply_known_people(piece, prefixes=word_prefixes(piece))
+                if res == piece:
+                    res = self._replace_remaining_people(res)
+            else:
+                res = self.anonymize_entities(piece)
+            tag = res[len(ctx):]
+            if (not res.startswith(ctx) or not TAG_RE.fullmatch(tag)
+                    or tag[2:-2].rsplit('_', 1)[0] != cats[k]):
+                counts['fallback'] += 1
+                return None
+            outs[k] = tag
+        counts['matched'] += 1
+        counts['slots'] += len(values)
+        out = fixed[0] + ''.join(tag + f for tag, f in zip(outs, fixed[1:]))
+        if persons and self.canonical_persons:
+            # sloty už jsou tagy - kandidáty na známé osoby dává jen pevný text
+            out = self._apply_known_people(out, prefixes=word_prefixes(' '.join(fixed)))
+        return out
+
+    def _paragraph_stages(self, txt: str):
+        """
+        Fáze odstavce: entity, známé osoby, zbylé osoby. Vrací (výstup, text po entitách,
+        zda fáze osob text nezměnily) - to poslední rozhoduje o uložení do cache odstavců.
+        """
+        persons = self.plan.persons
+        if self.prescreen:
+            features = prescreen_features(txt)
+            prefixes = word_prefixes(txt) if persons else None
+        else:
+            features, prefixes = PRESCREEN_ALL, None
+        # DŮLEŽITÉ: Adresy MUSÍ být anonymizovány PŘED osobami!
+        # Jinak "Novákova 45" končí jako "[[PERSON]] 45"
+        entity_text = txt = self.anonymize_entities(txt, features)  # Adresy, IČO, DIČ, telefony, emaily - PRVNÍ!
+        if not persons:
+            return txt, entity_text, True
+        txt = self._apply_known_people(txt, features, prefixes)  # Potom známé osoby
+        # Dvojice jmen (PAIR_RE) potřebují velké písmeno
+        if self._screened('remaining_person', 'upper' in features):
+            txt = self._replace_remaining_people(txt)  # Nakonec zbylé osoby
+        return txt, entity_text, txt == entity_text
+
+    def _paragraph_cache_salt(self) -> str:
+        """Část klíče cache odstavců: vše, na čem kromě textu a registru tagů závisí výsledek."""
+        plan = self.plan
+        if self._cache_salt[0] is not plan:
+            parts = (PARAGRAPH_CACHE_VERSION, detector_fingerprint(), sorted(plan.categories), plan.persons,
+                     plan.whitelist_re.pattern if plan.whitelist_re is not None else None,
+                     sorted(plan.person_whitelist), sorted(plan.blacklist.items()),
+                     names_fingerprint(CZECH_FIRST_NAMES))
+            self._cache_salt = (plan, repr(parts))
+        return f'{self._cache_salt[1]}|{self.validate}|{self._in_table}'
+
+    def _replay_cached_paragraph(self, txt: str, entity_text: str, journal: list) -> str:
+        """
+        Zásah v cache odstavců: přehraje žurnál entit do registru tohoto dokumentu
+        a znovu projde známé osoby (ty závisí na dokumentu). Pokud nějaká zabere,
+        doběhne i fáze zbylých osob, jinak je výsledek stejný jako v uloženém běhu.
+        """
+        counts = self.stats.setdefault('paragraph_cache', {'hits': 0, 'clean': 0, 'rechecked': 0,
+                                                           'misses': 0, 'stored': 0})
+        counts['hits'] += 1
+        reviews = [ev[1] for ev in journal if ev[0] == 'review']
+        mapping = self._replay_journal([ev for ev in journal if ev[0] != 'review'])
+        def remap(m):
+            return mapping.get(m.group(0), m.group(0))
+        out = TAG_RE.sub(remap, entity_text) if mapping else entity_text
+        if not journal and out == txt:
+            counts['clean'] += 1
+        if self.plan.persons:
+            if self.prescreen:
+                features, prefixes = prescreen_features(txt), word_prefixes(txt)
+            else:
+                features, prefixes = PRESCREEN_ALL, None
+            known = self._apply_known_people(out, features, prefixes)
+            if known != out:
+                counts['rechecked'] += 1
+                if self._screened('remaining_person', 'upper' in features):
+                    known = self._replace_remaining_people(known)
+                return known
+        for entry in reviews:
+            self._add_review(dict(entry, paragraph=self._paragraph,
+                                  context=TAG_RE.sub(remap, entry['context'])))
+        return out
+
+    def _anonymize_paragraphs_serial(self, items):
+        """Sekvenční průchod: items = [(index, raw)] → [(index, anonymizovaný text)]."""
+        return [(i, self._anonymize_paragraph(raw, i)) for i, raw in items]
+
+    def _shard_state_signature(self):
+        """
+        Otisk stavu, na kterém závisí zpracování dalších odstavců:
+        známé osoby, první slova hodnot PERSON tagů (FÁZE 3.7) a přezdívky (FÁZE 4).
+        """
+        sig = {('person', p.tag) for p in self.canonical_persons}
+        sig.add(('keys', len(self.person_index)))
+        for tag, vals in self.entities.items():
             if not tag.startswith('[[PERSON_'):
                 continue
             for v in vals:
-                m = PAIR_RE.search(v)
-                if not m:
-                    continue
-                f_nom = infer_first_name_nominative(m.group(1), m.group(2)) or m.group(1)
-                l_nom = infer_surname_nominative(m.group(2))
-                key = (normalize_for_matching(f_nom), normalize_for_matching(l_nom))
-                key_to_tags[key].add(tag)
-
-        redirect = {}
-        for key, tags in key_to_tags.items():
-            if len(tags) <= 1:
+                words = v.split()
+                if words:
+                    sig.add((tag, words[0].lower()))
+                nick = NICKNAME_RE.search(v)
+                if nick:
+                    sig.add((tag, 'nick', nick.group(2).lower()))
+        return frozenset(sig)
+
+    def _replay_journal(self, journal) -> dict:
+        """
+        Přehraje žurnál workeru do tohoto registru ve stejném pořadí, v jakém by
+        proběhl sekvenční běh. Vrací mapování provizorních tagů workeru na finální.
+        """
+        mapping = {}
+        for ev in journal:
+            kind, prov = ev[0], ev[1]
+            if kind in ('tag', 'use'):
+                mapping[prov] = self._get_or_create_tag(ev[2], ev[3])
+            elif kind == 'rec':
+                self._record_value(mapping.get(prov, prov), ev[2])
+            elif kind == 'person':
+                mapping[prov] = self._ensure_person_tag(ev[2], ev[3])
+            elif kind == 'review':
+                entry = dict(ev[1])
+                entry['context'] = TAG_RE.sub(lambda m: mapping.get(m.group(0), m.group(0)), entry['context'])
+                self.review.append(entry)
+        return mapping
+
+    @staticmethod
+    def _shard_delta_prefixes(journal, added) -> Optional[frozenset]:
+        """
+        Prefixy slov (jako word_prefixes), přes které může změna stavu po slití shardu
+        ovlivnit další odstavce: tvary nových osob ze žurnálu a nová první slova
+        a přezdívky PERSON hodnot (prvky `added` z _shard_state_signature).
+        None = nelze rozhodnout (tvar nezačíná písmenem), závisí na tom každý shard.
+        """
+        keys = set()
+        for ev in journal:
+            if ev[0] == 'person':
+                prefixes = person_prefixes(ev[2], ev[3])
+                if prefixes is None:
+                    return None
+                keys.update(prefixes)
+        for item in added:
+            if item[0] in ('person', 'keys'):
+                continue  # nové osoby a klíče pokrývají 'person' události žurnálu
+            m = WORD_RE.match(shadow_fold(item[-1]))
+            if not m:
+                return None
+            keys.add(m.group(0)[:3])
+        return frozenset(keys)
+
+    def _iter_paragraphs_parallel(self, items, jobs: int, shard_size: int, cancel=None):
+        """
+        Rozdělí odstavce do shardů a zpracuje je v process poolu.
+        Workery pracují s kopií globálního indexu osob a přidělují provizorní tagy;
+        finální čísla vznikají až při slévání shardů v pořadí dokumentu, takže
+        číslování je stejné jako při sekvenčním běhu. Pokud shard změní stav, na kterém
+        závisí další odstavce (nová osoba, nové tvary jmen), přepočítají se s aktualizovaným
+        stavem jen ty zbylé shardy, v jejichž textu je slovo s prefixem nového tvaru
+        (pro ostatní známé osoby pre-screening stejně přeskočí, výsledek by byl stejný).
+        Generátor: po každém slitém shardu vrací událost průběhu, výsledky
+        [(index, text)] jsou návratovou hodnotou (results = yield from ...).
+        """
+        import pickle
+        from concurrent.futures import ProcessPoolExecutor
+
+        shards = [items[k:k+shard_size] for k in range(0, len(items), shard_size)]
+        shard_prefixes = [frozenset().union(*(word_prefixes(raw) for _, raw in shard)) for shard in shards]
+        results = []
+        self.stats['parallel_shards'] = len(shards)
+        self.stats['parallel_rounds'] = 1
+        self.stats['parallel_resubmitted'] = 0
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            state = pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+            futures = {k: pool.submit(_anonymize_shard_worker, state, shard) for k, shard in enumerate(shards)}
+            try:
+                for k in range(len(shards)):
+                    _check_cancel(cancel)
+                    out, journal, counts = futures.pop(k).result()
+                    self._merge_counts(counts)
+                    before = self._shard_state_signature()
+                    mapping = self._replay_journal(journal)
+                    for i, txt in out:
+                        if mapping:
+                            txt = TAG_RE.sub(lambda m: mapping.get(m.group(0), m.group(0)), txt)
+                        results.append((i, txt))
+                    after = self._shard_state_signature()
+                    if after != before and futures:
+                        delta = self._shard_delta_prefixes(journal, after - before)
+                        stale = [j for j in futures if delta is None or not delta.isdisjoint(shard_prefixes[j])]
+                        if stale:
+                            self.stats['parallel_rounds'] += 1
+                            self.stats['parallel_resubmitted'] += len(stale)
+                            state = pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+                            for j in stale:
+                                futures[j].cancel()
+                                futures[j] = pool.submit(_anonymize_shard_worker, state, shards[j])
+                    yield self._progress('paragraphs', len(results), len(items))
+            finally:
+                for fut in futures.values():
+                    fut.cancel()
+        return results
+
+    def _renumber_by_position(self, paragraphs, pieces):
+        """
+        Dvoufázové číslování tagů: detekce proběhla s provizorními čísly, zde se z výstupu
+        sestaví fakta (kategorie, normalizovaná hodnota, první offset) a čísla se přidělí
+        podle pozice v dokumentu. Výsledek tak nezávisí na pořadí zpracování
+        (paralelní běh, cache, částečné přepočty).
+        """
+        starts, off = [], 0
+        for piece in pieces:
+            starts.append(off)
+            off += len(piece) + 1
+
+        # Fáze 1: fakta - první výskyt každého tagu ve výstupu
+        facts, approx = {}, []
+        for i, p in enumerate(paragraphs):
+            txt = get_text(p)
+            if '[[' not in txt:
                 continue
-            canon = sorted(tags)[0]
-            for t in tags:
-                if t != canon:
-                    redirect[t] = canon
-
-        if redirect:
-            for p in iter_paragraphs(doc):
-                txt = get_text(p)
-                new = txt
-                for src, dst in redirect.items():
-                    new = new.replace(src, dst)
+            for m in TAG_RE.finditer(txt):
+                tag = m.group(0)
+                if tag in facts:
+                    continue
+                # Offset v původním textu: první výskyt některé zaznamenané hodnoty v odstavci;
+                # bez nalezené hodnoty (např. normalizované DATE) jen začátek odstavce - hlásí se
+                hits = [h for h in (pieces[i].find(v) for v in self.entities.get(tag, ())) if h >= 0]
+                offset = starts[i] + (min(hits) if hits else 0)
+                if not hits:
+                    approx.append(tag)
+                facts[tag] = ((i, m.start()), tag[2:-2].rsplit('_', 1)[0], self.entities.norm(tag), offset)
+
+        # Fáze 2: číslování podle pozice (tagy bez výskytu ve výstupu až na konec, v pořadí vzniku;
+        # včetně tagů bez zaznamenané hodnoty, aby se žádné číslo nezdvojilo)
+        def old_number(tag):
+            return int(tag[2:-2].rsplit('_', 1)[1])
+        ordered = sorted(facts, key=lambda t: facts[t][0])
+        ordered += sorted((t for t in self.entities.all_tags() if t not in facts), key=old_number)
+        mapping, numbers = {}, defaultdict(int)
+        for tag in ordered:
+            cat = tag[2:-2].rsplit('_', 1)[0]
+            numbers[cat] += 1
+            mapping[tag] = f'[[{cat}_{numbers[cat]}]]'
+
+        self._apply_tag_mapping(paragraphs, mapping)
+        self.first_offsets = {mapping.get(t, t): f[3] for t, f in facts.items()}
+        self.approx_offsets = sorted(mapping.get(t, t) for t in approx)
+        if approx:
+            self.stats['approx_offsets'] = len(approx)
+            if self.verbose:
+                print(f"⚠️  {len(approx)} tagů bez nalezené hodnoty v odstavci - první offset je začátek odstavce")
+
+    def _relabel(self, paragraphs):
+        """Přejmenování kategorií podle plánu ([[PERSON_3]] → [[UŽIVATEL_3]]) v textu i v mapě."""
+        labels = self.plan.labels
+        mapping = {}
+        for tag in self.entities.all_tags():
+            cat, number = tag[2:-2].rsplit('_', 1)
+            if cat in labels:
+                mapping[tag] = f'[[{labels[cat]}_{number}]]'
+        self._apply_tag_mapping(paragraphs, mapping)
+        for entry in self.review:
+            entry['context'] = TAG_RE.sub(lambda m: mapping.get(m.group(0), m.group(0)), entry['context'])
+
+    def _apply_tag_mapping(self, paragraphs, mapping: dict):
+        """Přepíše tagy {starý: nový} v odstavcích, v registru entit i v indexech osob."""
+        def remap(tag):
+            return mapping.get(tag, tag)
+
+        for p in paragraphs:
+            txt = get_text(p)
+            if '[[' in txt:
+                new = TAG_RE.sub(lambda m: remap(m.group(0)), txt)
                 if new != txt:
                     set_text(p, new)
 
-            for src, dst in redirect.items():
-                if src in self.tag_map:
-                    for v in self.tag_map[src]:
-                        if v not in self.tag_map[dst]:
-                            self.tag_map[dst].append(v)
-                    del self.tag_map[src]
-
-    def anonymize_docx(self, input_path: str, output_path: str, json_map: str, txt_map: str):
-        doc = Document(input_path)
-        pieces = []
-        for p in iter_paragraphs(doc):
-            pieces.append(clean_invisibles(get_text(p)))
-        self.source_text = '\n'.join(pieces)
-
-        # KRITICKÁ OPRAVA: Před detekcí osob DOČASNĚ nahradit e-maily placeholdery
-        # Jinak se jména v e-mailech (např. "martina.horáková@example.com") detekují jako osoby
-        text_for_person_detection = EMAIL_RE.sub('__EMAIL_PLACEHOLDER__', self.source_text)
+        self.entities.renumber(mapping)
+        self.person_index = {k: remap(t) for k, t in self.person_index.items()}
+        self.person_variants = {remap(t): v for t, v in self.person_variants.items()}
+        self.person_aliases = defaultdict(list, ((remap(t), v) for t, v in self.person_aliases.items()))
+        for p in self.canonical_persons:
+            p.tag = remap(p.tag)
+        self.first_offsets = {remap(t): o for t, o in self.first_offsets.items()}
+        self.approx_offsets = sorted(remap(t) for t in self.approx_offsets)
+
+    def _map_meta(self) -> dict:
+        """
+        Doplňková data mapy (<mapa>.meta.json, v NDJSON hlavička): první offsety entit,
+        tagy, jejichž offset je jen začátek odstavce, a sloučené identity osob.
+        """
+        meta = {}
+        if self.first_offsets:
+            meta['first_offsets'] = {tag: self.first_offsets[tag] for tag in sorted(self.first_offsets)}
+        if self.approx_offsets:
+            meta['approx_offsets'] = self.approx_offsets
+        # Tvar každého výskytu (index hodnoty) - jen u tagů, kde některý výskyt není kanonická hodnota
+        occurrences = {tag: idx for tag, idx in self.occurrences.items() if any(idx)}
+        if occurrences:
+            meta['occurrences'] = {tag: occurrences[tag] for tag in sorted(occurrences)}
+        if self.person_aliases:
+            meta['aliases'] = {tag: self.person_aliases[tag] for tag in sorted(self.person_aliases)}
+        return meta
+
+    def _progress(self, phase: str, done: int = 0, total: int = 0) -> dict:
+        """Událost průběhu: fáze, hotovo/celkem a průběžné počty entit."""
+        return {
+            'phase': phase,
+            'done': done,
+            'total': total,
+            'entities': sum(self.counter.values()),
+            'persons': len(self.canonical_persons),
+        }
 
-        self._extract_persons_to_index(text_for_person_detection)
+    def anonymize_docx(self, input_path: str, output_path: str, json_map: str, txt_map: str,
+                       jobs: int = 1, shard_size: int = 200, verify_parallel: bool = False,
+                       numbering: str = 'discovery', progress=None, cancel=None,
+                       incremental_save: bool = True, ndjson_map: Optional[str] = None,
+                       review_report: Optional[str] = None, max_memory: Optional[int] = None,
+                       extract_chunk: int = EXTRACT_CHUNK, extract_overlap: int = EXTRACT_OVERLAP):
+        """
+        Blokující varianta iter_anonymize_docx(). Volitelný callback progress(event)
+        dostává události průběhu; cancel (např. threading.Event) umožní běh přerušit.
+        """
+        for event in self.iter_anonymize_docx(input_path, output_path, json_map, txt_map,
+                                              jobs=jobs, shard_size=shard_size,
+                                              verify_parallel=verify_parallel,
+                                              numbering=numbering, cancel=cancel,
+                                              incremental_save=incremental_save,
+                                              ndjson_map=ndjson_map, review_report=review_report,
+                                              max_memory=max_memory, extract_chunk=extract_chunk,
+                                              extract_overlap=extract_overlap):
+            if progress is not None:
+                progress(event)
+
+    async def aiter_anonymize_docx(self, *args, cancel=None, **kwargs):
+        """
+        Asynchronní iterace událostí průběhu pro asyncio (např. backend Electron UI).
+        Vlastní práce běží v thread executoru, event loop se neblokuje. Ukončení
+        iterace (break, zrušení tasku) nastaví cancel a počká na doběhnutí vlákna.
+        """
+        import asyncio, threading
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        cancel = cancel if cancel is not None else threading.Event()
+        end = object()
+
+        def run():
+            try:
+                for event in self.iter_anonymize_docx(*args, cancel=cancel, **kwargs):
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+            except BaseException as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, end)
+
+        worker = loop.run_in_executor(None, run)
+        try:
+            while True:
+                event = await queue.get()
+                if event is end:
+                    break
+                if isinstance(event, BaseException):
+                    raise event
+                yield event
+        finally:
+            cancel.set()
+            await asyncio.wait({worker})
+
+    def iter_anonymize_docx(self, input_path: str, output_path: str, json_map: str, txt_map: str,
+                            jobs: int = 1, shard_size: int = 200, verify_parallel: bool = False,
+                            numbering: str = 'discovery', cancel=None, incremental_save: bool = True,
+                            ndjson_map: Optional[str] = None, review_report: Optional[str] = None,
+                            max_memory: Optional[int] = None, extract_chunk: int = EXTRACT_CHUNK,
+                            extract_overlap: int = EXTRACT_OVERLAP):
+        """
+        Generátorová varianta anonymize_docx(): vrací události průběhu po fázích
+        (load, extract, paragraphs - po odstavcích, postprocess, save, done).
+        ndjson_map: volitelně navíc kompaktní mapa (viz write_ndjson_map).
+        review_report: volitelně JSON s nejistými detekcemi ponechanými v textu.
+        max_memory: strop paměti v MB - text dokumentu jde do dočasného souboru
+        (SpillText), registr entit do SQLite na disku (DiskEntityStore) a osoby
+        se hledají po úsecích textu; běží vždy sekvenčně.
+        extract_chunk / extract_overlap: úseky pro detekci osob (viz
+        _extract_persons_chunked), používají se jen s max_memory - s jobs > 1 proti
+        jednomu průchodu nic nezrychlí (převažuje sekvenční zakládání osob).
+        Kooperativní zrušení: pokud cancel.is_set(), vyhodí AnonymizationCancelled
+        a nic nezapíše.
+        """
+        if max_memory and jobs > 1:
+            print("⚠️  Režim s omezenou pamětí běží sekvenčně (--jobs se ignoruje)")
+            jobs = 1
+        store = None
+        if max_memory and not isinstance(self.entities, DiskEntityStore) and not self.counter:
+            # Cache SQLite dostane čtvrtinu stropu, zbytek zůstává na strom python-docx
+            store = self.entities = DiskEntityStore(cache_kib=max_memory * 256)
 
-        for p in iter_paragraphs(doc):
-            raw = get_text(p)
-            if not raw.strip():
+        try:
+            yield self._progress('load')
+            doc = Document(input_path)
+            cleaned = (clean_invisibles(get_text(p)) for p in iter_paragraphs(doc))
+            if max_memory:
+                pieces = self.source_text = SpillText(cleaned)
+            else:
+                pieces = list(cleaned)
+                self.source_text = '\n'.join(pieces)
+            self._paragraph_text = None  # případný odstavec předchozího dokumentu
+            _check_cancel(cancel)
+
+            yield self._progress('extract')
+            # Osoby z blacklistu plánu jako známé osoby (nahradí se ve všech pádech);
+            # s vypnutou kategorií PERSON se detekce osob vůbec nespouští
+            for first, last in self.plan.seed_persons:
+                self._ensure_person_tag(first, last)
+            if self.plan.persons and max_memory:
+                self._extract_persons_chunked(pieces, 1, extract_chunk, extract_overlap, cancel)
+            elif self.plan.persons:
+                # KRITICKÁ OPRAVA: Před detekcí osob DOČASNĚ nahradit e-maily placeholdery
+                # Jinak se jména v e-mailech (např. "martina.horáková@example.com") detekují jako osoby
+                text_for_person_detection = EMAIL_RE.sub('__EMAIL_PLACEHOLDER__', self.source_text)
+                self._extract_persons_to_index(text_for_person_detection)
+            _check_cancel(cancel)
+
+            paragraphs = list(iter_paragraphs(doc))
+            # iter_paragraphs vrací nejdřív odstavce těla, pak odstavce buněk tabulek
+            self._table_start = len(doc.paragraphs)
+            items = []
+            for i, p in enumerate(paragraphs):
+                raw = get_text(p)
+                if raw.strip():
+                    items.append((i, raw))
+
+            yield self._progress('paragraphs', 0, len(items))
+            if jobs > 1 and len(items) > shard_size:
+                reference = None
+                if verify_parallel:
+                    import copy
+                    reference = copy.deepcopy(self)
+                results = yield from self._iter_paragraphs_parallel(items, jobs, shard_size, cancel)
+                if reference is not None:
+                    serial = reference._anonymize_paragraphs_serial(items)
+                    identical = (serial == results
+                                 and reference.entities.snapshot() == self.entities.snapshot()
+                                 and dict(reference.counter) == dict(self.counter))
+                    self.stats['parallel_verified'] = identical
+                    if not identical:
+                        print("⚠️  Paralelní výstup se liší od sekvenčního - používám sekvenční výsledek")
+                        self.__dict__.update(reference.__dict__)
+                        results = serial
+            else:
+                # Sekvenčně se výsledek zapisuje rovnou do odstavce (bez mezikopie všech výstupů)
+                results = []
+                for done, (i, raw) in enumerate(items, 1):
+                    _check_cancel(cancel)
+                    txt = self._anonymize_paragraph(raw, i)
+                    if txt != raw:
+                        set_text(paragraphs[i], txt)
+                    yield self._progress('paragraphs', done, len(items))
+
+            yield self._progress('postprocess')
+            for (i, txt), (_, raw) in zip(results, items):
+                if txt != raw:
+                    set_text(paragraphs[i], txt)
+
+            # Volitelně: čísla tagů podle pozice v dokumentu místo pořadí objevení
+            if numbering == 'position':
+                self._renumber_by_position(paragraphs, pieces)
+            if self.plan.labels:
+                self._relabel(paragraphs)
+
+            # Post-processing: Normalizace mezer kolem tagů (kosmetika pro enterprise reports)
+            # Zajistí správné mezery: "Tel.:[[PHONE]]" → "Tel.: [[PHONE]]", "[[EMAIL]],[[PHONE]]" → "[[EMAIL]], [[PHONE]]"
+            # Ve stejném průchodu se zaznamená původní tvar každého výskytu tagu (de-anonymizace)
+            self.occurrences = defaultdict(list)
+            # Automat END-SCAN nad celou mapou a finální text v RAM by strop --max-memory nedodržely
+            final = [] if self.leak_scan and not max_memory else None
+            for i, p in enumerate(iter_paragraphs(doc)):
+                txt = get_text(p)
+                if '[[' in txt:
+                    # Oprava: ":" následované tagem bez mezery → přidat mezeru
+                    txt = re.sub(r':(\[\[)', r': \1', txt)
+                    # Oprava: "." následované tagem bez mezery → přidat mezeru (tel.[[PHONE]])
+                    txt = re.sub(r'\.(\[\[)', r'. \1', txt)
+                    # Oprava: "," následované tagem bez mezery → přidat mezeru ([[EMAIL]],[[PHONE]])
+                    txt = re.sub(r',(\[\[)', r', \1', txt)
+                    # Oprava: více mezer kolem tagů → jedna mezera
+                    txt = re.sub(r'\s{2,}', ' ', txt)
+                    set_text(p, txt)
+                    self._record_surfaces(pieces[i], txt)
+                if final is not None:
+                    final.append(txt)
+
+            # END-SCAN: mapa je teď úplná (včetně tvarů výskytů), automat z ní projde finální text
+            if final is not None:
+                scanner = LeakScanner(self.entities)
+                self.leaks, leaks = [], 0
+                for i, txt in enumerate(final):
+                    leaks += self._record_leaks(scanner, txt, i)
+                self.stats['leak_scan'] = {'patterns': len(scanner), 'leaks': leaks}
+            elif self.leak_scan:
+                self.stats['leak_scan'] = {'skipped': 'max_memory'}
+
+            _check_cancel(cancel)
+            yield self._progress('save')
+            if incremental_save:
+                try:
+                    save_docx_incremental(doc, input_path, output_path)
+                except (ValueError, OSError) as e:
+                    print(f"⚠️  Inkrementální zápis DOCX selhal ({e}) - ukládám celý balíček")
+                    doc.save(output_path)
+            else:
+                doc.save(output_path)
+
+            meta = self._map_meta()
+            write_json_map(json_map, self.entities, meta)
+            write_txt_map(txt_map, self.entities, self.person_aliases)
+            if ndjson_map:
+                write_ndjson_map(ndjson_map, self.entities, meta)
+            if review_report:
+                with open(review_report, 'w', encoding='utf-8') as f:
+                    json.dump({'accept': PERSON_ACCEPT, 'review': PERSON_REVIEW, 'weights': PERSON_WEIGHTS,
+                               'items': self.review, 'leaks': self.leaks}, f, ensure_ascii=False, indent=2)
+            if max_memory:
+                peak = _peak_rss_mb()
+                if peak is not None:
+                    self.stats['peak_rss_mb'] = round(peak)
+                    if peak > max_memory:
+                        print(f"⚠️  Špičková paměť {peak:.0f} MB překročila strop {max_memory} MB")
+            yield self._progress('done')
+        finally:
+            # Dočasné soubory režimu s omezenou pamětí se uvolní i při chybě nebo zrušení;
+            # registr entit pak zůstává jen v zapsaných mapách
+            if isinstance(self.source_text, SpillText):
+                self.source_text.close()
+                self.source_text = ''
+            if store is not None:
+                store.close()
+
+    def _record_surfaces(self, original: str, anonymized: str):
+        """
+        Tvar, který měl v originálu každý výskyt tagu v odstavci: doplní ho mezi hodnoty
+        tagu (mapa pak pokrývá i rodná příjmení, přezdívky, slovní data) a jeho index
+        zapíše do self.occurrences v pořadí dokumentu. Odstavec, který na originál
+        nesedí, se přeskočí (de-anonymizace tam použije kanonickou hodnotu).
+        """
+        tags = TAG_RE.findall(anonymized)
+        surfaces = tag_surfaces(original, anonymized)
+        if surfaces is None:
+            m = _roundtrip_pattern(anonymized, self.entities, capture=True).fullmatch(original)
+            surfaces = m.groups() if m else None
+        if surfaces is None:
+            self.stats['surfaces_unmatched'] = self.stats.get('surfaces_unmatched', 0) + 1
+            for tag in tags:
+                self.occurrences[tag].append(0)
+            return
+        for tag, surface in zip(tags, surfaces):
+            surface = ' '.join(surface.split())
+            # i tag bez zaznamenané hodnoty (hodnota nebyla celé slovo, např. "PD_789456123")
+            if surface not in self.entities.get(tag, ()):
+                self.entities.add(tag, surface)
+            self.occurrences[tag].append(list(self.entities[tag]).index(surface))
+
+    def _record_leaks(self, scanner: 'LeakScanner', text: str, index, unit: str = 'paragraph') -> int:
+        """
+        Úniky v jednom výstupním odstavci (buňce, řádku, ... - unit z LEAK_UNITS) do self.leaks
+        (celkem nejvýše LEAK_REPORT_LIMIT záznamů s pozicí, offsetem a tagem); vrací počet
+        nalezených výskytů.
+        """
+        hits = scanner.scan(text)
+        for start, end, tag in hits[:LEAK_REPORT_LIMIT - len(self.leaks)]:
+            self.leaks.append({unit: index, 'offset': start, 'tag': tag, 'text': text[start:end]})
+        return len(hits)
+
+    def _scan_spool(self, spool: 'LeakSpool', unit: str):
+        """END-SCAN streamovaného režimu: odložený výstup proti úplné mapě; spool zavře."""
+        try:
+            scanner = LeakScanner(self.entities)
+            self.leaks, leaks = [], 0
+            for where, text in spool:
+                leaks += self._record_leaks(scanner, text, where, unit)
+            self.stats['leak_scan'] = {'patterns': len(scanner), 'leaks': leaks}
+        finally:
+            spool.close()
+
+    # ---------- XLSX ----------
+    def _xlsx_column_fn(self, cat: Optional[str]):
+        """
+        Detektor jednoho sloupce: buňka typovaného sloupce je celá jedna entita (jedno
+        vyhledání v registru, posledních XLSX_CELL_CACHE hodnot se pamatuje pro opakování),
+        sloupec bez typu (None) jde celým řetězcem _anonymize_paragraph jako odstavec.
+        """
+        if cat is not None and cat not in self.plan.categories:
+            return lambda value: value
+        if cat is None:
+            def text_cell(value):
+                if not isinstance(value, str) or not value.strip() or value.startswith('='):
+                    return value  # čísla, data a vzorce volného sloupce zůstávají
+                return self._label_tags(self._anonymize_paragraph(value))
+            return text_cell
+
+        keep = self.plan.whitelist_re
+        cache = OrderedDict()
+        def typed_cell(value):
+            v = xlsx_cell_text(value)
+            if not v or (isinstance(value, str) and value.startswith('=')):
+                return value
+            tag = cache.get(v)
+            if tag is not None:
+                cache.move_to_end(v)
+                return tag
+            plausible = (any(ch.isdigit() for ch in v) if cat in XLSX_NEEDS_DIGIT
+                         else '@' in v if cat == 'EMAIL' else any(ch.isalpha() for ch in v))
+            if not plausible or (keep is not None and keep.search(v)):
+                return value  # "neuvedeno", "-" apod. nebo whitelist
+            self._paragraph_text = v
+            if cat == 'PERSON':
+                # Tituly zůstávají kolem tagu jako v textu dokumentu ("Ing. [[PERSON_1]], Ph.D.")
+                name = v
+                while (m := TITLES_RE.match(name)):
+                    name = name[m.end():]
+                m = TITLE_SUFFIX_RE.search(name)
+                suffix = m.group(0) if m else ''
+                name = name[:len(name) - len(suffix)]
+                title = v[:len(v) - len(name) - len(suffix)]
+                # Čárka mimo tituly odděluje "Příjmení, Jméno" (exporty z HR systémů a Outlooku)
+                last, comma, first = name.partition(',')
+                firsts, lasts = (first.split(), last.split()) if comma else (name.split()[:-1], name.split()[-1:])
+                if firsts and lasts:
+                    first, last = ' '.join(firsts), ' '.join(lasts)
+                    if not self.plan.allows_person(first, last):
+                        return value
+                    tag = self._ensure_person_tag(first, last)
+                    if comma:
+                        self._record_value(tag, name.strip())
+                elif firsts or lasts:
+                    tag = self._get_or_create_tag('PERSON', ' '.join(firsts or lasts))
+                else:
+                    return value
+                tag = title + tag + suffix
+            elif cat == 'DATE' and DATE_RE.fullmatch(v):
+                day, month, year = re.split(r'[.\s]+', v)
+                v = f'{day.zfill(2)}.{month.zfill(2)}.{year}'
+                tag = self._get_or_create_tag('DATE', v)
+            else:
+                tag = self._get_or_create_tag(cat, v)
+            tag = cache[v] = self._label_tags(tag)
+            if len(cache) > XLSX_CELL_CACHE:
+                cache.popitem(last=False)
+            return tag
+        return typed_cell
+
+    def _label_tags(self, text: str) -> str:
+        """Přejmenování štítků plánu v hotovém textu (streamovaný výstup, číslování se nemění)."""
+        labels = self.plan.labels
+        if not labels or '[[' not in text:
+            return text
+        def rename(m):
+            cat, number = m.group(0)[2:-2].rsplit('_', 1)
+            return f'[[{labels[cat]}_{number}]]' if cat in labels else m.group(0)
+        return TAG_RE.sub(rename, text)
+
+    def anonymize_xlsx(self, input_path: str, output_path: str, json_map: str, txt_map: str,
+                       ndjson_map: Optional[str] = None, sample_rows: int = 50, progress=None, cancel=None):
+        """Blokující varianta iter_anonymize_xlsx() (progress a cancel jako u anonymize_docx)."""
+        for event in self.iter_anonymize_xlsx(input_path, output_path, json_map, txt_map,
+                                              ndjson_map=ndjson_map, sample_rows=sample_rows,
+                                              cancel=cancel):
+            if progress is not None:
+                progress(event)
+
+    def iter_anonymize_xlsx(self, input_path: str, output_path: str, json_map: str, txt_map: str,
+                            ndjson_map: Optional[str] = None, sample_rows: int = 50, cancel=None):
+        """
+        Anonymizace sešitu .xlsx (seznamy nájemníků, mzdové listy) se stejným registrem
+        tagů a mapami jako anonymize_docx. Listy se čtou i zapisují po řádcích
+        (openpyxl read_only / write_only): první neprázdný řádek je záhlaví, z něj
+        a z prvních sample_rows řádků se určí typ každého sloupce (infer_column_type)
+        a buňky typovaného sloupce se nahradí jediným detektorem (_xlsx_column_fn).
+        Přenáší se jen hodnoty buněk - formátování, sloučené buňky a šířky sloupců ne.
+        Textové buňky výstupu se odkládají (LeakSpool) a END-SCAN je projde po posledním listu.
+        Události průběhu: load, rows (po 1000 řádcích), save, done.
+        """
+        try:
+            from openpyxl import Workbook, load_workbook
+            from openpyxl.utils import get_column_letter
+        except ImportError:
+            raise RuntimeError("Pro .xlsx je potřeba balíček openpyxl (pip install openpyxl)")
+
+        yield self._progress('load')
+        source = load_workbook(input_path, read_only=True, data_only=False)
+        target = Workbook(write_only=True)
+        total = sum(ws.max_row or 0 for ws in source.worksheets)
+        self.source_text = ''
+        self._paragraph_text = None
+        columns, done = {}, 0
+        spool = LeakSpool() if self.leak_scan else None
+        for ws in source.worksheets:
+            out = target.create_sheet(ws.title)
+            rows = ws.iter_rows(values_only=True)
+            header = next((r for r in rows if any(v is not None for v in r)), None)
+            if header is None:
                 continue
-            txt = clean_invisibles(raw)
-            # DŮLEŽITÉ: Adresy MUSÍ být anonymizovány PŘED osobami!
-            # Jinak "Novákova 45" končí jako "[[PERSON]] 45"
-            txt = self.anonymize_entities(txt)  # Adresy, IČO, DIČ, telefony, emaily - PRVNÍ!
-            txt = self._apply_known_people(txt)  # Potom známé osoby
-            txt = self._replace_remaining_people(txt)  # Nakonec zbylé osoby
-            if txt != raw:
-                set_text(p, txt)
-
-        self.post_merge_person_tags(doc)
-
-        # Post-processing: Normalizace mezer kolem tagů (kosmetika pro enterprise reports)
-        # Zajistí správné mezery: "Tel.:[[PHONE]]" → "Tel.: [[PHONE]]", "[[EMAIL]],[[PHONE]]" → "[[EMAIL]], [[PHONE]]"
-        for p in iter_paragraphs(doc):
-            txt = get_text(p)
-            if '[[' in txt:
-                # Oprava: ":" následované tagem bez mezery → přidat mezeru
-                txt = re.sub(r':(\[\[)', r': \1', txt)
-                # Oprava: "." následované tagem bez mezery → přidat mezeru (tel.[[PHONE]])
-                txt = re.sub(r'\.(\[\[)', r'. \1', txt)
-                # Oprava: "," následované tagem bez mezery → přidat mezeru ([[EMAIL]],[[PHONE]])
-                txt = re.sub(r',(\[\[)', r', \1', txt)
-                # Oprava: více mezer kolem tagů → jedna mezera
-                txt = re.sub(r'\s{2,}', ' ', txt)
-                set_text(p, txt)
-
-        doc.save(output_path)
-
-        data = OrderedDict((tag, self.tag_map[tag]) for tag in sorted(self.tag_map.keys()))
-        with open(json_map, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        
-        with open(txt_map, 'w', encoding='utf-8') as f:
-            sections = [
-                ("OSOBY", "PERSON"),
-                ("RODNÁ ČÍSLA", "BIRTH_ID"),
-                ("IČO", "ICO"),
-                ("DIČ", "DIC"),
-                ("OSOBNÍ ČÍSLA ZAMĚSTNANCŮ", "EMP_ID"),
-                ("BANKOVNÍ ÚČTY", "BANK"),
-                ("IBAN", "IBAN"),
-                ("BIC/SWIFT", "BIC"),
-                ("TELEFONY", "PHONE"),
-                ("EMAILY", "EMAIL"),
-                ("OBČANSKÉ PRŮKAZY", "ID_CARD"),
-                ("POZNÁVACÍ ZNAČKY (SPZ/RZ)", "LICENSE_PLATE"),
-                ("VIN (VOZIDLA)", "VIN"),
-                ("DATA", "DATE"),
-                ("ADRESY", "ADDRESS"),
-                ("MÍSTA NAROZENÍ", "PLACE"),
-            ]
-            for title, pref in sections:
-                items = []
-                for tag, vals in sorted(self.tag_map.items()):
-                    if tag.startswith(f'[[{pref}_'):
-                        if pref == "PERSON" and len(vals) > 0:
-                            # Pro PERSON: první hodnota je kanonická, zbytek jsou varianty
-                            canonical = vals[0]
-                            items.append(f"{tag}: {canonical}")
-                            if len(vals) > 1:
-                                variants = vals[1:]
-                                # Přidej varianty s odsazením
-                                for v in variants:
-                                    items.append(f"  - {v}")
-                        else:
-                            # Pro ostatní kategorie: standardní formát
-                            for v in vals:
-                                items.append(f"{tag}: {v}")
-                if items:
-                    f.write(f"{title}\n{'-'*len(title)}\n")
-                    f.write("\n".join(items) + "\n\n")
+            out.append(header)
+            sample = []
+            for row in rows:
+                sample.append(row)
+                if len(sample) >= sample_rows:
+                    break
+            width = max([len(header)] + [len(r) for r in sample])
+            types = [infer_column_type(header[j] if j < len(header) else None,
+                                       [r[j] for r in sample if j < len(r)]) for j in range(width)]
+            columns[ws.title] = {xlsx_cell_text(header[j]) if j < len(header) and header[j] is not None
+                                 else f'#{j + 1}': types[j] or 'TEXT' for j in range(width)}
+            fns = [self._xlsx_column_fn(cat) for cat in types]
+            line = 1  # číslo řádku ve výstupním listu (záhlaví = 1)
+            for row in itertools.chain(sample, rows):
+                new = [fns[j](v) if j < width else v for j, v in enumerate(row)]
+                out.append(new)
+                line += 1
+                if spool is not None:
+                    for j, v in enumerate(new):
+                        if v.__class__ is str:
+                            spool.add(f'{ws.title}!{get_column_letter(j + 1)}{line}', v)
+                done += 1
+                if done % 1000 == 0:
+                    _check_cancel(cancel)
+                    yield self._progress('rows', done, total)
+        source.close()
+        self.stats['xlsx_columns'] = columns
+        self.stats['xlsx_rows'] = done
+        yield self._progress('rows', done, total)
+
+        _check_cancel(cancel)
+        yield self._progress('save')
+        target.save(output_path)
+        if self.plan.labels:
+            self._relabel([])
+        if spool is not None:
+            self._scan_spool(spool, 'cell')
+        meta = self._map_meta()
+        write_json_map(json_map, self.entities, meta)
+        write_txt_map(txt_map, self.entities, self.person_aliases)
+        if ndjson_map:
+            write_ndjson_map(ndjson_map, self.entities, meta)
+        yield self._progress('done')
+
+    # ---------- SQLite ----------
+    def anonymize_sqlite(self, db_path: str, columns: dict, output_path: Optional[str] = None,
+                         json_map: Optional[str] = None, txt_map: Optional[str] = None,
+                         ndjson_map: Optional[str] = None, map_table: Optional[str] = 'anon_map',
+                         batch: int = 5000, sample_rows: int = 50, max_memory: Optional[int] = None,
+                         progress=None, cancel=None):
+        """Blokující varianta iter_anonymize_sqlite() (progress a cancel jako u anonymize_docx)."""
+        for event in self.iter_anonymize_sqlite(db_path, columns, output_path=output_path,
+                                                json_map=json_map, txt_map=txt_map, ndjson_map=ndjson_map,
+                                                map_table=map_table, batch=batch, sample_rows=sample_rows,
+                                                max_memory=max_memory, cancel=cancel):
+            if progress is not None:
+                progress(event)
+
+    def _sqlite_table_columns(self, conn, table: str, wanted: list) -> list:
+        """Vybrané sloupce tabulky (ověřené proti PRAGMA table_info); prázdný výběr = textové sloupce."""
+        info = conn.execute(f"PRAGMA table_info({sqlite_ident(table)})").fetchall()
+        if not info:
+            raise ValueError(f"Tabulka {table!r} v databázi není")
+        names = [row[1] for row in info]
+        if not wanted:
+            # afinita TEXT podle pravidel SQLite (CHAR, CLOB, TEXT) nebo sloupec bez typu
+            return [row[1] for row in info
+                    if not row[2] or any(t in row[2].upper() for t in ('CHAR', 'CLOB', 'TEXT'))]
+        missing = [c for c in wanted if c not in names]
+        if missing:
+            raise ValueError(f"Tabulka {table!r} nemá sloupce: {', '.join(missing)}")
+        return list(wanted)
+
+    def iter_anonymize_sqlite(self, db_path: str, columns: dict, output_path: Optional[str] = None,
+                              json_map: Optional[str] = None, txt_map: Optional[str] = None,
+                              ndjson_map: Optional[str] = None, map_table: Optional[str] = 'anon_map',
+                              batch: int = 5000, sample_rows: int = 50, max_memory: Optional[int] = None,
+                              cancel=None):
+        """
+        Anonymizace vybraných sloupců SQLite databáze ({tabulka: [sloupce]}, viz
+        parse_sqlite_columns; prázdný výběr = textové sloupce všech tabulek). S output_path se nejdřív pořídí kopie (backup API po
+        stránkách) a upravuje se ta, jinak se přepisuje databáze na místě.
+        Řádky se čtou po dávkách podle rowid (WHERE rowid > poslední LIMIT batch - v paměti
+        je vždy jen jedna dávka, kurzor nezůstává otevřený přes zápisy) a změněné řádky
+        každé dávky se zapíšou jednou transakcí (executemany UPDATE ... WHERE rowid = ?).
+        Typ sloupce se určí ze jména a prvních sample_rows hodnot jako u XLSX
+        (infer_column_type, _xlsx_column_fn); BLOBy a NULL zůstávají.
+        Mapa se na konci zapíše do vedlejší tabulky map_table (None = nezapisovat)
+        a případně do souborů json_map/txt_map/ndjson_map.
+        max_memory: strop paměti v MB - registr entit jde do SQLite na disku (DiskEntityStore);
+        indexy osob (tvary jmen pro hledání ve volném textu) zůstávají v paměti a rostou
+        s počtem různých osob. END-SCAN (textové hodnoty vybraných sloupců odložené
+        v LeakSpool) se s max_memory přeskočí - automat nad celou mapou by strop nedodržel.
+        Události průběhu: load, rows (po dávkách), save, done.
+        """
+        import sqlite3, time
+
+        store = None
+        if max_memory and not isinstance(self.entities, DiskEntityStore) and not self.counter:
+            # Cache SQLite dostane čtvrtinu stropu, zbytek zůstává na dávky řádků a indexy osob
+            store = self.entities = DiskEntityStore(cache_kib=max_memory * 256)
+        yield self._progress('load')
+        if output_path:
+            src = sqlite3.connect(db_path)
+            conn = sqlite3.connect(output_path)
+            try:
+                src.backup(conn, pages=1024)
+            finally:
+                src.close()
+        else:
+            conn = sqlite3.connect(db_path)
+        self.source_text = ''
+        self._paragraph_text = None
+        spool = LeakSpool() if self.leak_scan and not max_memory else None
+        try:
+            if not columns:
+                columns = {row[0]: [] for row in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+                    if row[0] != map_table}
+            plan = [(table, self._sqlite_table_columns(conn, table, cols)) for table, cols in columns.items()]
+            total = sum(conn.execute(f"SELECT count(*) FROM {sqlite_ident(t)}").fetchone()[0]
+                        for t, cols in plan if cols)
+            types, done, updated = {}, 0, 0
+            started = time.perf_counter()
+            for table, cols in plan:
+                if not cols:
+                    continue
+                name = sqlite_ident(table)
+                select = (f"SELECT rowid, {', '.join(sqlite_ident(c) for c in cols)} FROM {name} "
+                          f"WHERE rowid > ? ORDER BY rowid LIMIT ?")
+                update = (f"UPDATE {name} SET {', '.join(sqlite_ident(c) + ' = ?' for c in cols)} "
+                          f"WHERE rowid = ?")
+                try:
+                    sample = conn.execute(select, (-2 ** 63, sample_rows)).fetchall()
+                except sqlite3.OperationalError as e:
+                    raise ValueError(f"Tabulku {table!r} nelze číst po rowid (WITHOUT ROWID?): {e}")
+                cats = [infer_column_type(c, [r[j + 1] for r in sample if not isinstance(r[j + 1], bytes)])
+                        for j, c in enumerate(cols)]
+                types[table] = {c: cat or 'TEXT' for c, cat in zip(cols, cats)}
+                fns = [self._xlsx_column_fn(cat) for cat in cats]
+                last = -2 ** 63
+                while True:
+                    _check_cancel(cancel)
+                    rows = conn.execute(select, (last, batch)).fetchall()
+                    if not rows:
+                        break
+                    changes = []
+                    for rowid, *values in rows:
+                        new = [v if v is None or isinstance(v, bytes) else fn(v) for fn, v in zip(fns, values)]
+                        if new != values:
+                            changes.append((*new, rowid))
+                        if spool is not None:
+                            for c, v in zip(cols, new):
+                                if v.__class__ is str:
+                                    spool.add(f'{table}.{c}[rowid {rowid}]', v)
+                    if changes:
+                        with conn:
+                            conn.executemany(update, changes)
+                    last = rows[-1][0]
+                    done += len(rows)
+                    updated += len(changes)
+                    yield self._progress('rows', done, total)
+            elapsed = time.perf_counter() - started
+            self.stats['sqlite_columns'] = types
+            self.stats['sqlite_rows'] = done
+            self.stats['sqlite_updated'] = updated
+            self.stats['sqlite_rows_per_s'] = round(done / elapsed) if elapsed else done
+
+            _check_cancel(cancel)
+            yield self._progress('save')
+            if self.plan.labels:
+                self._relabel([])
+            if spool is not None:
+                self._scan_spool(spool, 'value')
+                spool = None
+            elif self.leak_scan:
+                self.stats['leak_scan'] = {'skipped': 'max_memory'}
+            if map_table:
+                with conn:
+                    write_sqlite_map(conn, map_table, self.entities)
+            meta = self._map_meta()
+            if json_map:
+                write_json_map(json_map, self.entities, meta)
+            if txt_map:
+                write_txt_map(txt_map, self.entities, self.person_aliases)
+            if ndjson_map:
+                write_ndjson_map(ndjson_map, self.entities, meta)
+            if max_memory:
+                peak = _peak_rss_mb()
+                if peak is not None:
+                    self.stats['peak_rss_mb'] = round(peak)
+                    if peak > max_memory:
+                        print(f"⚠️  Špičková paměť {peak:.0f} MB překročila strop {max_memory} MB")
+        finally:
+            conn.close()
+            if spool is not None:
+                spool.close()
+            if store is not None:
+                store.close()
+        yield self._progress('done')
+
+    # ---------- Filtr po řádcích (logy, NDJSON) ----------
+    def _anonymize_json_value(self, value):
+        """Řetězce vybrané hodnoty NDJSON záznamu (i vnořené v seznamech a objektech)."""
+        if isinstance(value, str):
+            return self._label_tags(self._anonymize_paragraph(value)) if value.strip() else value
+        if isinstance(value, list):
+            return [self._anonymize_json_value(v) for v in value]
+        if isinstance(value, dict):
+            return {k: self._anonymize_json_value(v) for k, v in value.items()}
+        return value
+
+    def anonymize_line(self, line: str, fields=()) -> str:
+        """
+        Jeden řádek logu (bez konce řádku) jako odstavec. S fields (cesty jako tuple klíčů,
+        ('user', 'name')) se řádek čte jako JSON objekt a anonymizují se jen vybraná pole;
+        řádek, který JSON objektem není, se pro jistotu anonymizuje celý.
+        """
+        if fields:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict):
+                for *parents, leaf in fields:
+                    node = record
+                    for key in parents:
+                        node = node.get(key) if isinstance(node, dict) else None
+                    if isinstance(node, dict) and leaf in node:
+                        node[leaf] = self._anonymize_json_value(node[leaf])
+                return _compact_json(record)
+        return self._label_tags(self._anonymize_paragraph(line))
+
+    def _write_stream_maps(self, json_map, txt_map, ndjson_map):
+        """Mapy průběžně i na konci filtru; zápis přes dočasný soubor, čtenář nevidí půlku mapy."""
+        if self.plan.labels:
+            self._relabel([])
+        meta = self._map_meta()
+        for path, write in ((json_map, lambda f: write_json_map(f, self.entities, meta)),
+                            (txt_map, lambda f: write_txt_map(f, self.entities, self.person_aliases)),
+                            (ndjson_map, lambda f: write_ndjson_map(f, self.entities, meta))):
+            if path:
+                tmp = Path(f'{path}.tmp')
+                write(tmp)
+                tmp.replace(path)
+
+    def anonymize_stream(self, lines, out, json_map: Optional[str] = None, txt_map: Optional[str] = None,
+                         ndjson_map: Optional[str] = None, fields=(), flush_lines: int = 1000,
+                         map_every: int = 0, cancel=None) -> int:
+        """
+        Filtr po řádcích (stdin → stdout pro logy a NDJSON exporty): každý řádek prochází
+        anonymize_line, tagy a osoby jsou společné pro celý proud (osoba nalezená v jednom
+        řádku se nahrazuje i v dalších). Výstup se vyprázdní po flush_lines řádcích,
+        mapy se zapíšou na konci a s map_every > 0 i průběžně po tolika řádcích.
+        Výstupní řádky se odkládají (LeakSpool) a END-SCAN je projde po posledním řádku.
+        fields = tečkové cesty polí NDJSON ('msg', 'user.name'). Vrací počet řádků.
+        """
+        paths = [tuple(f.split('.')) for f in fields]
+        self.source_text = ''
+        self._paragraph_text = None
+        spool = LeakSpool() if self.leak_scan else None
+        done = 0
+        for raw in lines:
+            line = raw.rstrip('\r\n')
+            eol = raw[len(line):]
+            if line.strip():
+                line = self.anonymize_line(line, paths)
+            out.write(line + eol)
+            done += 1
+            if spool is not None:
+                spool.add(done, line)
+            if done % flush_lines == 0:
+                out.flush()
+                _check_cancel(cancel)
+            if map_every and done % map_every == 0:
+                self._write_stream_maps(json_map, txt_map, ndjson_map)
+        out.flush()
+        self.stats['stream_lines'] = done
+        if spool is not None:
+            self._scan_spool(spool, 'line')
+        self._write_stream_maps(json_map, txt_map, ndjson_map)
+        return done
+
+    # ---------- E-maily (.eml, mbox) ----------
+    def _mail_display_name(self, name: str) -> str:
+        """
+        Zobrazované jméno adresy jako osoba ("Jan Novák", "Novák Jan", "Nováková, Petra",
+        tituly zůstávají před tagem); co jako jméno nevypadá ("Podpora Firma s.r.o."),
+        projde detektory jako text.
+        """
+        self._paragraph_text = name
+        core = name
+        while (m := TITLES_RE.match(core)):
+            core = core[m.end():]
+        title = name[:len(name) - len(core)]
+        # Pořadí slov rozhoduje knihovna křestních jmen (Outlook často píše "Příjmení Jméno")
+        known = lambda w: normalize_for_matching(w) in CZECH_FIRST_NAMES
+        last, comma, first = core.partition(',')
+        words = core.split()
+        if comma and len(last.split()) == 1 and len(first.split()) == 1 and known(first.strip()):
+            first, last = first.strip(), last.strip()
+        elif len(words) >= 2 and known(words[0]):
+            first, last = ' '.join(words[:-1]), words[-1]
+        elif len(words) == 2 and known(words[1]):
+            first, last = words[1], words[0]
+        else:
+            return self._label_tags(self._anonymize_paragraph(name))
+        if not self.plan.persons or not self.plan.allows_person(first, last):
+            return name
+        tag = self._ensure_person_tag(first, last)
+        self._record_value(tag, core)
+        return title + self._label_tags(tag)
+
+    def _anonymize_mail_headers(self, msg):
+        """Adresní hlavičky po adresách (jméno → osoba, adresa → EMAIL) a Subject jako text."""
+        emails = 'EMAIL' in self.plan.categories
+        keep = self.plan.whitelist_re
+        for name in MAIL_ADDRESS_HEADERS:
+            values = msg.get_all(name)
+            if not values:
+                continue
+            new = []
+            for header in values:
+                parts = []
+                for addr in getattr(header, 'addresses', ()):
+                    # _mail_display_name může odstavec přepnout na samotné jméno
+                    self._paragraph_text = str(header)
+                    spec = addr.addr_spec
+                    if emails and EMAIL_RE.fullmatch(spec) and not (keep is not None and keep.search(spec)):
+                        # tag není platná adresa - v uvozovkách ji parser přečte jako local-part
+                        spec = '"' + self._label_tags(self._get_or_create_tag('EMAIL', spec)) + '"'
+                    display = self._mail_display_name(addr.display_name) if addr.display_name else ''
+                    if display:
+                        display = '"' + display.replace('\\', '\\\\').replace('"', '\\"') + '"'
+                    parts.append(f'{display} <{spec}>' if display else spec)
+                new.append(', '.join(parts) if parts else str(header))
+            if new != [str(v) for v in values]:
+                _replace_header_values(msg, name, new)
+        for name in MAIL_TEXT_HEADERS:
+            value = msg.get(name)
+            if value:
+                anonymized = self._label_tags(self._anonymize_paragraph(str(value)))
+                if anonymized != str(value):
+                    msg.replace_header(name, anonymized)
+
+    def _anonymize_mail_attachment(self, part, tmp: Path, spool=None, where: str = '') -> bool:
+        """
+        DOCX příloha přes iter_anonymize_docx (stejný registr tagů); vrací, zda se změnila.
+        END-SCAN přílohy proběhne až se schránkou: odstavce výstupu jdou do spool.
+        """
+        src, out = tmp / 'attachment.docx', tmp / 'attachment_anon.docx'
+        src.write_bytes(part.get_content())
+        scan, self.leak_scan = self.leak_scan, False
+        try:
+            for _ in self.iter_anonymize_docx(str(src), str(out), str(tmp / 'map.json'), str(tmp / 'map.txt')):
+                pass
+        finally:
+            self.leak_scan = scan
+        self.source_text, self._paragraph_text = '', None
+        if spool is not None:
+            for i, p in enumerate(iter_paragraphs(Document(str(out)))):
+                spool.add(f'{where} ({part.get_filename()}, odstavec {i})', get_text(p))
+        data = out.read_bytes()
+        if data == src.read_bytes():
+            return False
+        part.set_content(data, part.get_content_maintype(), part.get_content_subtype(),
+                         disposition='attachment', filename=part.get_filename())
+        return True
+
+    def _collect_mail_text(self, part, items: list) -> list:
+        """
+        Rozdělí textovou část na úseky: text/plain po odstavcích (prázdný řádek), text/html
+        na text mezi značkami (s dekódovanými entitami); úseky oddělené jen inline značkami
+        (b, span, a, ...) tvoří jeden odstavec. Neprázdné odstavce přidá do items;
+        vrací [část, html, úseky, [(pozice úseků odstavce, index v items)]].
+        """
+        text = part.get_content()
+        html = part.get_content_subtype() == 'html'
+        pieces = (HTML_TAG_RE if html else MAIL_PARAGRAPH_RE).split(text)
+        groups = [[0]]
+        for k in range(2, len(pieces), 2):  # liché pozice jsou značky / oddělovače
+            if html and HTML_INLINE_RE.fullmatch(pieces[k - 1]):
+                groups[-1].append(k)
+            else:
+                groups.append([k])
+        slots = []
+        for group in groups:
+            raw = ''.join(html_unescape(pieces[k]) if html else pieces[k] for k in group)
+            if raw.strip():
+                slots.append((group, len(items)))
+                items.append((len(items), raw))
+        return [part, html, pieces, slots]
+
+    @staticmethod
+    def _spool_mail(spool: 'LeakSpool', where: str, msg):
+        """Výstupní zpráva pro END-SCAN: adresní hlavičky, Subject a text těl (HTML bez značek)."""
+        for name in MAIL_ADDRESS_HEADERS + MAIL_TEXT_HEADERS:
+            for value in msg.get_all(name) or ():
+                spool.add(f'{where} ({name})', str(value))
+        for part in msg.walk():
+            if (part.is_multipart() or part.is_attachment() or part.get_content_maintype() != 'text'
+                    or part.get_content_subtype() not in ('plain', 'html')):
+                continue
+            text = part.get_content()
+            if part.get_content_subtype() == 'html':
+                # inline značky slovo nerozdělují ("Nov<b>á</b>k"), blokové ano
+                text = ''.join(html_unescape(piece) if k % 2 == 0 else
+                               '' if HTML_INLINE_RE.fullmatch(piece) else ' '
+                               for k, piece in enumerate(HTML_TAG_RE.split(text)))
+            spool.add(f'{where} ({part.get_content_type()})', text)
+
+    def anonymize_mailbox(self, input_path: str, output_path: str, json_map: str, txt_map: str,
+                          ndjson_map: Optional[str] = None, jobs: int = 1, shard_size: int = 200,
+                          batch: int = 500, progress=None, cancel=None):
+        """Blokující varianta iter_anonymize_mailbox() (progress a cancel jako u anonymize_docx)."""
+        for event in self.iter_anonymize_mailbox(input_path, output_path, json_map, txt_map,
+                                                 ndjson_map=ndjson_map, jobs=jobs, shard_size=shard_size,
+                                                 batch=batch, cancel=cancel):
+            if progress is not None:
+                progress(event)
+
+    def iter_anonymize_mailbox(self, input_path: str, output_path: str, json_map: str, txt_map: str,
+                               ndjson_map: Optional[str] = None, jobs: int = 1, shard_size: int = 200,
+                               batch: int = 500, cancel=None):
+        """
+        Anonymizace e-mailů: jedna zpráva .eml nebo schránka mbox (čte se po zprávách,
+        iter_mbox). Hlavičky From/To/Cc/... po adresách, Subject a těla text/plain
+        a text/html jako odstavce, přílohy DOCX přes iter_anonymize_docx; ostatní přílohy
+        zůstávají bajtově shodné. Zapsané zprávy (hlavičky, těla, odstavce příloh) se odkládají
+        (LeakSpool) a END-SCAN je projde po poslední zprávě. Zprávy jdou po dávkách (batch): nejdřív hlavičky a přílohy
+        dávky (sekvenčně - zakládají známé osoby), pak odstavce těl sekvenčně nebo s jobs > 1
+        v process poolu (_iter_paragraphs_parallel, tagy shodné se sekvenčním během).
+        Události průběhu: load, messages (po dávkách), save, done.
+        """
+        import email, io, tempfile
+        from email import policy
+        from email.generator import BytesGenerator
+
+        yield self._progress('load')
+        is_mbox = not input_path.lower().endswith('.eml')
+        messages = iter_mbox(input_path) if is_mbox else iter([(None, Path(input_path).read_bytes())])
+        self.source_text = ''
+        self._paragraph_text = None
+        # Nezměněné hlavičky se zapíšou tak, jak byly (bez přeformátování)
+        base = policy.default.clone(refold_source='none', mangle_from_=is_mbox)
+        done = docx = 0
+        spool = LeakSpool() if self.leak_scan else None
+        with open(output_path, 'wb') as out, tempfile.TemporaryDirectory() as d:
+            tmp = Path(d)
+            while True:
+                chunk = list(itertools.islice(messages, batch))
+                if not chunk:
+                    break
+                parsed, items, texts = [], [], []
+                for n, (envelope, raw) in enumerate(chunk, done + 1):
+                    _check_cancel(cancel)
+                    pol = base.clone(linesep='\r\n') if b'\r\n' in raw[:2000] else base
+                    msg = email.message_from_bytes(raw, policy=pol)
+                    parsed.append((envelope, msg, pol))
+                    self._anonymize_mail_headers(msg)
+                    for part in msg.walk():
+                        if part.is_multipart():
+                            continue
+                        filename = part.get_filename()
+                        if filename and filename.lower().endswith('.docx'):
+                            docx += self._anonymize_mail_attachment(part, tmp, spool, str(n))
+                        elif (part.get_content_maintype() == 'text' and not part.is_attachment()
+                              and part.get_content_subtype() in ('plain', 'html')):
+                            texts.append(self._collect_mail_text(part, items))
+
+                if jobs > 1 and len(items) > shard_size:
+                    # přehrávaný žurnál ověřuje hodnoty proti source_text (jako u DOCX celý text)
+                    self.source_text = '\n'.join(t for _, t in items)
+                    results = dict((yield from self._iter_paragraphs_parallel(items, jobs, shard_size, cancel)))
+                    self.source_text = ''
+                else:
+                    results = {}
+                    for i, raw in items:
+                        results[i] = self._anonymize_paragraph(raw, i)
+                for part, html, pieces, slots in texts:
+                    changed = False
+                    for group, i in slots:
+                        if results[i] == items[i][1]:
+                            continue
+                        chunks = [html_unescape(pieces[k]) if html else pieces[k] for k in group]
+                        outs = split_tagged(chunks, results[i]) if len(group) > 1 else [results[i]]
+                        if outs is None:
+                            # výskyty tagů nejdou rozdělit - celý odstavec do prvního úseku
+                            outs = [results[i]] + [''] * (len(group) - 1)
+                        for k, chunk, txt in zip(group, chunks, outs):
+                            if txt != chunk:
+                                txt = self._label_tags(txt)
+                                pieces[k] = html_escape(txt, quote=False) if html else txt
+                                changed = True
+                    if changed:
+                        part.set_content(''.join(pieces), subtype=part.get_content_subtype(),
+                                         charset='utf-8')
+
+                for n, (envelope, msg, pol) in enumerate(parsed, done + 1):
+                    if spool is not None:
+                        self._spool_mail(spool, str(n), msg)
+                    if envelope is not None:
+                        out.write(envelope)
+                    # as_bytes() řádky "From " v tělech neescapuje - mbox by se rozpadl
+                    buf = io.BytesIO()
+                    BytesGenerator(buf, mangle_from_=is_mbox, policy=pol).flatten(msg)
+                    data = buf.getvalue()
+                    out.write(data)
+                    if is_mbox:
+                        out.write(b'' if data.endswith(b'\n') else b'\n')
+                        out.write(b'\n')
+                done += len(chunk)
+                yield self._progress('messages', done)
+
+        self.stats['mail_messages'] = done
+        self.stats['mail_docx_attachments'] = docx
+        _check_cancel(cancel)
+        yield self._progress('save')
+        if self.plan.labels:
+            self._relabel([])
+        if spool is not None:
+            self._scan_spool(spool, 'message')
+        meta = self._map_meta()
+        write_json_map(json_map, self.entities, meta)
+        write_txt_map(txt_map, self.entities, self.person_aliases)
+        if ndjson_map:
+            write_ndjson_map(ndjson_map, self.entities, meta)
+        yield self._progress('done')
+
+# =============== Paralelní zpracování (shardy) ===============
+def _anonymize_shard_worker(state: bytes, shard):
+    """Worker process poolu: zpracuje shard odstavců nad kopií stavu a vrátí výstupy + žurnál."""
+    import pickle
+    a = pickle.loads(state)
+    a._journal = []
+    a.stats = {}
+    out = a._anonymize_paragraphs_serial(shard)
+    if a.paragraph_cache is not None:
+        a.paragraph_cache.close()
+    return out, a._journal, {k: v for k, v in a.stats.items()
+                             if k in ('prescreen', 'cascade', 'validators', 'paragraph_cache')}
+
+def _batch_document_worker(job):
+    """
+    Jeden dokument dávky (--batch) s cache odstavců sdílenou přes soubor a případně
+    s knihovnou šablon ze souboru; vrací (cesta, čítače cache a šablon, tagů, chyba, knihovna).
+    """
+    path, cache_path, config, ndjson_map, templates_path = job
+    path = Path(path)
+    a = Anonymizer(verbose=False)
+    a.paragraph_cache = ParagraphCache(cache_path)
+    base = path.parent / path.stem
+    try:
+        if config:
+            a.plan = RunPlan.from_file(config)
+        if templates_path:
+            a.templates = (TemplateLibrary.load(templates_path) if Path(templates_path).exists()
+                           else TemplateLibrary())
+        a.anonymize_docx(str(path), f"{base}_anon.docx", f"{base}_map.json", f"{base}_map.txt",
+                         ndjson_map=f"{base}_map.ndjson" if ndjson_map else None)
+    except Exception as e:
+        return str(path), {}, 0, f"{type(e).__name__}: {e}", None
+    finally:
+        a.paragraph_cache.close()
+    counts = {k: a.stats[k] for k in ('paragraph_cache', 'templates', 'leak_scan') if k in a.stats}
+    return str(path), counts, sum(a.counter.values()), None, a.templates
+
+def _title_chunk_worker(job):
+    window, base, lo, hi = job
+    return [(s + base, e + base) for s, e in title_spans(window, lo, hi)]
+
+def _person_chunk_worker(job):
+    window, base, lo, hi, titles, nt_offset, context, context_offset = job
+    return [(phase, pos + base, f_nom, l_nom) for phase, pos, f_nom, l_nom
+            in person_candidates(window, lo, hi, titles, nt_offset, context, context_offset)]
+
+def _ordered_map(fn, jobs, workers: int, cancel=None):
+    """
+    Výsledky fn(job) v pořadí jobs; s workers > 1 v process poolu s nejvýše
+    2 × workers rozpracovanými úlohami (vstupy se negenerují všechny naráz).
+    """
+    if workers <= 1:
+        for job in jobs:
+            _check_cancel(cancel)
+            yield fn(job)
+        return
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for job in jobs:
+            pending.append(pool.submit(fn, job))
+            if len(pending) >= 2 * workers:
+                _check_cancel(cancel)
+                yield pending.popleft().result()
+        while pending:
+            _check_cancel(cancel)
+            yield pending.popleft().result()
+
+def _print_progress(event: dict):
+    # Jeden JSON řádek na událost (po odstavcích jen při změně procenta)
+    total = event['total']
+    if event['phase'] == 'paragraphs' and total and 0 < event['done'] < total:
+        if event['done'] * 100 // total == (event['done'] - 1) * 100 // total:
+            return
+    print(json.dumps(event, ensure_ascii=False), file=sys.stderr, flush=True)
+
+def _print_leak_scan(a: 'Anonymizer', file=None):
+    """Souhrn END-SCAN pro CLI (file=None → stdout; filtr píše na stderr)."""
+    counts = a.stats.get('leak_scan')
+    if counts is None:
+        return
+    if 'skipped' in counts:
+        print(" - END-SCAN: přeskočen - s --max-memory by automat nad celou mapou strop paměti nedodržel",
+              file=file)
+    elif counts['leaks']:
+        print(f" - ⚠️  END-SCAN: ve výstupu zůstalo {counts['leaks']} původních hodnot "
+              f"({counts['patterns']} vzorů z mapy):", file=file)
+        for leak in a.leaks[:10]:
+            unit = next(k for k in LEAK_UNITS if k in leak)
+            print(f"   {LEAK_UNITS[unit]} {leak[unit]}, znak {leak['offset']}: "
+                  f"{leak['text']!r} ({leak['tag']})", file=file)
+    else:
+        print(f" - END-SCAN: bez úniků ({counts['patterns']} vzorů z mapy)", file=file)
+
+def filter_main(map_base: str, fields=(), map_every: int = 0, ndjson_map: bool = False,
+                config: Optional[str] = None, leak_scan: bool = True) -> int:
+    """CLI režim --filter: stdin → stdout po řádcích, mapy <map_base>_map.json/.txt (hlášení na stderr)."""
+    import io
+    a = Anonymizer(verbose=False)
+    a.leak_scan = leak_scan
+    if config:
+        a.plan = RunPlan.from_file(config)
+    # newline='' zachová konce řádků vstupu (\r\n v logech z Windows)
+    source = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', errors='replace', newline='')
+    out = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', newline='')
+    lines = a.anonymize_stream(source, out, f"{map_base}_map.json", f"{map_base}_map.txt",
+                               f"{map_base}_map.ndjson" if ndjson_map else None,
+                               fields=fields, map_every=map_every)
+    print(f"✅ {lines} řádků, {sum(a.counter.values())} tagů, mapa {map_base}_map.json", file=sys.stderr)
+    _print_leak_scan(a, sys.stderr)
+    return 0
+
+def batch_main(inputs, jobs: int = 1, cache_path: Optional[str] = None, config: Optional[str] = None,
+               ndjson_map: bool = False, templates_path: Optional[str] = None) -> int:
+    """
+    CLI režim --batch: víc .docx (soubory nebo adresáře) se sdílenou cache odstavců
+    (ParagraphCache v souboru SQLite; bez --cache v dočasném souboru jen pro tento běh).
+    Každý dokument má vlastní výstup a mapy; s jobs > 1 běží dokumenty v process poolu.
+    S templates_path se šablony načtou ze souboru, nově naučené se po každém
+    dokumentu slijí a soubor se přepíše (další dokumenty je už použijí).
+    """
+    import tempfile, time
+    docs = []
+    for item in map(Path, inputs):
+        if item.is_dir():
+            docs.extend(sorted(p for p in item.glob('*.docx')
+                               if not p.stem.endswith('_anon') and not p.name.startswith('~$')))
+        else:
+            docs.append(item)
+    print(f"\n🔍 Dávka: {len(docs)} dokumentů")
+    totals, failed = {}, 0
+    library = None
+    if templates_path:
+        library = TemplateLibrary.load(templates_path) if Path(templates_path).exists() else TemplateLibrary()
+    with tempfile.TemporaryDirectory() as d:
+        cache = cache_path or str(Path(d) / 'paragraphs.sqlite')
+        t = time.perf_counter()
+        jobs_iter = ((str(doc), cache, config, ndjson_map, templates_path) for doc in docs)
+        for path, counts, tags, error, learned in _ordered_map(_batch_document_worker, jobs_iter, jobs):
+            if error:
+                failed += 1
+                print(f" ❌ {Path(path).name}: {error}")
+                continue
+            for group, values in counts.items():
+                for key, value in values.items():
+                    totals.setdefault(group, {})[key] = totals.get(group, {}).get(key, 0) + value
+            cache_counts = counts.get('paragraph_cache', {})
+            seen = cache_counts.get('hits', 0) + cache_counts.get('misses', 0)
+            line = f" - {Path(path).name}: {tags} tagů, cache {cache_counts.get('hits', 0)}/{seen} odstavců"
+            if library is not None:
+                library.merge(learned)
+                library.save(templates_path)
+                line += f", šablonou {counts.get('templates', {}).get('matched', 0)} odstavců"
+            if counts.get('leak_scan', {}).get('leaks'):
+                line += f", ⚠️  END-SCAN: {counts['leak_scan']['leaks']} původních hodnot ve výstupu"
+            print(line)
+        dt = time.perf_counter() - t
+    cache_counts = totals.get('paragraph_cache', {})
+    hits, seen = cache_counts.get('hits', 0), cache_counts.get('hits', 0) + cache_counts.get('misses', 0)
+    print(f"\n📊 {len(docs) - failed} dokumentů za {dt:.1f} s ({(len(docs) - failed) / dt:.2f} dok./s)")
+    print(f" - Cache odstavců: zásahů {hits}/{seen} ({100 * hits / max(1, seen):.0f} %), "
+          f"z toho bez osobních údajů {cache_counts.get('clean', 0)}, přepočteno kvůli známé osobě "
+          f"{cache_counts.get('rechecked', 0)}; uloženo {cache_counts.get('stored', 0)}")
+    print(f" - END-SCAN: původních hodnot ve výstupech {totals.get('leak_scan', {}).get('leaks', 0)}")
+    if library is not None:
+        t_counts = totals.get('templates', {})
+        print(f" - Šablony: {len(library)} v knihovně, odstavců podle šablony {t_counts.get('matched', 0)} "
+              f"({t_counts.get('slots', 0)} slotů), vráceno k plnému průchodu {t_counts.get('fallback', 0)}")
+        print(f"   ⚠️  {templates_path} obsahuje pevný text smluv (neanonymizovaný) - nesdílet jako výstup")
+    return 1 if failed else 0
+
+def deanonymize_main(path: Path, map_path: str, original: Optional[str] = None,
+                     incremental_save: bool = True) -> int:
+    """CLI režim --deanonymize: zapíše <název>_restored.<přípona> a volitelně ověří round-trip."""
+    import time
+    out = path.parent / f"{path.stem}_restored{path.suffix}"
+    print(f"\n🔓 De-anonymizace: {path.name} (mapa {Path(map_path).name})")
+    t = time.perf_counter()
+    d = Deanonymizer.from_map(map_path)
+    if path.suffix.lower() == '.docx':
+        stats = d.docx(str(path), str(out), incremental_save=incremental_save)
+    else:
+        stats = d.text_file(str(path), str(out))
+    dt = time.perf_counter() - t
+    print(f" - {out}")
+    print(f" - Obnoveno tagů: {stats['tags']} ({stats['tags'] / dt:,.0f} tagů/s), neznámých: {stats['unknown']}")
+    if original:
+        r = verify_roundtrip(original, str(path), map_path)
+        print(f" - Round-trip: {r['consistent']}/{r['with_tags']} odstavců s tagy odpovídá mapě, "
+              f"obnoveno do originálu {r['restored']}/{r['with_tags']}")
+        for i, orig, anon in r['mismatches']:
+            print(f"   ⚠️  odstavec {i}: {orig[:120]!r}")
+            print(f"       anonymizováno: {anon[:120]!r}")
+        return 0 if r['consistent'] == r['restored'] == r['with_tags'] else 1
+    return 0
 
 def main():
     import argparse
     ap = argparse.ArgumentParser(description="Anonymizace českých DOCX s JSON knihovnou jmen")
-    ap.add_argument("docx_path", nargs='?', help="Cesta k .docx souboru")
+    ap.add_argument("docx_path", nargs='?', help="Cesta k .docx (nebo .xlsx, .eml, .mbox, .db/.sqlite) souboru")
     ap.add_argument("--names-json", default="cz_names.v1.json", help="Cesta k JSON knihovně jmen")
+    ap.add_argument("--jobs", type=int, default=1, help="Počet procesů pro paralelní zpracování odstavců")
+    ap.add_argument("--shard-size", type=int, default=200, help="Počet odstavců v jednom shardu (paralelní režim)")
+    ap.add_argument("--extract-chunk", type=int, default=EXTRACT_CHUNK,
+                    help="Velikost úseku (znaky) pro detekci osob po částech (s --max-memory)")
+    ap.add_argument("--extract-overlap", type=int, default=EXTRACT_OVERLAP,
+                    help="Překryv úseků detekce osob na každé straně (znaky)")
+    ap.add_argument("--verify-parallel", action="store_true",
+                    help="Ověřit, že paralelní výstup je shodný se sekvenčním během")
+    ap.add_argument("--full-save", action="store_true",
+                    help="Přebalit celý DOCX přes python-docx (místo kopie nezměněných částí)")
+    ap.add_argument("--progress", action="store_true",
+                    help="Vypisovat průběh jako JSON řádky na stderr (pro UI)")
+    ap.add_argument("--numbering", choices=["discovery", "position"], default="discovery",
+                    help="Číslování tagů: v pořadí objevení (výchozí) nebo podle pozice v dokumentu")
+    ap.add_argument("--ndjson-map", action="store_true",
+                    help="Zapsat navíc kompaktní mapu <název>_map.ndjson (rychlé načtení pro de-anonymizaci)")
+    ap.add_argument("--review-report", action="store_true",
+                    help="Zapsat <název>_review.json s nejistými detekcemi (ponechanými v textu)")
+    ap.add_argument("--no-leak-scan", dest="leak_scan", action="store_false",
+                    help="Vypnout závěrečnou kontrolu, že ve výstupu nezůstala původní hodnota z mapy (END-SCAN)")
+    ap.add_argument("--config", metavar="JSON",
+                    help="Konfigurace běhu: zapnuté kategorie, whitelist, blacklist, názvy štítků (viz RunPlan)")
+    ap.add_argument("--max-memory", type=int, metavar="MB",
+                    help="Omezit paměť: text dokumentu a mapy odkládat na disk (pro velmi velké vstupy; "
+                         "u SQLite jen registr entit); END-SCAN se přeskočí")
+    ap.add_argument("--filter", metavar="MAP_BASE",
+                    help="Filtr stdin → stdout po řádcích (logy, NDJSON); mapy do MAP_BASE_map.json/.txt")
+    ap.add_argument("--fields", metavar="F1,F2",
+                    help="S --filter: jen tato pole NDJSON záznamů (tečková cesta, např. msg,user.name)")
+    ap.add_argument("--map-every", type=int, default=0, metavar="N",
+                    help="S --filter: mapy zapisovat průběžně každých N řádků (jinak jen na konci)")
+    ap.add_argument("--batch", nargs='+', metavar="CESTA",
+                    help="Dávka .docx (soubory nebo adresáře) se sdílenou cache odstavců; --jobs = dokumentů naráz")
+    ap.add_argument("--cache", metavar="SOUBOR",
+                    help="Soubor cache odstavců (SQLite) - sdílí se mezi dokumenty, procesy i běhy")
+    ap.add_argument("--templates", metavar="SOUBOR",
+                    help="Knihovna šablon opakovaných smluv (JSON): načte se, použije a doplní o nově naučené; "
+                         "obsahuje doslova pevný text smluv - je důvěrná jako vstupní dokumenty")
+    ap.add_argument("--sqlite-columns", action="append", metavar="TABULKA[:SLOUPCE]",
+                    help="U .db/.sqlite: tabulka a sloupce oddělené čárkou (lze opakovat; "
+                         "bez uvedení textové sloupce všech tabulek)")
+    ap.add_argument("--sqlite-batch", type=int, default=5000,
+                    help="U .db/.sqlite: řádků na dávku (jedna transakce)")
+    ap.add_argument("--deanonymize", metavar="MAP",
+                    help="Obnovit originály v anonymizovaném .docx/.txt podle mapy (_map.json/.ndjson)")
+    ap.add_argument("--verify-roundtrip", metavar="ORIGINAL_DOCX",
+                    help="S --deanonymize: ověřit úplnost mapy proti originálnímu dokumentu")
     args = ap.parse_args()
 
     try:
@@ -1959,16 +5402,34 @@ def main():
             global CZECH_FIRST_NAMES
             CZECH_FIRST_NAMES = load_names_library(args.names_json)
 
+        if args.batch:
+            return batch_main(args.batch, jobs=args.jobs, cache_path=args.cache, config=args.config,
+                              ndjson_map=args.ndjson_map, templates_path=args.templates)
+
+        if args.filter:
+            return filter_main(args.filter, args.fields.split(',') if args.fields else (),
+                               map_every=args.map_every, ndjson_map=args.ndjson_map, config=args.config,
+                               leak_scan=args.leak_scan)
+
         path = Path(args.docx_path) if args.docx_path else Path(input("Přetáhni sem .docx soubor nebo napiš cestu: ").strip().strip('"'))
         if not path.exists():
             print("❌ Soubor nenalezen:", path)
             input("\nStiskni Enter pro ukončení...")
             return 2
 
+        if args.deanonymize:
+            return deanonymize_main(path, args.deanonymize, args.verify_roundtrip,
+                                    incremental_save=not args.full_save)
+
         base = path.stem
-        out_docx = path.parent / f"{base}_anon.docx"
+        is_xlsx = path.suffix.lower() == '.xlsx'
+        is_mail = path.suffix.lower() in ('.eml', '.mbox')
+        is_sqlite = path.suffix.lower() in SQLITE_SUFFIXES
+        out_docx = path.parent / f"{base}_anon{path.suffix.lower() if is_xlsx or is_mail or is_sqlite else '.docx'}"
         out_json = path.parent / f"{base}_map.json"
         out_txt  = path.parent / f"{base}_map.txt"
+        out_ndjson = path.parent / f"{base}_map.ndjson" if args.ndjson_map else None
+        out_review = path.parent / f"{base}_review.json" if args.review_report else None
 
         # Kontrola, zda výstupní soubory nejsou otevřené
         # Pokud ano, vytvoř nový soubor s časovým razítkem
@@ -1987,24 +5448,110 @@ def main():
             # Vytvoř nové názvy souborů s časovým razítkem
             from datetime import datetime
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            out_docx = path.parent / f"{base}_anon_{timestamp}.docx"
+            out_docx = path.parent / f"{base}_anon_{timestamp}{out_docx.suffix}"
             out_json = path.parent / f"{base}_map_{timestamp}.json"
             out_txt  = path.parent / f"{base}_map_{timestamp}.txt"
+            if out_ndjson:
+                out_ndjson = path.parent / f"{base}_map_{timestamp}.ndjson"
             print(f"\n⚠️  Výstupní soubory jsou otevřené v jiné aplikaci!")
             print(f"   Vytvářím nové soubory s časovým razítkem: {timestamp}")
             print()
 
         print(f"\n🔍 Zpracovávám: {path.name}")
         a = Anonymizer(verbose=False)
-        a.anonymize_docx(str(path), str(out_docx), str(out_json), str(out_txt))
+        a.leak_scan = args.leak_scan
+        if args.config:
+            a.plan = RunPlan.from_file(args.config)
+        if args.cache:
+            a.paragraph_cache = ParagraphCache(args.cache)
+        if args.templates:
+            a.templates = (TemplateLibrary.load(args.templates) if Path(args.templates).exists()
+                           else TemplateLibrary())
+        if is_xlsx:
+            a.anonymize_xlsx(str(path), str(out_docx), str(out_json), str(out_txt),
+                             ndjson_map=str(out_ndjson) if out_ndjson else None,
+                             progress=_print_progress if args.progress else None)
+        elif is_sqlite:
+            a.anonymize_sqlite(str(path), parse_sqlite_columns(args.sqlite_columns or ()),
+                               output_path=str(out_docx), json_map=str(out_json), txt_map=str(out_txt),
+                               ndjson_map=str(out_ndjson) if out_ndjson else None,
+                               batch=args.sqlite_batch, max_memory=args.max_memory,
+                               progress=_print_progress if args.progress else None)
+        elif is_mail:
+            a.anonymize_mailbox(str(path), str(out_docx), str(out_json), str(out_txt),
+                                ndjson_map=str(out_ndjson) if out_ndjson else None,
+                                jobs=args.jobs, shard_size=args.shard_size,
+                                progress=_print_progress if args.progress else None)
+        else:
+            a.anonymize_docx(str(path), str(out_docx), str(out_json), str(out_txt),
+                             jobs=args.jobs, shard_size=args.shard_size,
+                             verify_parallel=args.verify_parallel,
+                             numbering=args.numbering,
+                             incremental_save=not args.full_save,
+                             ndjson_map=str(out_ndjson) if out_ndjson else None,
+                             review_report=str(out_review) if out_review else None,
+                             max_memory=args.max_memory,
+                             extract_chunk=args.extract_chunk, extract_overlap=args.extract_overlap,
+                             progress=_print_progress if args.progress else None)
 
         print("\n✅ Výstupy:")
         print(f" - {out_docx}")
         print(f" - {out_json}")
+        if map_meta_path(out_json).exists():
+            print(f" - {map_meta_path(out_json)}")
         print(f" - {out_txt}")
+        if out_ndjson:
+            print(f" - {out_ndjson}")
+        if out_review:
+            print(f" - {out_review} ({len(a.review)} nejistých detekcí k revizi)")
         print(f"\n📊 Statistiky:")
         print(f" - Nalezeno osob: {len(a.canonical_persons)}")
         print(f" - Celkem tagů: {sum(a.counter.values())}")
+        if 'xlsx_columns' in a.stats:
+            print(f" - Řádků: {a.stats['xlsx_rows']}")
+            for sheet, cols in a.stats['xlsx_columns'].items():
+                print(f"   {sheet}: " + ", ".join(f"{h} → {cat}" for h, cat in cols.items()))
+        if a.paragraph_cache is not None:
+            a.paragraph_cache.close()
+            counts = a.stats.get('paragraph_cache', {})
+            seen = counts.get('hits', 0) + counts.get('misses', 0)
+            print(f" - Cache odstavců: zásahů {counts.get('hits', 0)}/{seen} "
+                  f"(bez osobních údajů {counts.get('clean', 0)}, přepočteno {counts.get('rechecked', 0)})")
+        if a.templates is not None:
+            a.templates.save(args.templates)
+            counts = a.stats.get('templates', {})
+            print(f" - Šablony: {len(a.templates)} v knihovně, odstavců podle šablony {counts.get('matched', 0)}, "
+                  f"vráceno k plnému průchodu {counts.get('fallback', 0)}")
+            print(f"   ⚠️  {args.templates} obsahuje pevný text smluv (neanonymizovaný) - nesdílet jako výstup")
+        if 'sqlite_columns' in a.stats:
+            print(f" - Řádků: {a.stats['sqlite_rows']} (změněno {a.stats['sqlite_updated']}, "
+                  f"{a.stats['sqlite_rows_per_s']} řádků/s)")
+            for table, cols in a.stats['sqlite_columns'].items():
+                print(f"   {table}: " + ", ".join(f"{c} → {cat}" for c, cat in cols.items()))
+        if 'mail_messages' in a.stats:
+            print(f" - Zpráv: {a.stats['mail_messages']} (DOCX příloh: {a.stats['mail_docx_attachments']})")
+        if 'parallel_shards' in a.stats:
+            print(f" - Shardů: {a.stats['parallel_shards']} (kol: {a.stats['parallel_rounds']}, "
+                  f"přepočteno shardů: {a.stats['parallel_resubmitted']})")
+        if a.stats.get('prescreen'):
+            counts = a.stats['prescreen']
+            run = sum(c['run'] for c in counts.values())
+            skipped = sum(c['skipped'] for c in counts.values())
+            print(f" - Pre-screening: přeskočeno {skipped}/{run + skipped} spuštění detektorů")
+            print("   " + ", ".join(f"{d} {100 * c['skipped'] / max(1, c['run'] + c['skipped']):.0f} %"
+                                   for d, c in counts.items()))
+        if a.stats.get('validators'):
+            print(" - Kontrolní součty: " + ", ".join(
+                f"{cat} {c['valid']} platných / {c['ambiguous']} podle kontextu / {c['rejected']} vyřazeno"
+                for cat, c in a.stats['validators'].items()))
+        if 'peak_rss_mb' in a.stats:
+            print(f" - Špičková paměť: {a.stats['peak_rss_mb']} MB (strop {args.max_memory} MB)")
+        if 'parallel_verified' in a.stats:
+            print(f" - Shoda se sekvenčním během: {'ano' if a.stats['parallel_verified'] else 'NE'}")
+        if 'approx_offsets' in a.stats:
+            print(f" - ⚠️  Číslování podle pozice: {a.stats['approx_offsets']} tagů bez nalezené hodnoty "
+                  f"v originálu, první offset je začátek odstavce (approx_offsets v meta)")
+        _print_leak_scan(a)
 
         # Pauza na konci pouze pokud je interaktivní terminál
         if sys.stdin.isatty():
@@ -2012,6 +5559,11 @@ def main():
         return 0
 
     except Exception as e:
+        if args.filter:
+            # stdout filtru jsou data a stdin není terminál - chyba jen na stderr, bez pauzy
+            import traceback
+            traceback.print_exc()
+            return 1
         print(f"\n❌ CHYBA: {e}")
         print(f"\n📋 Detail chyby:")
         import traceback
@@ -0,0 +1,851 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarky anonymizéru (offline, bez dalších závislostí kromě python-docx).
+Použití: python benchmark.py <benchmark> [volby]
+Výsledky se vypisují na stdout (případně přesměruj do bench_output.txt).
+"""
+
+import sys, os, re, json, time, struct, zlib, tempfile, argparse, random, tracemalloc
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+import Claude_code_V2_1 as anon
+from docx import Document
+
+SAMPLE = Path(__file__).parent / "smlouva.docx"
+
+def timed(fn, *args, repeat: int = 1, **kwargs):
+    """Nejlepší čas z `repeat` běhů (s) a výsledek posledního běhu."""
+    best, result = None, None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn(*args, **kwargs)
+        dt = time.perf_counter() - t
+        best = dt if best is None else min(best, dt)
+    return best, result
+
+# =============== Přebalení DOCX ===============
+def random_png(path: Path, width: int, height: int):
+    """Validní PNG s náhodnými pixely (nekomprimovatelná data jako u skenů)."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    rows = b''.join(b'\x00' + os.urandom(width * 3) for _ in range(height))
+    ihdr = struct.pack('>2I5B', width, height, 8, 2, 0, 0, 0)
+    path.write_bytes(b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', ihdr)
+                     + chunk(b'IDAT', zlib.compress(rows, 0)) + chunk(b'IEND', b''))
+
+def build_image_fixture(tmp: Path, images: int, size: int) -> Path:
+    doc = Document(str(SAMPLE))
+    for i in range(images):
+        png = tmp / f"scan_{i}.png"
+        random_png(png, size, size)
+        doc.add_picture(str(png))
+        png.unlink()
+    fixture = tmp / "fixture_images.docx"
+    doc.save(str(fixture))
+    return fixture
+
+def bench_repack(args):
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        fixture = build_image_fixture(tmp, args.images, args.size)
+        mb = fixture.stat().st_size / 1e6
+        print(f"Fixture: {args.images} obrázků, {mb:.1f} MB")
+
+        doc = Document(str(fixture))
+        anon.set_text(doc.paragraphs[0], "[[PERSON_1]]")
+        t_full, _ = timed(doc.save, str(tmp / "full.docx"), repeat=args.repeat)
+        t_inc, _ = timed(anon.save_docx_incremental, doc, str(fixture), str(tmp / "inc.docx"), repeat=args.repeat)
+        print(f"Zápis doc.save():              {t_full:8.3f} s")
+        print(f"Zápis save_docx_incremental(): {t_inc:8.3f} s  ({t_full / t_inc:.1f}x)")
+
+        for incremental in (False, True):
+            a = anon.Anonymizer()
+            dt, _ = timed(a.anonymize_docx, str(fixture), str(tmp / "out.docx"),
+                          str(tmp / "out.json"), str(tmp / "out.txt"), incremental_save=incremental)
+            label = "inkrementální" if incremental else "celý balíček "
+            print(f"anonymize_docx ({label}):   {dt:8.3f} s")
+
+# =============== Paměť registru entit ===============
+CATEGORIES = ['PERSON', 'ADDRESS', 'PHONE', 'EMAIL', 'BANK', 'DATE', 'BIRTH_ID', 'ICO']
+
+def synthetic_entities(count: int, variants: int, seed: int = 1):
+    """(kategorie, hodnota, [tvary]) - hodnoty se skládají za běhu jako při čtení dokumentu."""
+    rnd = random.Random(seed)
+    for i in range(count):
+        cat = CATEGORIES[i % len(CATEGORIES)]
+        value = f"{cat.lower()} {rnd.randrange(10**9):09d} {i}"
+        yield cat, value, [value + suffix for suffix in ('', 'a', 'ovi', 'em', 'ou', 'ům', 'ech')[:variants]] * 2
+
+def fill_legacy(entities):
+    """Původní reprezentace: tag → list s lineární kontrolou členství, klíče "cat:hodnota"."""
+    tag_map, value_to_tag, counter = defaultdict(list), {}, defaultdict(int)
+    for cat, value, forms in entities:
+        key = f"{cat}:{' '.join(value.split())}"
+        tag = value_to_tag.get(key)
+        if tag is None:
+            counter[cat] += 1
+            tag = value_to_tag[key] = f'[[{cat}_{counter[cat]}]]'
+        for form in forms:
+            form = ' '.join(form.split())
+            if form not in tag_map[tag]:
+                tag_map[tag].append(form)
+    return tag_map, value_to_tag
+
+def fill_store(entities):
+    store, counter = anon.EntityStore(), defaultdict(int)
+    for cat, value, forms in entities:
+        norm = ' '.join(value.split())
+        tag = store.lookup(cat, norm)
+        if tag is None:
+            counter[cat] += 1
+            tag = store.create(cat, counter[cat], norm)
+        for form in forms:
+            store.add(tag, ' '.join(form.split()))
+    return store
+
+def measure(fn, *args):
+    """(čas s, paměť držená výsledkem v MB, špička v MB)."""
+    tracemalloc.start()
+    t = time.perf_counter()
+    result = fn(*args)
+    dt = time.perf_counter() - t
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return dt, current / 1e6, peak / 1e6
+
+def bench_memory(args):
+    print(f"Entit: {args.entities}, tvarů na entitu: {args.variants}")
+    for label, fn in (("tag_map + value_to_tag", fill_legacy), ("EntityStore           ", fill_store)):
+        dt, held, peak = measure(fn, synthetic_entities(args.entities, args.variants))
+        print(f"{label}: {dt:7.3f} s, drženo {held:8.1f} MB, špička {peak:8.1f} MB")
+
+    # Osoby: záznamy Person + sdílené memoizované množiny tvarů
+    first = sorted(anon.CZECH_FIRST_NAMES)[:200]
+    def fill_persons(count):
+        a = anon.Anonymizer()
+        for i in range(count):
+            a._ensure_person_tag(first[i % len(first)].capitalize(), f"Novák{i}")
+        return a
+    count = args.entities // 10
+    dt, held, _ = measure(fill_persons, count)
+    print(f"{count} osob: {dt:7.3f} s, drženo {held:8.1f} MB ({held * 1e6 / count:.0f} B na osobu)")
+
+    # Kvadratické chování: mnoho hodnot pod jedním tagem (např. DATE se všemi normalizacemi)
+    forms = [f"{d}. {m}. {y}" for y in range(1990, 2000) for m in range(1, 13) for d in range(1, 29)]
+    one = [('DATE', 'x', forms)]
+    t_legacy, _ = timed(fill_legacy, one)
+    t_store, _ = timed(fill_store, one)
+    print(f"{len(forms)} hodnot pod jedním tagem: list {t_legacy:.3f} s, EntityStore {t_store:.3f} s")
+
+# =============== Zápis a načtení mapy ===============
+def write_maps_legacy(store, json_path, txt_path):
+    """Původní zápis: celá mapa seřazená v paměti, TXT přeskenuje všechny tagy pro každou sekci."""
+    tag_map = store.snapshot()
+    data = anon.OrderedDict((tag, tag_map[tag]) for tag in sorted(tag_map))
+    with open(json_path, 'w', encoding='utf-8') as f:
+        anon.json.dump(data, f, ensure_ascii=False, indent=2)
+    with open(txt_path, 'w', encoding='utf-8') as f:
+        for title, pref in anon.MAP_SECTIONS:
+            items = []
+            for tag, vals in sorted(tag_map.items()):
+                if tag.startswith(f'[[{pref}_'):
+                    items.extend(f"{tag}: {v}" for v in vals)
+            if items:
+                f.write(f"{title}\n{'-'*len(title)}\n" + "\n".join(items) + "\n\n")
+
+def write_maps_streaming(store, json_path, txt_path):
+    anon.write_json_map(json_path, store)
+    anon.write_txt_map(txt_path, store)
+
+def bench_maps(args):
+    store = fill_store(synthetic_entities(args.entities, args.variants))
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        json_path, txt_path = tmp / "map.json", tmp / "map.txt"
+        print(f"Entit: {args.entities}, tvarů na entitu: {args.variants}")
+        t_legacy, _ = timed(write_maps_legacy, store, json_path, txt_path, repeat=args.repeat)
+        t_stream, _ = timed(write_maps_streaming, store, json_path, txt_path, repeat=args.repeat)
+        print(f"Zápis JSON+TXT (původní):       {t_legacy:8.3f} s")
+        print(f"Zápis JSON+TXT (streamovaný):   {t_stream:8.3f} s  ({t_legacy / t_stream:.1f}x)")
+        for name in ("map.ndjson", "map.ndjson.gz"):
+            path = tmp / name
+            t_write, _ = timed(anon.write_ndjson_map, path, store, repeat=args.repeat)
+            print(f"Zápis {name:<14}            {t_write:8.3f} s  ({path.stat().st_size / 1e6:.1f} MB)")
+        print(f"Velikost map.json:                          ({json_path.stat().st_size / 1e6:.1f} MB)")
+        for name in ("map.json", "map.ndjson", "map.ndjson.gz"):
+            t_load, (data, _) = timed(anon.load_map, tmp / name, repeat=args.repeat)
+            print(f"Načtení {name:<14}          {t_load:8.3f} s  ({len(data)} tagů)")
+
+# =============== De-anonymizace ===============
+def bench_deanon(args):
+    tag_map = {f'[[PERSON_{i}]]': [f'Jméno{i} Příjmení{i}'] for i in range(1, args.entities + 1)}
+    rnd = random.Random(1)
+    lines = [f"Smluvní strana [[PERSON_{rnd.randint(1, args.entities)}]] a [[PERSON_{rnd.randint(1, args.entities)}]] "
+             f"uzavírají tuto smlouvu, kontakt [[EMAIL_{i}]]." for i in range(args.lines)]
+    tags = sum(line.count('[[') for line in lines)
+    d = anon.Deanonymizer(tag_map)
+    dt, _ = timed(lambda: [d.text(line) for line in lines], repeat=args.repeat)
+    print(f"{tags} tagů v {args.lines} odstavcích: {dt:.3f} s = {tags / dt:,.0f} tagů/s")
+
+    # Porovnání s ad-hoc skriptem: str.replace přes všechny položky mapy
+    sample = lines[:max(1, args.lines // 100)]
+    def naive():
+        out = []
+        for line in sample:
+            for tag, vals in tag_map.items():
+                line = line.replace(tag, vals[0])
+            out.append(line)
+        return out
+    dt_naive, _ = timed(naive)
+    tags_naive = sum(line.count('[[') for line in sample)
+    print(f"str.replace přes mapu: {tags_naive / dt_naive:,.0f} tagů/s")
+
+# =============== Pre-screening ===============
+def bench_prescreen(args):
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        for docx in args.docx:
+            # Zahřátí memoizovaných tabulek tvarů jmen, ať je neplatí jen první měření
+            anon.Anonymizer().anonymize_docx(docx, str(tmp / "out.docx"), str(tmp / "out.json"), str(tmp / "out.txt"))
+            times = {}
+            for prescreen in (False, True):
+                a = anon.Anonymizer()
+                a.prescreen = prescreen
+                times[prescreen], _ = timed(a.anonymize_docx, docx, str(tmp / "out.docx"),
+                                            str(tmp / "out.json"), str(tmp / "out.txt"))
+            counts = a.stats.get('prescreen', {})
+            skipped = sum(c['skipped'] for c in counts.values())
+            total = skipped + sum(c['run'] for c in counts.values())
+            print(f"{Path(docx).name:<16} bez: {times[False]:7.2f} s   s pre-screeningem: {times[True]:6.2f} s"
+                  f"  ({times[False] / times[True]:5.1f}x, přeskočeno {100 * skipped / max(1, total):.0f} %)")
+
+# =============== Kaskáda skórování jmen ===============
+def capitalized_pairs_text(paragraphs: int, seed: int = 1):
+    """Odstavce plné dvojic slov s velkým písmenem (hlavičky tabulek, názvy produktů)."""
+    words = ["Celková", "Cena", "Kupní", "Předmět", "Doba", "Splatnost", "Záruka", "Servis", "Sleva",
+             "Dodávka", "Materiál", "Montáž", "Položka", "Množství", "Jednotka", "Termín", "Platba"]
+    rnd = random.Random(seed)
+    return [" ".join(f"{rnd.choice(words)} {rnd.choice(words)}," for _ in range(12)) + " tel. viz příloha"
+            for _ in range(paragraphs)]
+
+def bench_cascade(args):
+    texts = capitalized_pairs_text(args.paragraphs)
+    times = {}
+    for cascade in (False, True):
+        a = anon.Anonymizer()
+        a.cascade = cascade
+        times[cascade], _ = timed(lambda: [a._replace_remaining_people(t) for t in texts], repeat=args.repeat)
+        evaluated = a.stats['cascade']['evaluated']
+        label = "kaskáda      " if cascade else "vše vyhodnotit"
+        print(f"{label}: {times[cascade]:7.3f} s, vyhodnoceno kontextů: {evaluated.get('context', 0)}")
+    print(f"Zrychlení: {times[False] / times[True]:.1f}x")
+
+# =============== Syntetické smlouvy (propustnost + recall) ===============
+def bench_synthetic(args):
+    import generate_contracts as gen
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        src = tmp / "synthetic.docx"
+        t_gen, builder = timed(lambda: gen.ContractBuilder(args.seed).generate(args.persons, args.paragraphs))
+        truth = builder.save(str(src))
+        total = sum(1 for _ in builder.paragraphs())
+        print(f"Vygenerováno: {len(builder.persons)} osob, {total} odstavců ({t_gen:.1f} s)")
+        a = anon.Anonymizer()
+        tracemalloc.start()
+        dt, _ = timed(a.anonymize_docx, str(src), str(tmp / "out.docx"), str(tmp / "out.json"),
+                      str(tmp / "out.txt"), jobs=args.jobs)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"Anonymizace: {dt:.1f} s ({total / dt:,.0f} odstavců/s, špička {peak / 1e6:.0f} MB, "
+              f"tagů {sum(a.counter.values())})")
+        gen.print_recall(gen.recall(gen.read_paragraphs(str(tmp / "out.docx")), str(truth)))
+
+# =============== Režim s omezenou pamětí ===============
+def bench_bounded(args):
+    import generate_contracts as gen
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        src = tmp / "synthetic.docx"
+        gen.ContractBuilder(args.seed).generate(args.persons, args.paragraphs).save(str(src))
+        outputs = {}
+        for label, max_memory in (("v paměti       ", None), (f"--max-memory {args.max_memory}", args.max_memory)):
+            out = tmp / f"out{max_memory}"
+            a = anon.Anonymizer()
+            tracemalloc.start()
+            dt, _ = timed(a.anonymize_docx, str(src), f"{out}.docx", f"{out}.json", f"{out}.txt",
+                          max_memory=max_memory)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            outputs[max_memory] = ([anon.get_text(p) for p in anon.iter_paragraphs(Document(f"{out}.docx"))],
+                                   Path(f"{out}.json").read_bytes())
+            print(f"{label}: {dt:7.1f} s, špička (Python heap) {peak / 1e6:7.1f} MB")
+        print(f"Výstupy shodné: {'ano' if outputs[None] == outputs[args.max_memory] else 'NE'}")
+
+# =============== Detekce osob po úsecích ===============
+def bench_extract(args):
+    import generate_contracts as gen
+    builder = gen.ContractBuilder(args.seed).generate(args.persons, args.paragraphs)
+    pieces = [text for text, _ in builder.paragraphs()]
+    source = '\n'.join(pieces)
+    print(f"Text: {len(source) / 1e6:.1f} M znaků, {len(pieces)} odstavců")
+
+    def single():
+        a = anon.Anonymizer()
+        a.source_text = source
+        a._extract_persons_to_index(anon.EMAIL_RE.sub('__EMAIL_PLACEHOLDER__', source))
+        return a
+
+    def chunked(jobs):
+        a = anon.Anonymizer()
+        a.source_text = source
+        a._extract_persons_chunked(pieces, jobs, args.chunk, args.overlap)
+        return a
+
+    def persons(a):
+        return [(p.first, p.last, p.tag) for p in a.canonical_persons]
+
+    dt, ref = timed(single)
+    print(f"jeden průchod      : {dt:7.2f} s, osob {len(ref.canonical_persons)}")
+    for jobs in sorted({1, args.jobs}):
+        dt, a = timed(chunked, jobs)
+        same = persons(a) == persons(ref)
+        print(f"úseky, jobs={jobs:<2d}     : {dt:7.2f} s, úseků {a.stats['extract_chunks']}, "
+              f"shodné osoby: {'ano' if same else 'NE'}")
+
+# =============== Stínový text (tvary jmen bez diakritiky) ===============
+def bench_shadow(args):
+    paragraphs, persons = [], []
+    for path in args.docx:
+        a = anon.Anonymizer()
+        doc = Document(path)
+        texts = [anon.clean_invisibles(anon.get_text(p)) for p in anon.iter_paragraphs(doc)]
+        a.source_text = '\n'.join(texts)
+        a._extract_persons_to_index(anon.EMAIL_RE.sub('__EMAIL_PLACEHOLDER__', a.source_text))
+        paragraphs += [t for t in texts if t.strip()]
+        persons += [(p.first, p.last) for p in a.canonical_persons]
+    # odstavce x vzory roste kvadraticky - stačí vzorek
+    paragraphs = paragraphs[:args.paragraphs]
+    forms = [anon.variants_for_first(f) for f, _ in persons] + [anon.variants_for_surname(l) for _, l in persons]
+
+    # Dříve: každý tvar + jeho ASCII kopie jako samostatný vzor s IGNORECASE nad originálem
+    legacy = [anon.longest_first(v | {anon._ascii_fold(x) for x in v}) for v in forms]
+    shadow = [anon.shadow_variants(v) for v in forms]
+    print(f"Odstavců: {len(paragraphs)}, osob: {len(persons)}")
+    print(f"Vzorů: dříve {sum(map(len, legacy))}, stínový text {sum(map(len, shadow))}")
+
+    def scan_legacy():
+        for text in paragraphs:
+            for variants in legacy:
+                for v in variants:
+                    re.compile(r'(?<!\w)' + re.escape(v) + r'(?!\w)', re.IGNORECASE).search(text)
+
+    def scan_shadow():
+        for text in paragraphs:
+            folded = anon.ShadowText(text).folded
+            for variants in shadow:
+                for v in variants:
+                    anon.shadow_word_regex(v).search(folded)
+
+    t_old, _ = timed(scan_legacy, repeat=args.repeat)
+    t_new, _ = timed(scan_shadow, repeat=args.repeat)
+    print(f"Průchod tvarů: dříve {t_old:.3f} s, stínový text {t_new:.3f} s ({t_old / t_new:.1f}x)")
+
+# =============== Kontrolní součty (číselné přílohy) ===============
+def _valid_base(rng, digits):
+    """Náhodné číslo s platným váženým součtem mod 11 (poslední váha je 1)."""
+    weights = anon.ACCOUNT_BASE_WEIGHTS[-digits:]
+    while True:
+        head = [rng.randint(1, 9)] + [rng.randint(0, 9) for _ in range(digits - 2)]
+        check = -sum(d * w for d, w in zip(head, weights)) % 11
+        if check < 10:
+            return ''.join(map(str, head + [check]))
+
+def _cz_iban(rng, base, bank):
+    bban = bank + '0' * 6 + base.zfill(10)
+    check = 98 - int(bban + '123500') % 97  # 'CZ00' → C=12, Z=35
+    return f'CZ{check:02d}{bban}'
+
+def bench_validators(args):
+    rng = random.Random(args.seed)
+    banks = ['0100', '0300', '0800', '2010', '5500', '6100']
+    paragraphs = []
+    for i in range(args.rows):
+        base, bank = _valid_base(rng, 10), rng.choice(banks)
+        if rng.random() < args.invalid:
+            base = base[:-1] + str((int(base[-1]) + 1) % 10)  # překlep
+        row = f"{i + 1}. {base}/{bank} {rng.randint(100, 99999)} Kč, ref. {_cz_iban(rng, base, bank)}"
+        if rng.random() < args.codes:
+            # Kód šarže ve tvaru IBAN_RE (falešně pozitivní bez kontrolního součtu)
+            row += f", šarže SK{rng.randint(10, 99)}{''.join(rng.choice('ABCDEFGH0123456789') for _ in range(14))}"
+        paragraphs.append(row)
+    print(f"Řádků přílohy: {len(paragraphs)}, podíl neplatných čísel {args.invalid:.0%}, kódů šarží {args.codes:.0%}")
+    outputs = {}
+    for label, validate in (("jen kontext     ", False), ("kontrolní součty", True)):
+        def run():
+            a = anon.Anonymizer()
+            a.validate = validate
+            return a, [a.anonymize_entities(t) for t in paragraphs]
+        dt, (a, out) = timed(run, repeat=args.repeat)
+        outputs[validate] = out
+        counts = ', '.join(f"{cat} {c['valid']}/{c['ambiguous']}/{c['rejected']}"
+                           for cat, c in a.stats.get('validators', {}).items())
+        print(f"{label}: {dt:.3f} s, tagů {sum(a.counter.values())}"
+              + (f" (platné/kontext/vyřazené: {counts})" if counts else ''))
+    # Bez čísel tagů - vyřazený kód posune číslování dalších IBAN
+    strip = lambda t: re.sub(r'_\d+\]\]', ']]', t)
+    same = sum(strip(x) == strip(y) for x, y in zip(outputs[False], outputs[True]))
+    print(f"Shodných řádků (bez čísel tagů): {same}/{len(paragraphs)}")
+
+# =============== Plán běhu (zapnuté kategorie) ===============
+def bench_plan(args):
+    import generate_contracts as gen
+    categories = args.categories.split(',')
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        src = tmp / "synthetic.docx"
+        gen.ContractBuilder(args.seed).generate(args.persons, args.paragraphs).save(str(src))
+        found = {}
+        for label, plan in (("všechny kategorie", anon.RunPlan()),
+                            (', '.join(categories), anon.RunPlan(categories))):
+            a = anon.Anonymizer()
+            a.plan = plan
+            out = tmp / "out"
+            dt, _ = timed(a.anonymize_docx, str(src), f"{out}.docx", f"{out}.json", f"{out}.txt")
+            found[label] = {cat: len(a.entities.category(cat)) for cat in categories}
+            print(f"{label:20s}: {dt:7.2f} s, tagů {sum(a.counter.values())}")
+        counts = list(found.values())
+        print(f"Stejné entity zapnutých kategorií: {'ano' if counts[0] == counts[1] else 'NE'} {counts[1]}")
+
+# =============== XLSX (typované sloupce) ===============
+XLSX_HEADER = ['Jméno a příjmení', 'Rodné číslo', 'Adresa', 'Telefon', 'E-mail', 'Číslo účtu', 'Poznámka', 'Nájem']
+
+def tenant_rows(rows: int, seed: int = 1):
+    """Seznam nájemníků: osoba z generate_contracts na řádek, poznámka jen občas."""
+    import generate_contracts as gen
+    builder, rng = gen.ContractBuilder(seed), random.Random(seed)
+    for _ in range(rows):
+        p = builder.new_person()
+        note = f"upomínka, volat na {p['phone']}" if rng.random() < 0.05 else None
+        yield [f"{p['first']} {p['last']}", p['birth_id'], p['address'], p['phone'], p['email'],
+               p['account'], note, rng.randrange(5000, 30000)]
+
+def bench_xlsx(args):
+    from openpyxl import Workbook
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        src = tmp / "najemnici.xlsx"
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Nájemníci")
+        ws.append(XLSX_HEADER)
+        for row in tenant_rows(args.rows, args.seed):
+            ws.append(row)
+        wb.save(str(src))
+
+        # Původní postup: každá buňka jako odstavec (na vzorku řádků)
+        sample = [r for _, r in zip(range(args.baseline_rows), tenant_rows(args.rows, args.seed))]
+        def per_cell():
+            a = anon.Anonymizer()
+            for row in sample:
+                for v in row:
+                    if v is not None:
+                        a._anonymize_paragraph(anon.xlsx_cell_text(v))
+        dt, _ = timed(per_cell)
+        print(f"buňka jako odstavec : {len(sample) * 60 / dt:9.0f} řádků/min ({len(sample)} řádků, {dt:.2f} s)")
+
+        a = anon.Anonymizer()
+        out = tmp / "out"
+        dt, _ = timed(a.anonymize_xlsx, str(src), f"{out}.xlsx", f"{out}.json", f"{out}.txt")
+        print(f"typované sloupce    : {args.rows * 60 / dt:9.0f} řádků/min ({args.rows} řádků, {dt:.2f} s), "
+              f"tagů {sum(a.counter.values())}")
+        for sheet, cols in a.stats['xlsx_columns'].items():
+            print(f"{sheet}: " + ', '.join(f"{h} → {cat}" for h, cat in cols.items()))
+
+# =============== Filtr stdin → stdout (logy, NDJSON) ===============
+def log_lines(lines: int, seed: int = 1, ndjson: bool = False):
+    """Aplikační log: většina řádků bez osobních údajů, část s e-mailem, telefonem, účtem nebo jménem."""
+    import generate_contracts as gen
+    builder, rng = gen.ContractBuilder(seed), random.Random(seed)
+    people = [builder.new_person() for _ in range(500)]
+    for i in range(lines):
+        p, roll = rng.choice(people), rng.random()
+        if roll < 0.05:
+            msg = f"user {p['email']} logged in from 10.0.{rng.randrange(256)}.{rng.randrange(256)}"
+        elif roll < 0.08:
+            msg = f"SMS sent to {p['phone']}"
+        elif roll < 0.10:
+            msg = f"payment {rng.randrange(100, 50000)} Kč to account {p['account']}"
+        elif roll < 0.12:
+            msg = f"contract signed by {p['first']} {p['last']}"
+        else:
+            msg = f"GET /api/v1/items/{rng.randrange(10**6)} -> 200 ({rng.randrange(1, 900)} ms)"
+        ts = f"2026-10-19T{i // 3600000 % 24:02d}:{i // 60000 % 60:02d}:{i // 1000 % 60:02d}.{i % 1000:03d}"
+        if ndjson:
+            yield json.dumps({'ts': ts, 'level': 'INFO', 'msg': msg, 'req': i}, ensure_ascii=False) + '\n'
+        else:
+            yield f"{ts} INFO [worker-{i % 8}] {msg}\n"
+
+def bench_filter(args):
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        runs = (("log, všechny kategorie ", False, None, ()),
+                ("log, EMAIL,PHONE,BANK  ", False, ['EMAIL', 'PHONE', 'BANK'], ()),
+                ("NDJSON, pole msg       ", True, None, ('msg',)))
+        for label, ndjson, categories, fields in runs:
+            src = tmp / ("log.ndjson" if ndjson else "app.log")
+            with open(src, 'w', encoding='utf-8') as f:
+                f.writelines(log_lines(args.lines, args.seed, ndjson))
+            size = src.stat().st_size / 1e6
+            a = anon.Anonymizer()
+            if categories:
+                a.plan = anon.RunPlan(categories)
+            def run():
+                with open(src, encoding='utf-8', newline='') as fin, \
+                     open(tmp / "out.log", 'w', encoding='utf-8', newline='') as fout:
+                    return a.anonymize_stream(fin, fout, str(tmp / "map.json"), str(tmp / "map.txt"), fields=fields)
+            dt, lines = timed(run)
+            print(f"{label}: {size / dt:6.2f} MB/s, {lines / dt:8.0f} řádků/s ({size:.1f} MB, {dt:.2f} s), "
+                  f"tagů {sum(a.counter.values())}")
+
+# =============== Dávka dokumentů (cache odstavců) ===============
+def bench_batch(args):
+    import generate_contracts as gen
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        docs = []
+        for k in range(args.docs):
+            path = tmp / f"smlouva_{k:04d}.docx"
+            gen.ContractBuilder(args.seed + k).generate(args.persons, args.paragraphs).save(str(path))
+            docs.append(path)
+        outputs = []
+        for label, cache_path in (("bez cache ", None), ("s cache   ", str(tmp / "cache.sqlite"))):
+            counts, texts = {}, []
+            def run():
+                for doc in docs:
+                    a = anon.Anonymizer()
+                    if cache_path:
+                        a.paragraph_cache = anon.ParagraphCache(cache_path)
+                    out = tmp / f"{doc.stem}_anon"
+                    a.anonymize_docx(str(doc), f"{out}.docx", f"{out}.json", f"{out}.txt")
+                    if a.paragraph_cache is not None:
+                        a.paragraph_cache.close()
+                    for key, value in a.stats.get('paragraph_cache', {}).items():
+                        counts[key] = counts.get(key, 0) + value
+                    texts.append(Path(f"{out}.json").read_text(encoding='utf-8'))
+            dt, _ = timed(run)
+            outputs.append(texts)
+            seen = counts.get('hits', 0) + counts.get('misses', 0)
+            rate = f", zásahů {counts['hits']}/{seen} ({100 * counts['hits'] / max(1, seen):.0f} %), " \
+                   f"bez osobních údajů {counts['clean']}, přepočteno {counts['rechecked']}" if counts else ''
+            print(f"{label}: {args.docs / dt:6.2f} dok./s ({args.docs} dokumentů, {dt:.2f} s){rate}")
+        print(f"Shodné mapy: {'ano' if outputs[0] == outputs[1] else 'NE'}")
+
+def bench_templates(args):
+    import generate_contracts as gen
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        docs = []
+        for k in range(args.learn + args.docs):
+            path = tmp / f"smlouva_{k:04d}.docx"
+            gen.ContractBuilder(args.seed + k).generate(args.persons, args.paragraphs).save(str(path))
+            docs.append(path)
+        library = anon.TemplateLibrary()
+        for doc in docs[:args.learn]:
+            a = anon.Anonymizer()
+            a.templates = library
+            a.anonymize_docx(str(doc), str(tmp / "learn.docx"), str(tmp / "learn.json"), str(tmp / "learn.txt"))
+        print(f"Naučeno z {args.learn} dokumentů: {len(library)} šablon")
+        maps = []
+        for label, templates in (("bez šablon", None), ("se šablonami", library)):
+            counts, texts = {}, []
+            def run():
+                for doc in docs[args.learn:]:
+                    a = anon.Anonymizer()
+                    a.templates = templates
+                    out = tmp / f"{doc.stem}_anon"
+                    a.anonymize_docx(str(doc), f"{out}.docx", f"{out}.json", f"{out}.txt")
+                    for key, value in a.stats.get('templates', {}).items():
+                        counts[key] = counts.get(key, 0) + value
+                    # pořadí variant hodnoty u tagu se může lišit - porovnávají se množiny
+                    texts.append({tag: sorted(values) for tag, values in
+                                  json.loads(Path(f"{out}.json").read_text(encoding='utf-8')).items()})
+            dt, _ = timed(run)
+            maps.append(texts)
+            per_doc = dt / args.docs
+            rate = f", podle šablony {counts.get('matched', 0)} odstavců ({counts.get('slots', 0)} slotů), " \
+                   f"plný průchod {counts.get('fallback', 0)}" if counts else ''
+            print(f"{label:12s}: {1000 * dt / args.docs:7.1f} ms/dok. ({args.docs} dokumentů, {dt:.2f} s){rate}")
+        print(f"Shodné mapy: {'ano' if maps[0] == maps[1] else 'NE'}")
+        # Šablona šetří detektory odstavců, ne přípravné průchody dokumentu - čas roste s délkou
+        longer = []
+        for k in range(args.docs):
+            path = tmp / f"delsi_{k:04d}.docx"
+            gen.ContractBuilder(args.seed + args.learn + k).generate(args.persons, 2 * args.paragraphs).save(str(path))
+            longer.append(path)
+        def run_longer():
+            for doc in longer:
+                a = anon.Anonymizer()
+                a.templates = library
+                out = tmp / f"{doc.stem}_anon"
+                a.anonymize_docx(str(doc), f"{out}.docx", f"{out}.json", f"{out}.txt")
+        dt, _ = timed(run_longer)
+        print(f"{'2× odstavců':12s}: {1000 * dt / args.docs:7.1f} ms/dok. se šablonami "
+              f"({dt / args.docs / per_doc:.1f}× času na dokument při 2× délce)")
+
+# =============== END-SCAN (úniky po anonymizaci) ===============
+def bench_leakscan(args):
+    docs = [doc for doc in sorted(SAMPLE.parent.glob("smlouva*.docx")) if not args.docs or doc.stem in args.docs]
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        t_anon = t_find = t_scan = 0.0
+        found_find = found_scan = 0
+        for doc in docs:
+            a = anon.Anonymizer()
+            a.leak_scan = False
+            dt, _ = timed(a.anonymize_docx, str(doc), str(tmp / "out.docx"), str(tmp / "out.json"), str(tmp / "out.txt"))
+            t_anon += dt
+            texts = [anon.get_text(p) for p in anon.iter_paragraphs(Document(str(tmp / "out.docx")))]
+
+            def scan_find():
+                # původní kontrola: str.find každé hodnoty (i bez diakritiky a malými) v každém odstavci
+                lowered = [(t.casefold(), anon.leak_token(t)) for t in texts]
+                values = {v for vals in a.entities.values() for v in vals
+                          if sum(map(len, anon.LEAK_TOKEN_RE.findall(v))) >= anon.LEAK_MIN_CHARS}
+                variants = {(v.casefold(), anon.leak_token(v)) for v in values}
+                return sum(1 for low, plain in lowered for v_low, v_plain in variants
+                           if low.find(v_low) >= 0 or plain.find(v_plain) >= 0)
+
+            def scan_automaton():
+                scanner = anon.LeakScanner(a.entities)
+                return sum(len(scanner.scan(t)) for t in texts)
+
+            dt, n = timed(scan_find, repeat=args.repeat)
+            t_find, found_find = t_find + dt, found_find + n
+            dt, n = timed(scan_automaton, repeat=args.repeat)
+            t_scan, found_scan = t_scan + dt, found_scan + n
+        print(f"Anonymizace      : {t_anon:7.3f} s ({len(docs)} dokumentů)")
+        print(f"str.find hodnot  : {t_find:7.3f} s ({100 * t_find / t_anon:5.1f} % anonymizace), úniků {found_find}")
+        print(f"automat (END-SCAN): {t_scan:7.3f} s ({100 * t_scan / t_anon:5.1f} % anonymizace), úniků {found_scan}")
+
+# =============== SQLite (CRM výpis) ===============
+SQLITE_COLUMNS = ['jmeno', 'rodne_cislo', 'adresa', 'telefon', 'email', 'ucet', 'poznamka', 'najem']
+
+def build_crm_db(path: Path, rows: int, seed: int = 1):
+    import sqlite3
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE zakaznici (id INTEGER PRIMARY KEY, jmeno TEXT, rodne_cislo TEXT, adresa TEXT, "
+                 "telefon TEXT, email TEXT, ucet TEXT, poznamka TEXT, najem INTEGER)")
+    with conn:
+        conn.executemany(f"INSERT INTO zakaznici ({', '.join(SQLITE_COLUMNS)}) VALUES ({', '.join('?' * 8)})",
+                         tenant_rows(rows, seed))
+    conn.close()
+
+def run_forked(fn):
+    """fn() ve vlastním procesu (fork): (výsledek, špička RSS toho procesu v MB) - běhy se nesčítají."""
+    import multiprocessing, resource
+    ctx = multiprocessing.get_context('fork')
+    receiver, sender = ctx.Pipe(duplex=False)
+    def target():
+        result = fn()
+        sender.send((result, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+    proc = ctx.Process(target=target)
+    proc.start()
+    result = receiver.recv()
+    proc.join()
+    return result
+
+def bench_sqlite(args):
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        columns = {'zakaznici': SQLITE_COLUMNS[:-1]}
+        def run(src, rows, batch, max_memory=None, leak_scan=True):
+            def anonymize():
+                a = anon.Anonymizer()
+                a.leak_scan = leak_scan
+                dt, _ = timed(a.anonymize_sqlite, str(src), columns, output_path=str(tmp / "out.db"),
+                              batch=batch, max_memory=max_memory)
+                return dt, a.stats['sqlite_updated'], sum(a.counter.values())
+            (dt, updated, tags), rss = run_forked(anonymize)
+            (tmp / "out.db").unlink()
+            return (f"{rows / dt:8.0f} řádků/s ({rows} řádků, {dt:.2f} s), změněno {updated}, "
+                    f"tagů {tags}, špička RSS {rss:.0f} MB")
+
+        src = tmp / "crm.db"
+        build_crm_db(src, args.rows, args.seed)
+        for batch in (args.baseline_batch, args.batch):
+            print(f"dávka {batch:6d}: {run(src, args.rows, batch)}")
+        a = anon.Anonymizer()
+        a.anonymize_sqlite(str(src), columns, output_path=str(tmp / "types.db"), batch=args.batch, map_table=None)
+        print("zakaznici: " + ', '.join(f"{c} → {cat}" for c, cat in a.stats['sqlite_columns']['zakaznici'].items()))
+
+        # Paměť na velké tabulce: registr v paměti vs. --max-memory (registr entit na disku);
+        # END-SCAN (automat nad celou mapou) se s --max-memory přeskakuje, měří se zvlášť
+        if args.rss_rows:
+            src.unlink()
+            build_crm_db(src, args.rss_rows, args.seed)
+            print(f"v paměti              : {run(src, args.rss_rows, args.batch, leak_scan=False)}")
+            print(f"v paměti + END-SCAN   : {run(src, args.rss_rows, args.batch)}")
+            print(f"--max-memory {args.max_memory:<9d}: {run(src, args.rss_rows, args.batch, args.max_memory)}")
+
+# =============== E-maily (mbox) ===============
+def mailbox_messages(messages: int, seed: int = 1):
+    """Korespondence k nájmům: odesílatel a adresát z generate_contracts, tělo s kontaktem a účtem."""
+    from email.message import EmailMessage
+    import generate_contracts as gen
+    builder, rng = gen.ContractBuilder(seed), random.Random(seed)
+    people = [builder.new_person() for _ in range(200)]
+    for i in range(messages):
+        a, b = rng.sample(people, 2)
+        msg = EmailMessage()
+        msg['From'] = f"\"{a['first']} {a['last']}\" <{a['email']}>"
+        msg['To'] = f"\"{b['first']} {b['last']}\" <{b['email']}>"
+        msg['Subject'] = f"Nájemní smlouva č. {1000 + i}"
+        body = (f"Dobrý den,\n\nposílám podklady k nájmu. Nájemné prosím na účet {a['account']}.\n\n"
+                f"S pozdravem\n{a['first']} {a['last']}\ntel. {a['phone']}\n")
+        msg.set_content(body)
+        if rng.random() < 0.3:
+            msg.add_alternative(f"<p>{body.replace(chr(10) * 2, '</p><p>')}</p>", subtype='html')
+        yield msg
+
+def bench_mail(args):
+    from email.generator import BytesGenerator
+    from email import policy
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        src = tmp / "posta.mbox"
+        with open(src, 'wb') as f:
+            for msg in mailbox_messages(args.messages, args.seed):
+                f.write(b"From MAILER-DAEMON Mon Oct 19 08:00:00 2026\n")
+                BytesGenerator(f, mangle_from_=True, policy=policy.default).flatten(msg)
+                f.write(b"\n")
+        maps = []
+        for jobs in sorted({1, args.jobs}):
+            a = anon.Anonymizer()
+            out = tmp / f"out{jobs}"
+            dt, _ = timed(a.anonymize_mailbox, str(src), f"{out}.mbox", f"{out}.json", f"{out}.txt",
+                          jobs=jobs, shard_size=args.shard_size)
+            maps.append(Path(f"{out}.json").read_text(encoding='utf-8'))
+            print(f"jobs={jobs}: {args.messages / dt:7.1f} zpráv/s ({args.messages} zpráv, {dt:.2f} s), "
+                  f"osob {len(a.canonical_persons)}, tagů {sum(a.counter.values())}")
+        if len(maps) > 1:
+            print(f"Shodné mapy: {'ano' if maps[0] == maps[1] else 'NE'}")
+
+BENCHMARKS = {
+    'repack': bench_repack,
+    'memory': bench_memory,
+    'maps': bench_maps,
+    'deanon': bench_deanon,
+    'prescreen': bench_prescreen,
+    'cascade': bench_cascade,
+    'synthetic': bench_synthetic,
+    'bounded': bench_bounded,
+    'extract': bench_extract,
+    'shadow': bench_shadow,
+    'plan': bench_plan,
+    'validators': bench_validators,
+    'xlsx': bench_xlsx,
+    'filter': bench_filter,
+    'mail': bench_mail,
+    'sqlite': bench_sqlite,
+    'batch': bench_batch,
+    'templates': bench_templates,
+    'leakscan': bench_leakscan,
+}
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmarky anonymizéru")
+    sub = ap.add_subparsers(dest="bench", required=True)
+    p = sub.add_parser("repack", help="Zápis DOCX s velkými obrázky: doc.save() vs. inkrementální přebalení")
+    p.add_argument("--images", type=int, default=20)
+    p.add_argument("--size", type=int, default=1200, help="Strana obrázku v pixelech")
+    p.add_argument("--repeat", type=int, default=3)
+    p = sub.add_parser("memory", help="Paměť a rychlost registru entit: tag_map/value_to_tag vs. EntityStore")
+    p.add_argument("--entities", type=int, default=50000)
+    p.add_argument("--variants", type=int, default=5, help="Počet pádových tvarů na entitu")
+    p = sub.add_parser("maps", help="Zápis a načtení mapy: původní vs. streamované zápisy, JSON vs. NDJSON")
+    p.add_argument("--entities", type=int, default=50000)
+    p.add_argument("--variants", type=int, default=5, help="Počet pádových tvarů na entitu")
+    p.add_argument("--repeat", type=int, default=3)
+    p = sub.add_parser("deanon", help="Propustnost de-anonymizace (tagů za sekundu)")
+    p.add_argument("--entities", type=int, default=10000)
+    p.add_argument("--lines", type=int, default=100000)
+    p.add_argument("--repeat", type=int, default=3)
+    p = sub.add_parser("prescreen", help="Anonymizace s pre-screeningem odstavců a bez něj")
+    p.add_argument("docx", nargs="*", default=[str(SAMPLE)])
+    p = sub.add_parser("cascade", help="Skórování kandidátů na jméno: kaskáda vs. vyhodnocení všech příznaků")
+    p.add_argument("--paragraphs", type=int, default=2000)
+    p.add_argument("--repeat", type=int, default=3)
+    p = sub.add_parser("synthetic", help="Propustnost a recall na vygenerované smlouvě (generate_contracts.py)")
+    p.add_argument("--persons", type=int, default=1000)
+    p.add_argument("--paragraphs", type=int, default=10000)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--jobs", type=int, default=1)
+    p = sub.add_parser("bounded", help="Špička paměti a výstupy: běh v paměti vs. --max-memory (text a mapy na disku)")
+    p.add_argument("--persons", type=int, default=1000)
+    p.add_argument("--paragraphs", type=int, default=5000)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--max-memory", type=int, default=256, help="Strop paměti v MB")
+    p = sub.add_parser("extract", help="Detekce osob: jeden průchod vs. úseky s překryvem (sekvenčně i v poolu)")
+    p.add_argument("--persons", type=int, default=2000)
+    p.add_argument("--paragraphs", type=int, default=20000)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--chunk", type=int, default=anon.EXTRACT_CHUNK, help="Velikost jádra úseku (znaky)")
+    p.add_argument("--overlap", type=int, default=anon.EXTRACT_OVERLAP)
+    p.add_argument("--jobs", type=int, default=4)
+    p = sub.add_parser("shadow", help="Tvary jmen: počet vzorů a čas průchodu (ASCII kopie vs. stínový text)")
+    p.add_argument("docx", nargs="*", default=[str(SAMPLE)])
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--paragraphs", type=int, default=200, help="Kolik neprázdných odstavců projít")
+    p = sub.add_parser("plan", help="Plán běhu: všechny detektory vs. jen vybrané kategorie (např. pro logy)")
+    p.add_argument("--categories", default="EMAIL,PHONE", help="Zapnuté kategorie oddělené čárkou")
+    p.add_argument("--persons", type=int, default=300)
+    p.add_argument("--paragraphs", type=int, default=2000)
+    p.add_argument("--seed", type=int, default=1)
+    p = sub.add_parser("validators", help="Číselná příloha: rozhodování podle kontextu vs. kontrolní součty")
+    p.add_argument("--rows", type=int, default=20000)
+    p.add_argument("--invalid", type=float, default=0.1, help="Podíl čísel s překlepem")
+    p.add_argument("--codes", type=float, default=0.1, help="Podíl řádků s kódem šarže ve tvaru IBAN")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--repeat", type=int, default=3)
+    p = sub.add_parser("xlsx", help="Tabulka nájemníků: buňka jako odstavec vs. typované sloupce (řádků za minutu)")
+    p.add_argument("--rows", type=int, default=100000)
+    p.add_argument("--baseline-rows", type=int, default=1000, help="Vzorek řádků pro postup po buňkách")
+    p.add_argument("--seed", type=int, default=1)
+    p = sub.add_parser("filter", help="Filtr po řádcích: propustnost logu a NDJSON (MB/s)")
+    p.add_argument("--lines", type=int, default=200000)
+    p.add_argument("--seed", type=int, default=1)
+    p = sub.add_parser("mail", help="Schránka mbox: zpráv za sekundu sekvenčně a v process poolu")
+    p.add_argument("--messages", type=int, default=2000)
+    p.add_argument("--jobs", type=int, default=4)
+    p.add_argument("--shard-size", type=int, default=200)
+    p.add_argument("--seed", type=int, default=1)
+    p = sub.add_parser("sqlite", help="Tabulka zákazníků v SQLite: řádků za sekundu podle velikosti dávky")
+    p.add_argument("--rows", type=int, default=200000)
+    p.add_argument("--batch", type=int, default=5000, help="Řádků na dávku (jedna transakce)")
+    p.add_argument("--baseline-batch", type=int, default=1, help="Srovnávací velikost dávky")
+    p.add_argument("--rss-rows", type=int, default=1000000,
+                   help="Řádků pro srovnání paměti v paměti / --max-memory (0 = vynechat)")
+    p.add_argument("--max-memory", type=int, default=256, help="Strop paměti v MB")
+    p.add_argument("--seed", type=int, default=1)
+    p = sub.add_parser("batch", help="Dávka smluv ze šablon: bez cache odstavců a se sdílenou cache")
+    p.add_argument("--docs", type=int, default=50)
+    p.add_argument("--persons", type=int, default=4)
+    p.add_argument("--paragraphs", type=int, default=120)
+    p.add_argument("--seed", type=int, default=1)
+    p = sub.add_parser("templates", help="Dávka smluv ze šablon: plný průchod vs. naučené šablony (jen proměnné sloty)")
+    p.add_argument("--learn", type=int, default=10, help="Dokumentů pro naučení šablon")
+    p.add_argument("--docs", type=int, default=30, help="Měřených dokumentů")
+    p.add_argument("--persons", type=int, default=4)
+    p.add_argument("--paragraphs", type=int, default=120)
+    p.add_argument("--seed", type=int, default=1)
+    p = sub.add_parser("leakscan", help="END-SCAN výstupu: str.find po hodnotách mapy vs. jeden automat (podíl na čase)")
+    p.add_argument("docs", nargs="*", help="Jen vybrané vzorové smlouvy (např. smlouva3)")
+    p.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+    BENCHMARKS[args.bench](args)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Regresní a výkonnostní kontrola anonymizéru proti zlatým výstupům (offline).
+Pro každou smlouva*.docx porovná anonymizovaný text a _map.json s adresářem
+golden/ a zároveň změří čas a špičku paměti (tracemalloc). Časy v golden/perf.json
+jsou násobky jednotky stroje (calibrate), ne sekundy - reference platí i na jiném
+stroji a kontrola porovnává poměr.
+
+Použití:
+  python regression.py              # kontrola, nenulový exit při rozdílu/zpomalení
+  python regression.py --update     # přepíše zlaté výstupy i referenční časy
+  python regression.py smlouva3     # jen vybrané dokumenty
+  python regression.py --no-memory  # bez trasovaného běhu (jen výstupy a čas)
+  python regression.py --jobs 3     # paralelní shardy odstavců proti stejným zlatým výstupům
+
+Kromě smluv se kontroluje i režim --filter: řádky golden/filter.in.txt
+(tituly před jmény, NDJSON) proti golden/filter.anon.txt a filter.map.json.
+"""
+
+import re, sys, json, time, difflib, argparse, tempfile, tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+import Claude_code_V2_1 as anon
+from docx import Document
+
+ROOT = Path(__file__).parent
+GOLDEN = ROOT / "golden"
+PERF = GOLDEN / "perf.json"
+STREAM_INPUT = GOLDEN / "filter.in.txt"
+
+def calibrate(repeat: int = 5) -> float:
+    """
+    Jednotka času tohoto stroje (s): nejkratší z několika běhů pevné úlohy v čistém
+    Pythonu (regex, slovník, řetězce - bez kódu anonymizéru, aby se jeho zrychlení
+    nevyrušilo). Měří se procesorový čas, stejně jako u dokumentů: zátěž jiných
+    procesů na sdíleném stroji ho neprodlužuje.
+    """
+    text = ' '.join(f'Jan Novák {i} bytem Praha {i % 97}, tel. 603 {i:06d}' for i in range(20000))
+    words = re.compile(r'\b(\w+)\s+(\w+)\b')
+    best = None
+    for _ in range(repeat):
+        t = time.process_time()
+        counts = {}
+        for m in words.finditer(text):
+            key = m.group(1).lower()
+            counts[key] = counts.get(key, 0) + len(m.group(2))
+        sorted(counts.items())
+        dt = time.process_time() - t
+        best = dt if best is None else min(best, dt)
+    return best
+
+def samples(names=None):
+    """Vzorové smlouvy v kořeni repozitáře (případně jen vybrané podle jména)."""
+    docs = sorted(ROOT.glob("smlouva*.docx"))
+    if names:
+        wanted = {Path(n).stem for n in names}
+        docs = [d for d in docs if d.stem in wanted]
+    return docs
+
+def stream_selected(names=None) -> bool:
+    """Kontrola režimu --filter běží bez výběru dokumentů nebo s názvem 'filter'."""
+    return STREAM_INPUT.exists() and (not names or 'filter' in {Path(n).stem for n in names})
+
+def run_stream(tmp: Path):
+    """Řádky STREAM_INPUT přes anonymize_stream (jako --filter s polem msg a user.name); vrací (text, mapa JSON)."""
+    import io
+    out, jmap = io.StringIO(), tmp / "filter_map.json"
+    with open(STREAM_INPUT, encoding='utf-8', newline='') as lines:
+        anon.Anonymizer(verbose=False).anonymize_stream(lines, out, str(jmap), fields=('msg', 'user.name'))
+    return out.getvalue(), jmap.read_text(encoding='utf-8')
+
+def run_one(path: Path, tmp: Path, memory: bool = True, jobs: int = 1, shard_size: int = 200):
+    """
+    Anonymizuje dokument; vrací (text, mapa JSON, procesorový čas s, špička paměti B nebo None).
+    Čas se měří bez tracemallocu (ten běh několikanásobně zpomalí), špička paměti
+    ve druhém, trasovaném běhu. S jobs > 1 jdou odstavce po shardech do process poolu
+    (čas workerů se pak nezapočítá).
+    """
+    out, jmap, tmap = tmp / "out.docx", tmp / "map.json", tmp / "map.txt"
+    t = time.process_time()
+    anon.Anonymizer().anonymize_docx(str(path), str(out), str(jmap), str(tmap), jobs=jobs, shard_size=shard_size)
+    dt = time.process_time() - t
+    text = '\n'.join(anon.get_text(p) for p in anon.iter_paragraphs(Document(str(out))))
+    peak = None
+    if memory:
+        tracemalloc.start()
+        anon.Anonymizer().anonymize_docx(str(path), str(tmp / "mem.docx"), str(tmp / "mem.json"), str(tmp / "mem.txt"))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return text, jmap.read_text(encoding='utf-8'), dt, peak
+
+def first_diff(expected: str, actual: str, context: int = 3) -> str:
+    """Prvních pár řádků unified diffu (aby výpis zůstal čitelný)."""
+    lines = list(difflib.unified_diff(expected.splitlines(), actual.splitlines(),
+                                      'golden', 'current', lineterm='', n=context))
+    return '\n'.join(lines[:40]) + ('\n...' if len(lines) > 40 else '')
+
+def check(args) -> int:
+    perf = json.loads(PERF.read_text(encoding='utf-8')) if PERF.exists() else {}
+    unit = calibrate()
+    print(f"Jednotka stroje: {unit * 1000:.1f} ms")
+    failures, total_t, total_ref = [], 0.0, 0.0
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        for doc in samples(args.docs):
+            text, jmap, dt, peak = run_one(doc, tmp, memory=args.memory and args.jobs <= 1, jobs=args.jobs,
+                                           shard_size=args.shard_size)
+            problems = []
+            for suffix, actual in (('anon.txt', text), ('map.json', jmap)):
+                golden = GOLDEN / f"{doc.stem}.{suffix}"
+                if not golden.exists():
+                    problems.append(f"chybí {golden.name} (spusť --update)")
+                    continue
+                expected = golden.read_text(encoding='utf-8')
+                if expected != actual:
+                    problems.append(f"{suffix} se liší:\n{first_diff(expected, actual)}")
+            # paralelní běh se porovnává jen výstupy - reference časů je sekvenční
+            ref = perf.get(doc.stem) if args.jobs <= 1 else None
+            note = ''
+            if ref:
+                total_t += dt
+                expected = ref['relative'] * unit
+                total_ref += expected
+                note = f" (ref {expected:.2f} s = {ref['relative']:.1f} j., {ref['peak_mb']:.1f} MB)"
+                # pod prahem min_seconds je měření jen šum - hlídá se až součet
+                if dt > expected * (1 + args.tolerance) and dt > args.min_seconds:
+                    problems.append(f"zpomalení {dt:.2f} s vs. {expected:.2f} s")
+                if peak is not None and peak / 1e6 > ref['peak_mb'] * (1 + args.mem_tolerance):
+                    problems.append(f"paměť {peak / 1e6:.1f} MB vs. {ref['peak_mb']:.1f} MB")
+            status = 'OK ' if not problems else 'ERR'
+            mem = f"{peak / 1e6:7.1f} MB" if peak is not None else "      - MB"
+            print(f"{status} {doc.stem:12s} {dt:6.2f} s {mem}{note}", flush=True)
+            for problem in problems:
+                print('    ' + problem.replace('\n', '\n    '))
+            if problems:
+                failures.append(doc.stem)
+        if stream_selected(args.docs):
+            problems = []
+            for suffix, actual in zip(('anon.txt', 'map.json'), run_stream(tmp)):
+                golden = GOLDEN / f"filter.{suffix}"
+                if not golden.exists():
+                    problems.append(f"chybí {golden.name} (spusť --update)")
+                elif golden.read_text(encoding='utf-8') != actual:
+                    problems.append(f"{suffix} se liší:\n{first_diff(golden.read_text(encoding='utf-8'), actual)}")
+            print(f"{'OK ' if not problems else 'ERR'} filter")
+            for problem in problems:
+                print('    ' + problem.replace('\n', '\n    '))
+            if problems:
+                failures.append('filter')
+    if total_ref:
+        ratio = total_t / total_ref
+        print(f"Celkem {total_t:.2f} s vs. ref {total_ref:.2f} s ({ratio:.2f}x)")
+        if ratio > 1 + args.tolerance and total_t > args.min_seconds:
+            failures.append('celkový čas')
+    if failures:
+        print("SELHALO: " + ', '.join(failures))
+        return 1
+    print("Vše odpovídá zlatým výstupům.")
+    return 0
+
+def update(args) -> int:
+    GOLDEN.mkdir(exist_ok=True)
+    perf = json.loads(PERF.read_text(encoding='utf-8')) if PERF.exists() else {}
+    unit = calibrate()
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        for doc in samples(args.docs):
+            text, jmap, dt, peak = run_one(doc, tmp)
+            (GOLDEN / f"{doc.stem}.anon.txt").write_text(text, encoding='utf-8')
+            (GOLDEN / f"{doc.stem}.map.json").write_text(jmap, encoding='utf-8')
+            perf[doc.stem] = {'relative': round(dt / unit, 2), 'peak_mb': round(peak / 1e6, 2)}
+            print(f"{doc.stem:12s} {dt:6.2f} s {peak / 1e6:7.1f} MB", flush=True)
+        if stream_selected(args.docs):
+            for suffix, actual in zip(('anon.txt', 'map.json'), run_stream(tmp)):
+                (GOLDEN / f"filter.{suffix}").write_text(actual, encoding='utf-8')
+            print("filter", flush=True)
+    PERF.write_text(json.dumps(dict(sorted(perf.items())), ensure_ascii=False, indent=2) + '\n', encoding='utf-8')
+    print(f"Zlaté výstupy zapsány do {GOLDEN}")
+    return 0
+
+def main():
+    ap = argparse.ArgumentParser(description="Regresní a výkonnostní kontrola proti golden/")
+    ap.add_argument("docs", nargs="*", help="Jen vybrané dokumenty (např. smlouva3, filter)")
+    ap.add_argument("--update", action="store_true", help="Přepsat zlaté výstupy a referenční časy")
+    ap.add_argument("--tolerance", type=float, default=0.5,
+                    help="Povolené zpomalení proti referenci (0.5 = o 50 %%)")
+    ap.add_argument("--mem-tolerance", type=float, default=0.25,
+                    help="Povolený nárůst špičky paměti (0.25 = o 25 %%)")
+    ap.add_argument("--no-memory", dest="memory", action="store_false",
+                    help="Přeskočit trasovaný běh pro měření paměti (zhruba 3x rychlejší kontrola)")
+    ap.add_argument("--min-seconds", type=float, default=1.0,
+                    help="Kratší běhy se jednotlivě na zpomalení nekontrolují")
+    ap.add_argument("--jobs", type=int, default=1,
+                    help="Dokumenty s paralelními shardy odstavců (výstupy musí být shodné, časy se nekontrolují)")
+    ap.add_argument("--shard-size", type=int, default=20,
+                    help="Odstavců v shardu s --jobs (malé shardy, aby i krátké smlouvy šly paralelně)")
+    args = ap.parse_args()
+    if args.jobs > 1 and args.update:
+        ap.error("--update zapisuje sekvenční reference, --jobs s ním nejde")
+    sys.exit(update(args) if args.update else check(args))
+
+if __name__ == "__main__":
+    main()